@@ -0,0 +1,380 @@
+"""读接口
+
+指数列表与详情、估值分位数查询、股债性价比、全目录筛选、仪表盘（含 SSE 推送）、组合和系统状态。
+仪表盘、指数列表与详情、股债性价比优先返回每日任务预热的响应（response_cache.py）。
+模块本身只依赖 Flask 与数据库模型，计算器、筛选器等在首次请求时才创建，
+只读进程（read_app.py）只注册本蓝图，不会导入 akshare 和定时任务。
+"""
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from models import (db, Index, IndexHistory, CalculatedMetrics, IndexPercentile, StockBondRatio, SystemConfig, Portfolio,
+                    latest_index_rows)
+from financial_planner import FinancialRefreshPlanner
+from history_gaps import scan_history_gaps, plan_repairs, public_gap
+from dashboard import build_dashboard, dashboard_events
+from portfolio import list_portfolios, portfolio_detail
+from response_cache import cached_response
+from services import get_services
+from datetime import datetime, timedelta
+from sqlalchemy import func
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+read_api = Blueprint('read_api', __name__, url_prefix='/api')
+
+
+@read_api.route('/health', methods=['GET'])
+def health_check():
+    """健康检查"""
+    return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()})
+
+
+@read_api.route('/indices', methods=['GET'])
+@cached_response
+def get_indices():
+    """获取所有指数列表"""
+    try:
+        is_favorite = request.args.get('is_favorite')
+        search = request.args.get('search', '')
+        
+        query = Index.query
+        
+        if is_favorite is not None:
+            is_fav = is_favorite.lower() == 'true'
+            query = query.filter_by(is_favorite=is_fav)
+        
+        if search:
+            query = query.filter(
+                (Index.name.contains(search)) | (Index.code.contains(search))
+            )
+        
+        indices = query.order_by(Index.code).all()
+        
+        # 最新估值数据与最新计算指标各一次查询（全目录预热时避免逐指数查询）
+        index_ids = None if is_favorite is None and not search else [index.id for index in indices]
+        histories = latest_index_rows(IndexHistory, index_ids)
+        metrics = latest_index_rows(CalculatedMetrics, index_ids)
+        
+        result = []
+        for index in indices:
+            latest_history = histories.get(index.id)
+            latest_metrics = metrics.get(index.id)
+            data = index.to_dict()
+            
+            if latest_history:
+                data['latest_date'] = latest_history.date.strftime('%Y-%m-%d')
+                data['pe_ttm'] = latest_history.pe_ttm
+                data['pb'] = latest_history.pb
+                data['close'] = latest_history.close
+            
+            if latest_metrics:
+                data['metrics'] = latest_metrics.to_dict()
+            
+            result.append(data)
+        
+        return jsonify({
+            'success': True,
+            'data': result,
+            'total': len(result)
+        })
+        
+    except Exception as e:
+        logger.error(f"获取指数列表失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@read_api.route('/indices/<int:index_id>', methods=['GET'])
+@cached_response
+def get_index_detail(index_id):
+    """获取指数详情"""
+    try:
+        index = Index.query.get(index_id)
+        if not index:
+            return jsonify({'success': False, 'error': '指数不存在'}), 404
+        
+        # 获取历史数据
+        days = int(request.args.get('days', 365))
+        start_date = datetime.now().date() - timedelta(days=days)
+        
+        history = IndexHistory.query.filter(
+            IndexHistory.index_id == index_id,
+            IndexHistory.date >= start_date
+        ).order_by(IndexHistory.date.asc()).all()
+        
+        # 获取计算指标历史
+        metrics_history = CalculatedMetrics.query.filter(
+            CalculatedMetrics.index_id == index_id,
+            CalculatedMetrics.date >= start_date
+        ).order_by(CalculatedMetrics.date.asc()).all()
+        
+        # 最新一期多窗口分位数
+        percentiles = {}
+        latest_percentile_date = db.session.query(func.max(IndexPercentile.date)).filter(
+            IndexPercentile.index_id == index_id
+        ).scalar()
+        if latest_percentile_date:
+            for record in IndexPercentile.query.filter_by(index_id=index_id, date=latest_percentile_date).all():
+                percentiles.setdefault(record.metric, {})[record.lookback] = record.percentile
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'index': index.to_dict(),
+                'history': [h.to_dict() for h in history],
+                'metrics': [m.to_dict() for m in metrics_history],
+                'percentiles': percentiles
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"获取指数详情失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@read_api.route('/indices/<int:index_id>/percentile', methods=['GET'])
+def get_index_percentile(index_id):
+    """查询假设估值在近10年历史中的分位数"""
+    try:
+        pe = request.args.get('pe', type=float)
+        pb = request.args.get('pb', type=float)
+        if pe is None and pb is None:
+            return jsonify({'success': False, 'error': '请提供 pe 或 pb'}), 400
+        
+        result = get_services().calculator.lookup_percentiles([{'index_id': index_id, 'pe': pe, 'pb': pb}])[0]
+        if result is None:
+            return jsonify({'success': False, 'error': '指数不存在或没有历史数据'}), 404
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+        
+    except Exception as e:
+        logger.error(f"查询估值分位数失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@read_api.route('/indices/percentile', methods=['POST'])
+def batch_index_percentile():
+    """批量查询假设估值在近10年历史中的分位数"""
+    try:
+        data = request.get_json() or {}
+        items = data.get('items') or []
+        if not items or any('index_id' not in item for item in items):
+            return jsonify({'success': False, 'error': '请提供 items，且每项包含 index_id'}), 400
+        
+        queries = [
+            {
+                'index_id': int(item['index_id']),
+                'pe': float(item['pe']) if item.get('pe') is not None else None,
+                'pb': float(item['pb']) if item.get('pb') is not None else None
+            }
+            for item in items
+        ]
+        
+        return jsonify({
+            'success': True,
+            'data': get_services().calculator.lookup_percentiles(queries)
+        })
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'参数错误: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"批量查询估值分位数失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@read_api.route('/stock-bond-ratio', methods=['GET'])
+@cached_response
+def get_stock_bond_ratio():
+    """获取股债性价比数据"""
+    try:
+        days = int(request.args.get('days', 3650))
+        start_date = datetime.now().date() - timedelta(days=days)
+        
+        ratios = StockBondRatio.query.filter(
+            StockBondRatio.date >= start_date
+        ).order_by(StockBondRatio.date.asc()).all()
+        
+        # 获取最新数据
+        latest = StockBondRatio.query.order_by(
+            StockBondRatio.date.desc()
+        ).first()
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'latest': latest.to_dict() if latest else None,
+                'history': [r.to_dict() for r in ratios]
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"获取股债性价比失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@read_api.route('/screener', methods=['GET'])
+def get_screener():
+    """全目录估值筛选（所有有历史行情的指数）"""
+    try:
+        args = request.args
+        is_favorite = args.get('is_favorite')
+        
+        total, records = get_services().screener.query(
+            sort=args.get('sort', 'composite_score'),
+            order=args.get('order', 'desc'),
+            page=int(args.get('page', 1)),
+            page_size=min(int(args.get('page_size', 50)), 500),
+            search=args.get('search', ''),
+            is_favorite=is_favorite.lower() == 'true' if is_favorite is not None else None,
+            max_pe_percentile=args.get('max_pe_percentile', type=float),
+            max_pb_percentile=args.get('max_pb_percentile', type=float),
+            min_roe=args.get('min_roe', type=float),
+            percentile_range=args.get('percentile_range')
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': records,
+            'total': total
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"估值筛选失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@read_api.route('/dashboard', methods=['GET'])
+@cached_response
+def get_dashboard():
+    """获取仪表盘数据"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': build_dashboard()
+        })
+        
+    except Exception as e:
+        logger.error(f"获取仪表盘数据失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@read_api.route('/stream/dashboard', methods=['GET'])
+def stream_dashboard():
+    """仪表盘推送（Server-Sent Events）：连接时推送完整数据，数据变化时推送差异
+
+    每个连接占用一个线程，仅供开发环境使用，连接定时结束由浏览器重连；生产环境由 asgi_app.py 提供。
+    """
+    return Response(
+        stream_with_context(dashboard_events(last_event_id=request.headers.get('Last-Event-ID'))),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@read_api.route('/portfolios', methods=['GET'])
+def get_portfolios():
+    """获取组合列表"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': list_portfolios()
+        })
+        
+    except Exception as e:
+        logger.error(f"获取组合列表失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@read_api.route('/portfolios/<int:portfolio_id>', methods=['GET'])
+def get_portfolio(portfolio_id):
+    """获取组合详情（成员的共享指标与组合目标仓位）"""
+    try:
+        portfolio = db.session.get(Portfolio, portfolio_id)
+        if not portfolio:
+            return jsonify({'success': False, 'error': '组合不存在'}), 404
+        
+        return jsonify({
+            'success': True,
+            'data': portfolio_detail(portfolio)
+        })
+        
+    except Exception as e:
+        logger.error(f"获取组合详情失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@read_api.route('/data/financials/plan', methods=['GET'])
+def get_financials_plan():
+    """获取财务数据刷新计划（各报告期完整度与是否需要抓取）"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': FinancialRefreshPlanner().plan()
+        })
+        
+    except Exception as e:
+        logger.error(f"获取财务数据刷新计划失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@read_api.route('/data/gaps', methods=['GET'])
+def get_history_gaps():
+    """扫描指数行情缺口（与交易日相比缺失的日期区间）"""
+    try:
+        index_ids = request.args.getlist('index_id', type=int) or None
+        gaps = scan_history_gaps(index_ids)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'gaps': [public_gap(gap) for gap in gaps],
+                'missing_days': sum(gap['missing_days'] for gap in gaps),
+                'repair_requests': len(plan_repairs(gaps))
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"扫描行情缺口失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@read_api.route('/system/status', methods=['GET'])
+def get_system_status():
+    """获取系统状态"""
+    try:
+        # 检查是否已初始化
+        config = SystemConfig.query.filter_by(key='data_initialized').first()
+        is_initialized = config and config.value == 'true'
+        
+        # 统计数据
+        total_indices = Index.query.count()
+        favorite_indices = Index.query.filter_by(is_favorite=True).count()
+        
+        # 最新数据日期
+        latest_history = IndexHistory.query.order_by(
+            IndexHistory.date.desc()
+        ).first()
+        
+        latest_ratio = StockBondRatio.query.order_by(
+            StockBondRatio.date.desc()
+        ).first()
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'is_initialized': is_initialized,
+                'total_indices': total_indices,
+                'favorite_indices': favorite_indices,
+                'latest_data_date': latest_history.date.strftime('%Y-%m-%d') if latest_history else None,
+                'latest_ratio_date': latest_ratio.date.strftime('%Y-%m-%d') if latest_ratio else None
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"获取系统状态失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,381 @@
+"""写接口
+
+自选与权重设置、组合管理、数据刷新、行情缺口补抓、首次初始化、每日任务管道，
+以及计算量大的策略回测（不放在只读进程中，避免占满只读副本）。
+抓取器（akshare）、初始化器和任务管道在首次调用时才创建；只读进程不注册本蓝图。
+"""
+from flask import Blueprint, jsonify, request
+from models import db, Index, Portfolio, tracked_index_condition
+from data_version import bump_data_version
+from portfolio import create_portfolio, update_portfolio, delete_portfolio, portfolio_detail
+from history_gaps import repair_history_gaps, DEFAULT_MERGE_WITHIN
+from services import get_services
+from datetime import datetime, timedelta
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+write_api = Blueprint('write_api', __name__, url_prefix='/api')
+
+
+@write_api.route('/indices/<int:index_id>/favorite', methods=['POST'])
+def toggle_favorite(index_id):
+    """切换自选状态"""
+    try:
+        index = Index.query.get(index_id)
+        if not index:
+            return jsonify({'success': False, 'error': '指数不存在'}), 404
+        
+        data = request.get_json()
+        is_favorite = data.get('is_favorite', not index.is_favorite)
+        
+        index.is_favorite = is_favorite
+        db.session.commit()
+        bump_data_version()
+        
+        return jsonify({
+            'success': True,
+            'data': index.to_dict()
+        })
+        
+    except Exception as e:
+        logger.error(f"切换自选状态失败: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@write_api.route('/indices/<int:index_id>/weight', methods=['PUT'])
+def update_manual_weight(index_id):
+    """更新人为权重"""
+    try:
+        index = Index.query.get(index_id)
+        if not index:
+            return jsonify({'success': False, 'error': '指数不存在'}), 404
+        
+        data = request.get_json()
+        manual_weight = data.get('manual_weight')
+        
+        if manual_weight is None or manual_weight < 0:
+            return jsonify({'success': False, 'error': '权重必须大于等于0'}), 400
+        
+        index.manual_weight = manual_weight
+        db.session.commit()
+        
+        # 重新计算指标
+        calculator = get_services().calculator
+        calculator.calculate_index_metrics(index_id)
+        calculator.calculate_all_positions()
+        bump_data_version()
+        
+        return jsonify({
+            'success': True,
+            'data': index.to_dict()
+        })
+        
+    except Exception as e:
+        logger.error(f"更新权重失败: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@write_api.route('/portfolios', methods=['POST'])
+def add_portfolio():
+    """创建组合"""
+    try:
+        data = request.get_json() or {}
+        portfolio = create_portfolio(
+            get_services().calculator,
+            data.get('name'),
+            description=data.get('description'),
+            indices=data.get('indices')
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': portfolio_detail(portfolio)
+        })
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"创建组合失败: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@write_api.route('/portfolios/<int:portfolio_id>', methods=['PUT'])
+def edit_portfolio(portfolio_id):
+    """修改组合名称、说明或成员（indices 为完整成员列表，替换原有成员）"""
+    try:
+        portfolio = db.session.get(Portfolio, portfolio_id)
+        if not portfolio:
+            return jsonify({'success': False, 'error': '组合不存在'}), 404
+        
+        data = request.get_json() or {}
+        update_portfolio(
+            get_services().calculator,
+            portfolio,
+            name=data.get('name'),
+            description=data.get('description'),
+            indices=data.get('indices')
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': portfolio_detail(portfolio)
+        })
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"修改组合失败: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@write_api.route('/portfolios/<int:portfolio_id>', methods=['DELETE'])
+def remove_portfolio(portfolio_id):
+    """删除组合"""
+    try:
+        portfolio = db.session.get(Portfolio, portfolio_id)
+        if not portfolio:
+            return jsonify({'success': False, 'error': '组合不存在'}), 404
+        
+        delete_portfolio(portfolio)
+        
+        return jsonify({
+            'success': True,
+            'message': '组合已删除'
+        })
+        
+    except Exception as e:
+        logger.error(f"删除组合失败: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@write_api.route('/data/refresh', methods=['POST'])
+def refresh_data():
+    """手动刷新数据"""
+    try:
+        data = request.get_json() or {}
+        refresh_type = data.get('type', 'all')  # 'all', 'indices', 'financials', 'calculate'
+        
+        services = get_services()
+        
+        if refresh_type in ['all', 'indices']:
+            # 刷新指数数据
+            logger.info("开始刷新指数数据...")
+            tracked_indices = Index.query.filter(tracked_index_condition()).all()
+            csi_800 = Index.query.filter_by(code='000906').all()
+            history_indices = tracked_indices + csi_800
+            for index in history_indices:
+                # 获取最近10年数据
+                end_date = datetime.now().strftime('%Y%m%d')
+                start_date = (datetime.now() - timedelta(days=3650)).strftime('%Y%m%d')
+
+                services.fetcher.fetch_index_history(index.code, start_date, end_date)
+                services.fetcher.fetch_index_constituents(index.code)
+            # 刷新国债收益率数据
+            logger.info("开始刷新国债收益率...")
+            start_date = (datetime.now() - timedelta(days=3650)).strftime('%Y%m%d')
+            services.fetcher.fetch_bond_yield(start_date)
+        
+        if refresh_type in ['all', 'financials']:
+            # 刷新财务数据
+            logger.info("开始刷新财务数据...")
+            services.fetcher.fetch_latest_financials()
+        
+        if refresh_type in ['all', 'calculate']:
+            # 重新计算
+            logger.info("开始重新计算...")
+            services.calculator.run_daily_calculation()
+        
+        return jsonify({
+            'success': True,
+            'message': '数据刷新成功'
+        })
+        
+    except Exception as e:
+        logger.error(f"刷新数据失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@write_api.route('/data/gaps/repair', methods=['POST'])
+def repair_gaps():
+    """按缺口区间补抓指数行情（只抓缺失的日期区间，不重新下载完整历史）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        index_ids = data.get('index_ids')  # 默认自选、组合中的指数与中证800
+        merge_within = int(data.get('merge_within', DEFAULT_MERGE_WITHIN))
+        if index_ids is not None and not (isinstance(index_ids, list) and all(isinstance(i, int) for i in index_ids)):
+            raise ValueError('index_ids 必须为整数列表')
+        if merge_within < 0:
+            raise ValueError('merge_within 必须大于等于0')
+        
+        result = repair_history_gaps(get_services().fetcher, index_ids, merge_within)
+        if result is None:
+            return jsonify({'success': False, 'error': '补抓行情缺口失败'}), 500
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"补抓行情缺口失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@write_api.route('/data/init', methods=['POST'])
+def init_data():
+    """初始化数据（首次运行；已初始化但仍有未完成的条目时继续补齐）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        full_catalog = bool(data.get('full_catalog', False))
+        initializer = get_services().initializer
+        
+        # 已初始化且没有可续传的条目
+        if initializer.is_initialized() and not initializer.resumable(full_catalog):
+            return jsonify({
+                'success': False,
+                'error': '数据已初始化，请使用刷新接口'
+            }), 400
+        
+        logger.info("开始初始化数据（已完成的条目将跳过）...")
+        progress = initializer.run(full_catalog=full_catalog)
+        
+        if not progress['completed']:
+            return jsonify({
+                'success': False,
+                'error': '数据初始化未全部完成，请再次调用继续',
+                'data': progress
+            }), 500
+        
+        return jsonify({
+            'success': True,
+            'message': '数据初始化成功',
+            'data': progress
+        })
+        
+    except Exception as e:
+        logger.error(f"初始化数据失败: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@write_api.route('/data/init/status', methods=['GET'])
+def get_init_status():
+    """获取初始化进度"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': get_services().initializer.progress()
+        })
+        
+    except Exception as e:
+        logger.error(f"获取初始化进度失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@write_api.route('/pipeline/status', methods=['GET'])
+def get_pipeline_status():
+    """获取每日任务各阶段状态"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': get_services().pipeline.status()
+        })
+        
+    except Exception as e:
+        logger.error(f"获取任务状态失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@write_api.route('/pipeline/run', methods=['POST'])
+def run_pipeline():
+    """执行每日任务管道（可只重跑指定阶段）"""
+    try:
+        data = request.get_json() or {}
+        stages = data.get('stages')  # 如 ["financials"]，为空则执行全部阶段
+        force = bool(data.get('force', False))
+        pipeline = get_services().pipeline
+        
+        if stages:
+            unknown = [name for name in stages if name not in pipeline.stages]
+            if unknown:
+                return jsonify({'success': False, 'error': f"未知阶段: {', '.join(unknown)}"}), 400
+        
+        results = pipeline.run(only=stages, force=force)
+        
+        return jsonify({
+            'success': all(status != 'failed' for status in results.values()),
+            'data': results
+        })
+        
+    except Exception as e:
+        logger.error(f"执行任务管道失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@write_api.route('/backtest', methods=['POST'])
+def run_strategy_backtest():
+    """策略回测（默认回测全部自选指数）"""
+    try:
+        data = request.get_json() or {}
+        if not data.get('start_date'):
+            return jsonify({'success': False, 'error': '请提供 start_date'}), 400
+        
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
+        end_date = (datetime.strptime(data['end_date'], '%Y-%m-%d').date()
+                    if data.get('end_date') else datetime.now().date())
+        
+        if data.get('index_ids'):
+            index_ids = [int(i) for i in data['index_ids']]
+        else:
+            index_ids = [index.id for index in Index.query.filter_by(is_favorite=True).order_by(Index.code).all()]
+        
+        # 回测依赖 pandas，首次调用时才导入
+        from backtest import prepare_backtest_data, run_backtest, MAX_BACKTEST_DAYS, MAX_BACKTEST_INDICES
+        
+        if end_date < start_date:
+            raise ValueError('end_date 早于 start_date')
+        if (end_date - start_date).days > MAX_BACKTEST_DAYS:
+            raise ValueError(f'回测区间不能超过 {MAX_BACKTEST_DAYS} 天')
+        if len(index_ids) > MAX_BACKTEST_INDICES:
+            raise ValueError(f'回测指数不能超过 {MAX_BACKTEST_INDICES} 个')
+        
+        ranges = data.get('percentile_ranges')
+        result = run_backtest(
+            prepare_backtest_data(index_ids, start_date, end_date),
+            percentile_ranges=[tuple(r) for r in ranges] if ranges else None,
+            roe_anchor=data.get('roe_anchor'),
+            roe_slope=data.get('roe_slope'),
+            rebalance=data.get('rebalance', 'daily'),
+            use_stock_bond=bool(data.get('use_stock_bond', False)),
+            cost_bps=float(data.get('cost_bps', 0))
+        )
+        
+        codes = result['codes']
+        return jsonify({
+            'success': True,
+            'data': {
+                'summary': result['summary'],
+                'nav': [
+                    {'date': datetime.fromordinal(int(d)).strftime('%Y-%m-%d'), 'nav': float(v)}
+                    for d, v in zip(result['dates'], result['nav'])
+                ],
+                'weights': dict(zip(codes, result['weights'][-1].tolist()))
+            }
+        })
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'参数错误: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"策略回测失败: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,53 @@
+"""Flask 应用工厂
+
+create_app() 注册读接口蓝图，非只读模式再注册写接口蓝图。
+数据库地址可通过环境变量 DATABASE_URL 指定，默认为 backend/invest.db。
+"""
+from flask import Flask
+from flask_cors import CORS
+from models import db
+from services import Services, EXTENSION_KEY
+from profiling import init_profiling
+import os
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_DATABASE_URL = f'sqlite:///{os.path.join(basedir, "invest.db")}'
+
+
+def create_app(read_only=False):
+    """创建 Flask 应用
+    
+    Args:
+        read_only: 只注册读接口（不导入抓取、初始化、定时任务相关模块）
+        
+    Returns:
+        Flask: 应用实例
+    """
+    app = Flask(__name__)
+    CORS(app)
+    
+    # 配置
+    database_url = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if database_url.startswith('sqlite'):
+        # 任务管道的并发阶段会同时写库，等待写锁而不是立即报 database is locked
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    
+    # 初始化数据库
+    db.init_app(app)
+    
+    # 共享服务对象（按需创建）
+    app.extensions[EXTENSION_KEY] = Services(app)
+    
+    from api_read import read_api
+    app.register_blueprint(read_api)
+    
+    if not read_only:
+        from api_write import write_api
+        app.register_blueprint(write_api)
+    
+    # 按需请求剖析（未开启 PROFILING_ENABLED 时不注册任何钩子）
+    init_profiling(app)
+    
+    return app
@@ -0,0 +1,377 @@
+"""异步只读 API 入口（ASGI）
+
+仪表盘与列表类读接口的异步实现：Starlette + SQLAlchemy asyncio（SQLite 使用 aiosqlite，
+PostgreSQL 使用 asyncpg）。与 Flask 读接口共用模型、to_dict 和查询语句，响应格式一致；
+等待数据库时不占用线程，慢查询（全目录指数列表、长区间指数详情）不会耗尽 worker。
+
+仪表盘推送由每个进程一个后台任务轮询数据版本号，版本号变化时查询一次并通知所有连接，
+连接数增加不会增加数据库查询，单进程可同时服务数百个仪表盘长连接。
+
+异步实现的接口:
+    GET /api/health
+    GET /api/indices
+    GET /api/indices/<id>
+    GET /api/stock-bond-ratio
+    GET /api/dashboard
+    GET /api/stream/dashboard
+    GET /api/system/status
+其余读接口（分位数查询、筛选、回测、组合等以计算为主）仍由 read_app.py 提供。
+
+用法:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5002 --workers 2
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from app_factory import DEFAULT_DATABASE_URL
+from models import (Index, IndexHistory, CalculatedMetrics, IndexPercentile, StockBondRatio,
+                    SystemConfig, latest_rows_select)
+from dashboard import POLL_INTERVAL, HEARTBEAT_INTERVAL, dashboard_payload, dashboard_delta
+from data_version import DATA_VERSION_KEY
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 同步驱动 -> 异步驱动
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+}
+
+
+def async_database_url(url):
+    """把 DATABASE_URL 转换为异步驱动的地址（已指定驱动的地址保持不变）"""
+    scheme, sep, rest = url.partition('://')
+    return f'{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}'
+
+
+def create_engine_from_env():
+    url = async_database_url(os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL))
+    connect_args = {'timeout': 30} if url.startswith('sqlite') else {}
+    return create_async_engine(url, connect_args=connect_args)
+
+
+def error_response(message, status_code=500):
+    return JSONResponse({'success': False, 'error': message}, status_code=status_code)
+
+
+async def fetch_data_version(session):
+    value = await session.scalar(select(SystemConfig.value).where(SystemConfig.key == DATA_VERSION_KEY))
+    return int(value) if value else 0
+
+
+async def load_dashboard(session):
+    """查询仪表盘数据（查询与 dashboard.build_dashboard 相同）"""
+    latest_ratio = await session.scalar(select(StockBondRatio).order_by(StockBondRatio.date.desc()).limit(1))
+    favorite_indices = (await session.scalars(select(Index).where(Index.is_favorite == True))).all()
+    favorite_ids = [index.id for index in favorite_indices]
+
+    metrics = {row.index_id: row for row in await session.scalars(latest_rows_select(CalculatedMetrics, favorite_ids))}
+    histories = {row.index_id: row for row in await session.scalars(latest_rows_select(IndexHistory, favorite_ids))}
+    return dashboard_payload(latest_ratio, favorite_indices, metrics, histories)
+
+
+class DashboardBroadcaster:
+    """进程内共享的仪表盘数据：一个后台任务轮询数据版本号，变化时查询一次并唤醒所有等待的连接"""
+
+    def __init__(self, sessionmaker, poll_interval=POLL_INTERVAL):
+        self.sessionmaker = sessionmaker
+        self.poll_interval = poll_interval
+        self.version = None
+        self.payload = None
+        self._changed = asyncio.Condition()
+        self._task = None
+
+    async def refresh(self):
+        """读取数据版本号，变化时重新查询仪表盘数据"""
+        async with self.sessionmaker() as session:
+            version = await fetch_data_version(session)
+            if version == self.version:
+                return
+            payload = await load_dashboard(session)
+
+        async with self._changed:
+            self.version, self.payload = version, payload
+            self._changed.notify_all()
+
+    async def current(self):
+        """当前版本号与仪表盘数据（尚未加载时立即加载）"""
+        if self.payload is None:
+            await self.refresh()
+        return self.version, self.payload
+
+    async def wait_for_change(self, version, timeout):
+        """等待版本号不同于 version，超时返回 False"""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.version != version), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    def start(self):
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _poll(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"刷新仪表盘数据失败: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+
+async def health_check(request):
+    """健康检查"""
+    return JSONResponse({'status': 'ok', 'timestamp': datetime.now().isoformat()})
+
+
+async def get_indices(request):
+    """获取所有指数列表（最新行情与最新计算指标各一次查询）"""
+    try:
+        is_favorite = request.query_params.get('is_favorite')
+        search = request.query_params.get('search', '')
+
+        query = select(Index)
+        if is_favorite is not None:
+            query = query.where(Index.is_favorite == (is_favorite.lower() == 'true'))
+        if search:
+            query = query.where(Index.name.contains(search) | Index.code.contains(search))
+
+        async with request.app.state.sessionmaker() as session:
+            indices = (await session.scalars(query.order_by(Index.code))).all()
+            index_ids = None if is_favorite is None and not search else [index.id for index in indices]
+            histories = {row.index_id: row for row in await session.scalars(latest_rows_select(IndexHistory, index_ids))}
+            metrics = {row.index_id: row for row in await session.scalars(latest_rows_select(CalculatedMetrics, index_ids))}
+
+        result = []
+        for index in indices:
+            latest_history = histories.get(index.id)
+            latest_metrics = metrics.get(index.id)
+            data = index.to_dict()
+
+            if latest_history:
+                data['latest_date'] = latest_history.date.strftime('%Y-%m-%d')
+                data['pe_ttm'] = latest_history.pe_ttm
+                data['pb'] = latest_history.pb
+                data['close'] = latest_history.close
+
+            if latest_metrics:
+                data['metrics'] = latest_metrics.to_dict()
+
+            result.append(data)
+
+        return JSONResponse({'success': True, 'data': result, 'total': len(result)})
+
+    except Exception as e:
+        logger.error(f"获取指数列表失败: {str(e)}")
+        return error_response(str(e))
+
+
+async def get_index_detail(request):
+    """获取指数详情"""
+    try:
+        index_id = request.path_params['index_id']
+        days = int(request.query_params.get('days', 365))
+        start_date = datetime.now().date() - timedelta(days=days)
+
+        async with request.app.state.sessionmaker() as session:
+            index = await session.get(Index, index_id)
+            if not index:
+                return error_response('指数不存在', 404)
+
+            history = (await session.scalars(select(IndexHistory).where(
+                IndexHistory.index_id == index_id, IndexHistory.date >= start_date
+            ).order_by(IndexHistory.date.asc()))).all()
+
+            metrics_history = (await session.scalars(select(CalculatedMetrics).where(
+                CalculatedMetrics.index_id == index_id, CalculatedMetrics.date >= start_date
+            ).order_by(CalculatedMetrics.date.asc()))).all()
+
+            # 最新一期多窗口分位数
+            percentiles = {}
+            latest_percentile_date = await session.scalar(
+                select(func.max(IndexPercentile.date)).where(IndexPercentile.index_id == index_id)
+            )
+            if latest_percentile_date:
+                for record in await session.scalars(select(IndexPercentile).where(
+                    IndexPercentile.index_id == index_id, IndexPercentile.date == latest_percentile_date
+                )):
+                    percentiles.setdefault(record.metric, {})[record.lookback] = record.percentile
+
+        return JSONResponse({
+            'success': True,
+            'data': {
+                'index': index.to_dict(),
+                'history': [h.to_dict() for h in history],
+                'metrics': [m.to_dict() for m in metrics_history],
+                'percentiles': percentiles
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"获取指数详情失败: {str(e)}")
+        return error_response(str(e))
+
+
+async def get_stock_bond_ratio(request):
+    """获取股债性价比数据"""
+    try:
+        days = int(request.query_params.get('days', 3650))
+        start_date = datetime.now().date() - timedelta(days=days)
+
+        async with request.app.state.sessionmaker() as session:
+            ratios = (await session.scalars(select(StockBondRatio).where(
+                StockBondRatio.date >= start_date
+            ).order_by(StockBondRatio.date.asc()))).all()
+            latest = await session.scalar(select(StockBondRatio).order_by(StockBondRatio.date.desc()).limit(1))
+
+        return JSONResponse({
+            'success': True,
+            'data': {
+                'latest': latest.to_dict() if latest else None,
+                'history': [r.to_dict() for r in ratios]
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"获取股债性价比失败: {str(e)}")
+        return error_response(str(e))
+
+
+async def get_dashboard(request):
+    """获取仪表盘数据（与推送共用进程内缓存，版本号不变时不再查询）"""
+    try:
+        broadcaster = request.app.state.broadcaster
+        async with request.app.state.sessionmaker() as session:
+            version = await fetch_data_version(session)
+        if version != broadcaster.version:
+            await broadcaster.refresh()
+
+        return JSONResponse({'success': True, 'data': broadcaster.payload})
+
+    except Exception as e:
+        logger.error(f"获取仪表盘数据失败: {str(e)}")
+        return error_response(str(e))
+
+
+def _event(name, version, data):
+    return f"event: {name}\nid: {version}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_dashboard(request):
+    """仪表盘推送（Server-Sent Events），事件格式与 Flask 读接口相同"""
+    broadcaster = request.app.state.broadcaster
+    heartbeat_interval = request.app.state.heartbeat_interval
+
+    async def events():
+        version, payload = await broadcaster.current()
+        yield _event('snapshot', version, payload)
+
+        while True:
+            if not await broadcaster.wait_for_change(version, heartbeat_interval):
+                yield ': keepalive\n\n'
+                continue
+
+            latest_version, latest = broadcaster.version, broadcaster.payload
+            delta = dashboard_delta(payload, latest)
+            version, payload = latest_version, latest
+            if delta is not None:
+                yield _event('delta', version, delta)
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def get_system_status(request):
+    """获取系统状态"""
+    try:
+        async with request.app.state.sessionmaker() as session:
+            config = await session.scalar(select(SystemConfig).where(SystemConfig.key == 'data_initialized'))
+            is_initialized = config and config.value == 'true'
+
+            total_indices = await session.scalar(select(func.count(Index.id)))
+            favorite_indices = await session.scalar(select(func.count(Index.id)).where(Index.is_favorite == True))
+
+            latest_history = await session.scalar(select(IndexHistory).order_by(IndexHistory.date.desc()).limit(1))
+            latest_ratio = await session.scalar(select(StockBondRatio).order_by(StockBondRatio.date.desc()).limit(1))
+
+        return JSONResponse({
+            'success': True,
+            'data': {
+                'is_initialized': is_initialized,
+                'total_indices': total_indices,
+                'favorite_indices': favorite_indices,
+                'latest_data_date': latest_history.date.strftime('%Y-%m-%d') if latest_history else None,
+                'latest_ratio_date': latest_ratio.date.strftime('%Y-%m-%d') if latest_ratio else None
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"获取系统状态失败: {str(e)}")
+        return error_response(str(e))
+
+
+routes = [
+    Route('/api/health', health_check),
+    Route('/api/indices', get_indices),
+    Route('/api/indices/{index_id:int}', get_index_detail),
+    Route('/api/stock-bond-ratio', get_stock_bond_ratio),
+    Route('/api/dashboard', get_dashboard),
+    Route('/api/stream/dashboard', stream_dashboard),
+    Route('/api/system/status', get_system_status),
+]
+
+
+def create_asgi_app(engine=None, poll_interval=POLL_INTERVAL, heartbeat_interval=HEARTBEAT_INTERVAL):
+    """创建异步只读应用
+
+    Args:
+        engine: 异步数据库引擎，默认按 DATABASE_URL 创建
+        poll_interval: 数据版本号轮询间隔（秒）
+        heartbeat_interval: 推送心跳间隔（秒）
+
+    Returns:
+        Starlette: ASGI 应用
+    """
+    engine = engine or create_engine_from_env()
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        app.state.sessionmaker = sessionmaker
+        app.state.heartbeat_interval = heartbeat_interval
+        app.state.broadcaster = DashboardBroadcaster(sessionmaker, poll_interval)
+        app.state.broadcaster.start()
+        yield
+        await app.state.broadcaster.stop()
+        await engine.dispose()
+
+    return Starlette(
+        routes=routes,
+        middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['GET'])],
+        lifespan=lifespan
+    )
+
+
+app = create_asgi_app()
@@ -0,0 +1,469 @@
+"""指数估值策略回测
+
+在历史数据上逐日重放 Calculator 的策略：
+近10年估值分位数 → 分位区间与初始分数（PERCENTILE_RANGES）→ ROE权重 × 人为权重 →
+按综合分数占比分配目标仓位（calculate_all_positions），
+以及分位区间突破产生的加仓/减仓信号（calculate_index_metrics / _parse_range 口径），
+统计收益、换手率和回撤。
+
+数据准备（prepare_backtest_data）与策略参数无关，只需做一次；
+策略回放（run_backtest）对全部日期、全部指数做 NumPy 向量化计算，
+调整 PERCENTILE_RANGES、ROE参数后重新回放只需毫秒级，可用于参数扫描。
+
+用法:
+    python backtest.py --codes 000300 000905 --start 2016-01-01 --end 2025-12-31
+"""
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from datetime import date, datetime, timedelta
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy import select, func
+from models import (db, Index, IndexHistory, IndexConstituent, StockTTMRoe,
+                    BondYield, StockBondRatio)
+from calculator import Calculator
+from financial_planner import disclosure_deadline
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS_PER_YEAR = 252
+CSI800_CODE = '000906'
+
+# 滚动分位数每批计算的行数（控制临时矩阵内存）
+PERCENTILE_CHUNK_SIZE = 256
+
+REBALANCE_MODES = ('daily', 'signal')
+
+# /api/backtest 的回测区间与指数数量上限（命令行不受限制）
+MAX_BACKTEST_DAYS = 3660
+MAX_BACKTEST_INDICES = 50
+
+
+def rolling_percentile(dates, values, lookback_days=3650, eval_from=0):
+    """计算序列每一天当前值在回溯窗口内的分位数
+
+    口径与 Calculator.calculate_percentile 相同（以当天为计算日期）：
+    窗口为 [当天 - lookback_days, 当天]，当前值缺失或≤0时为空，
+    否则为窗口内有效值（>0）中不大于当前值的占比。
+    以 sliding_window_view 构造按行滑动的窗口视图（不复制数据），分批做向量化比较，
+    有效样本数由累计和相减得到。
+
+    Args:
+        dates: 日期ordinal数组（升序）
+        values: 指标值数组（缺失为 NaN）
+        lookback_days: 回溯天数
+        eval_from: 只计算该位置及之后的行，之前的行为 NaN
+
+    Returns:
+        ndarray: 分位数（0-100）
+    """
+    n = len(values)
+    result = np.full(n, np.nan)
+    if n == 0 or eval_from >= n:
+        return result
+
+    # 无效值（缺失或≤0）置为 NaN，与任何值比较均为 False
+    valid = values > 0
+    samples = np.where(valid, values, np.nan)
+    valid_before = np.r_[0, np.cumsum(valid)]
+
+    starts = np.searchsorted(dates, dates - lookback_days, side='left')
+    width = int((np.arange(n) - starts).max()) + 1
+    padded = np.concatenate([np.full(width - 1, np.nan), samples])
+    windows = sliding_window_view(padded, width)  # 第 i 行为 samples[i-width+1 : i+1]
+
+    for chunk_start in range(eval_from, n, PERCENTILE_CHUNK_SIZE):
+        rows = np.arange(chunk_start, min(chunk_start + PERCENTILE_CHUNK_SIZE, n))
+        window = windows[rows]
+        current = samples[rows]
+
+        # 整行计数后，减去行首超出回溯天数的部分
+        not_above_count = np.count_nonzero(window <= current[:, None], axis=1)
+        excluded = starts[rows] - rows + width - 1
+        head = int(excluded.max())
+        if head > 0:
+            outside = np.arange(head)[None, :] < excluded[:, None]
+            not_above_count -= np.count_nonzero((window[:, :head] <= current[:, None]) & outside, axis=1)
+        valid_count = valid_before[rows + 1] - valid_before[starts[rows]]
+
+        ok = valid[rows] & (valid_count > 0)
+        result[rows[ok]] = not_above_count[ok] / valid_count[ok] * 100
+
+    return result
+
+
+def _align(source_dates, source_values, target_dates):
+    """as-of 对齐：取不晚于目标日期的最近一个值，之前没有数据时为 NaN"""
+    positions = np.searchsorted(source_dates, target_dates, side='right') - 1
+    aligned = np.full(len(target_dates), np.nan)
+    has_value = positions >= 0
+    if len(source_values):
+        aligned[has_value] = source_values[positions[has_value]]
+    return aligned
+
+
+def _weighted_roe_series(index_ids, grid):
+    """各指数加权ROE时间序列 [日期数, 指数数]
+
+    与 calculate_index_weighted_roe 口径相同（最新成份股权重 × 各股滚动ROE），
+    每个报告期的数据从法定披露截止日起才可用，避免使用未来数据。
+    """
+    result = np.full((len(grid), len(index_ids)), np.nan)
+
+    latest = db.session.query(
+        IndexConstituent.index_id,
+        func.max(IndexConstituent.date).label('date')
+    ).filter(IndexConstituent.index_id.in_(index_ids)).group_by(IndexConstituent.index_id).subquery()
+    constituents = pd.DataFrame(
+        db.session.query(
+            IndexConstituent.index_id, IndexConstituent.stock_code, IndexConstituent.weight
+        ).join(
+            latest,
+            (latest.c.index_id == IndexConstituent.index_id) & (latest.c.date == IndexConstituent.date)
+        ).all(),
+        columns=['index_id', 'stock_code', 'weight']
+    )
+    if constituents.empty:
+        return result
+
+    roe = pd.DataFrame(
+        db.session.query(StockTTMRoe.stock_code, StockTTMRoe.report_date, StockTTMRoe.roe).filter(
+            StockTTMRoe.stock_code.in_(constituents['stock_code'].unique().tolist()),
+            StockTTMRoe.roe.isnot(None)
+        ).all(),
+        columns=['stock_code', 'report_date', 'roe']
+    )
+    if roe.empty:
+        return result
+
+    merged = constituents.merge(roe, on='stock_code')
+    merged['weight'] = merged['weight'].fillna(0)
+    merged['weighted'] = merged['roe'] * merged['weight']
+    grouped = merged.groupby(['index_id', 'report_date'])[['weighted', 'weight']].sum().reset_index()
+    grouped = grouped[grouped['weight'] != 0]
+    grouped['available'] = [disclosure_deadline(d).toordinal() for d in grouped['report_date']]
+    grouped['roe'] = grouped['weighted'] / grouped['weight']
+
+    column = {index_id: i for i, index_id in enumerate(index_ids)}
+    for index_id, frame in grouped.sort_values('available').groupby('index_id'):
+        result[:, column[index_id]] = _align(
+            frame['available'].to_numpy(), frame['roe'].to_numpy(dtype=float), grid
+        )
+    return result
+
+
+def prepare_backtest_data(index_ids, start_date, end_date, lookback_days=3650):
+    """载入并预计算回测输入（与策略参数无关）
+
+    Args:
+        index_ids: 指数ID列表
+        start_date: 回测开始日期
+        end_date: 回测结束日期
+        lookback_days: 分位数回溯天数
+
+    Returns:
+        dict: dates（ordinal）、codes、names、close/pe_percentile/pb_percentile/weighted_roe
+              [日期数, 指数数]、manual_weight [指数数]、stock_allocation/bond_yield/benchmark [日期数]
+    """
+    indices = {
+        row.id: row for row in db.session.query(
+            Index.id, Index.code, Index.name, Index.manual_weight
+        ).filter(Index.id.in_(index_ids)).all()
+    }
+    index_ids = [index_id for index_id in index_ids if index_id in indices]
+    if not index_ids:
+        raise ValueError("没有可回测的指数")
+
+    load_from = start_date - timedelta(days=lookback_days)
+    stmt = select(
+        IndexHistory.index_id, IndexHistory.date, IndexHistory.close, IndexHistory.pe_ttm, IndexHistory.pb
+    ).where(
+        IndexHistory.index_id.in_(index_ids),
+        IndexHistory.date >= load_from,
+        IndexHistory.date <= end_date
+    ).order_by(IndexHistory.index_id, IndexHistory.date)
+    history = pd.DataFrame(
+        db.session.connection().execute(stmt).all(),
+        columns=['index_id', 'date', 'close', 'pe_ttm', 'pb']
+    )
+    if history.empty:
+        raise ValueError("回测区间内没有行情数据")
+
+    history['ordinal'] = [d.toordinal() for d in history['date']]
+    start, end = start_date.toordinal(), end_date.toordinal()
+    in_range = history['ordinal'].between(start, end)
+    grid = np.unique(history.loc[in_range, 'ordinal'].to_numpy())
+    if len(grid) < 2:
+        raise ValueError("回测区间内交易日不足")
+
+    shape = (len(grid), len(index_ids))
+    close = np.full(shape, np.nan)
+    pe_percentile = np.full(shape, np.nan)
+    pb_percentile = np.full(shape, np.nan)
+
+    groups = dict(tuple(history.groupby('index_id')))
+    for column, index_id in enumerate(index_ids):
+        frame = groups.get(index_id)
+        if frame is None:
+            continue
+        dates = frame['ordinal'].to_numpy(dtype=np.int64)
+        # 从回测首日前的最后一行开始计算，保证首日可以 as-of 对齐
+        eval_from = max(int(np.searchsorted(dates, start, side='left')) - 1, 0)
+
+        close[:, column] = _align(dates, frame['close'].to_numpy(dtype=float, na_value=np.nan), grid)
+        for metric, target in (('pe_ttm', pe_percentile), ('pb', pb_percentile)):
+            values = frame[metric].to_numpy(dtype=float, na_value=np.nan)
+            target[:, column] = _align(dates, rolling_percentile(dates, values, lookback_days, eval_from), grid)
+
+    # 股债性价比给出的股票配置比例、国债收益率（现金部分收益）、中证800基准
+    ratios = db.session.query(StockBondRatio.date, StockBondRatio.stock_allocation).filter(
+        StockBondRatio.date <= end_date
+    ).order_by(StockBondRatio.date).all()
+    bonds = db.session.query(BondYield.date, BondYield.yield_10y).filter(
+        BondYield.date <= end_date
+    ).order_by(BondYield.date).all()
+    benchmark = db.session.query(IndexHistory.date, IndexHistory.close).join(
+        Index, Index.id == IndexHistory.index_id
+    ).filter(
+        Index.code == CSI800_CODE,
+        IndexHistory.date <= end_date
+    ).order_by(IndexHistory.date).all()
+
+    def series(rows):
+        return _align(
+            np.array([r[0].toordinal() for r in rows], dtype=np.int64),
+            np.array([r[1] for r in rows], dtype=float),
+            grid
+        )
+
+    return {
+        'dates': grid,
+        'index_ids': index_ids,
+        'codes': [indices[i].code for i in index_ids],
+        'names': [indices[i].name for i in index_ids],
+        'close': close,
+        'pe_percentile': pe_percentile,
+        'pb_percentile': pb_percentile,
+        'weighted_roe': _weighted_roe_series(index_ids, grid),
+        'manual_weight': np.array([indices[i].manual_weight or 1.0 for i in index_ids], dtype=float),
+        'stock_allocation': series(ratios),
+        'bond_yield': series(bonds),
+        'benchmark': series(benchmark)
+    }
+
+
+def _last_true_index(mask, strict=False):
+    """每一行（日期）之前最近一次为 True 的位置，没有时为 -1
+
+    Args:
+        mask: 布尔数组，第一维为日期
+        strict: True 时不含当天
+    """
+    positions = np.where(mask, np.arange(len(mask)).reshape((-1,) + (1,) * (mask.ndim - 1)), -1)
+    last = np.maximum.accumulate(positions, axis=0)
+    if strict:
+        last = np.concatenate([np.full((1,) + last.shape[1:], -1), last[:-1]])
+    return last
+
+
+def _drifted_weights(target, growth, last):
+    """从最近一次调仓的目标仓位随价格漂移后的仓位（归一化），尚未调仓时为0"""
+    weights = np.zeros_like(target)
+    has = last >= 0
+    base = last[has]
+    drifted = target[base] * growth[has] / growth[base]
+    total = drifted.sum(axis=1, keepdims=True)
+    weights[has] = np.divide(drifted, total, out=np.zeros_like(drifted), where=total > 0)
+    return weights
+
+
+def run_backtest(data, percentile_ranges=None, roe_anchor=None, roe_slope=None,
+                 rebalance='daily', use_stock_bond=False, cost_bps=0.0):
+    """回放策略
+
+    每个交易日收盘后按当日数据计算综合分数和目标仓位，收盘价调仓，次日起按新仓位计算收益。
+
+    Args:
+        data: prepare_backtest_data 的返回值
+        percentile_ranges: 分位区间配置 [(下限, 上限, 初始分数)]，需按分位数升序且首尾相接，
+                           默认 Calculator.PERCENTILE_RANGES
+        roe_anchor: ROE权重为1时的ROE（%），默认 Calculator.ROE_ANCHOR
+        roe_slope: ROE每±1%的权重调整，默认 Calculator.ROE_SLOPE
+        rebalance: 'daily' 每日调至目标仓位；'signal' 仅在出现加仓/减仓信号的交易日调仓
+        use_stock_bond: 是否按股债性价比的股票配置比例控制总仓位（其余部分按10年国债收益率计息）
+        cost_bps: 单边交易成本（基点）
+
+    Returns:
+        dict: summary（统计指标）、dates、codes、nav、weights、turnover、signals
+    """
+    if rebalance not in REBALANCE_MODES:
+        raise ValueError(f"不支持的调仓方式: {rebalance}")
+
+    ranges = percentile_ranges or Calculator.PERCENTILE_RANGES
+    roe_anchor = Calculator.ROE_ANCHOR if roe_anchor is None else roe_anchor
+    roe_slope = Calculator.ROE_SLOPE if roe_slope is None else roe_slope
+
+    upper_bounds = np.array([max_p for _, max_p, _ in ranges[:-1]], dtype=float)
+    range_min = np.array([min_p for min_p, _, _ in ranges], dtype=float)
+    range_max = np.array([max_p for _, max_p, _ in ranges], dtype=float)
+    scores = np.array([score for _, _, score in ranges], dtype=float)
+
+    # 1. 分位区间与初始分数（PE分位数为主，缺失时使用PB）
+    main_percentile = np.where(np.isnan(data['pe_percentile']), data['pb_percentile'], data['pe_percentile'])
+    has_percentile = ~np.isnan(main_percentile)
+    bucket = np.searchsorted(upper_bounds, np.nan_to_num(main_percentile), side='right')
+    initial_score = np.where(has_percentile, scores[bucket], 0.0)
+
+    # 2. 综合分数 = 初始分数 × ROE权重 × 人为权重
+    roe = data['weighted_roe']
+    with np.errstate(invalid='ignore'):
+        roe_weight = np.where(roe > 0, np.maximum(0, 1.0 + (roe - roe_anchor) * roe_slope), 1.0)
+    manual_weight = np.where(data['manual_weight'] > 0, data['manual_weight'], 1.0)
+    composite_score = initial_score * roe_weight * manual_weight[None, :]
+
+    # 3. 目标仓位 = 综合分数占比（总分为0的交易日不调仓）
+    total_score = composite_score.sum(axis=1)
+    can_rebalance = total_score > 0
+    target = np.divide(composite_score, total_score[:, None],
+                       out=np.zeros_like(composite_score), where=can_rebalance[:, None])
+
+    # 4. 操作信号：与上一次有分位数的交易日的区间比较
+    previous = _last_true_index(has_percentile, strict=True)
+    has_previous = has_percentile & (previous >= 0)
+    columns = np.arange(main_percentile.shape[1])[None, :]
+    previous_bucket = bucket[np.maximum(previous, 0), columns]
+    previous_min = range_min[previous_bucket]
+    previous_max = range_max[previous_bucket]
+    with np.errstate(invalid='ignore'):
+        reduce_signal = has_previous & (main_percentile > previous_max)
+        add_signal = (has_previous & ~reduce_signal & (main_percentile < previous_min) &
+                      (main_percentile <= (previous_min + previous_max) / 2))
+
+    # 5. 调仓日
+    if rebalance == 'daily':
+        rebalance_day = can_rebalance.copy()
+    else:
+        first_day = np.zeros_like(can_rebalance)
+        if can_rebalance.any():
+            first_day[np.argmax(can_rebalance)] = True
+        rebalance_day = can_rebalance & (first_day | (add_signal | reduce_signal).any(axis=1))
+
+    # 6. 仓位随价格漂移，调仓日重置为目标仓位
+    close = data['close']
+    returns = np.zeros_like(close)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns[1:] = close[1:] / close[:-1] - 1
+    returns[~np.isfinite(returns)] = 0.0
+    growth = np.cumprod(1 + returns, axis=0)
+
+    last_rebalance = _last_true_index(rebalance_day)
+    weights = _drifted_weights(target, growth, last_rebalance)
+    pre_trade = _drifted_weights(target, growth, _last_true_index(rebalance_day, strict=True))
+
+    # 单边换手率（首次建仓不计入）
+    turnover = np.where(rebalance_day, np.abs(weights - pre_trade).sum(axis=1) / 2, 0.0)
+    if rebalance_day.any():
+        turnover[np.argmax(rebalance_day)] = 0.0
+
+    # 7. 组合收益
+    if use_stock_bond:
+        allocation = np.nan_to_num(data['stock_allocation'], nan=100.0) / 100
+    else:
+        allocation = np.ones(len(data['dates']))
+    exposure = np.where(last_rebalance >= 0, allocation[np.maximum(last_rebalance, 0)], 0.0)
+    cash_return = np.nan_to_num(data['bond_yield']) / 100 / TRADING_DAYS_PER_YEAR
+
+    daily_return = np.zeros(len(data['dates']))
+    daily_return[1:] = (
+        exposure[:-1] * (weights[:-1] * returns[1:]).sum(axis=1) +
+        (1 - exposure[:-1]) * cash_return[:-1]
+    )
+    daily_return -= turnover * 2 * exposure * cost_bps / 10000
+    nav = np.cumprod(1 + daily_return)
+
+    return {
+        'summary': _summarize(data, nav, daily_return, turnover, rebalance_day, add_signal, reduce_signal, exposure),
+        'dates': data['dates'],
+        'codes': data['codes'],
+        'nav': nav,
+        'weights': weights,
+        'turnover': turnover,
+        'signals': {'add': add_signal, 'reduce': reduce_signal}
+    }
+
+
+def _summarize(data, nav, daily_return, turnover, rebalance_day, add_signal, reduce_signal, exposure):
+    """回测统计指标"""
+    days = len(nav)
+    years = (days - 1) / TRADING_DAYS_PER_YEAR
+    drawdown = nav / np.maximum.accumulate(nav) - 1
+    trough = int(np.argmin(drawdown))
+    peak = int(np.argmax(nav[:trough + 1]))
+
+    benchmark = data['benchmark']
+    valid_benchmark = benchmark[~np.isnan(benchmark)]
+    benchmark_return = (
+        float(valid_benchmark[-1] / valid_benchmark[0] - 1) if len(valid_benchmark) > 1 else None
+    )
+
+    def to_str(ordinal):
+        return date.fromordinal(int(ordinal)).strftime('%Y-%m-%d')
+
+    return {
+        'start_date': to_str(data['dates'][0]),
+        'end_date': to_str(data['dates'][-1]),
+        'trading_days': days,
+        'total_return': float(nav[-1] - 1),
+        'annual_return': float(nav[-1] ** (1 / years) - 1) if years > 0 else None,
+        'annual_volatility': float(daily_return[1:].std() * np.sqrt(TRADING_DAYS_PER_YEAR)),
+        'max_drawdown': float(drawdown[trough]),
+        'max_drawdown_start': to_str(data['dates'][peak]),
+        'max_drawdown_end': to_str(data['dates'][trough]),
+        'annual_turnover': float(turnover.sum() / years) if years > 0 else None,
+        'rebalance_count': int(rebalance_day.sum()),
+        'add_signals': int(add_signal.sum()),
+        'reduce_signals': int(reduce_signal.sum()),
+        'average_exposure': float(exposure.mean()),
+        'benchmark_return': benchmark_return
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='指数估值策略回测')
+    parser.add_argument('--codes', nargs='+', help='指数代码，默认全部自选指数')
+    parser.add_argument('--start', required=True, help='开始日期 YYYY-MM-DD')
+    parser.add_argument('--end', default=None, help='结束日期 YYYY-MM-DD，默认今天')
+    parser.add_argument('--rebalance', choices=REBALANCE_MODES, default='daily', help='调仓方式')
+    parser.add_argument('--stock-bond', action='store_true', help='按股债性价比控制总仓位')
+    parser.add_argument('--cost-bps', type=float, default=0.0, help='单边交易成本（基点）')
+    parser.add_argument('--roe-anchor', type=float, default=None, help='ROE权重为1时的ROE（%%）')
+    parser.add_argument('--roe-slope', type=float, default=None, help='ROE每±1%%的权重调整')
+    args = parser.parse_args()
+
+    start_date = datetime.strptime(args.start, '%Y-%m-%d').date()
+    end_date = datetime.strptime(args.end, '%Y-%m-%d').date() if args.end else datetime.now().date()
+
+    from app import app
+    with app.app_context():
+        query = Index.query.filter(Index.code.in_(args.codes)) if args.codes else Index.query.filter_by(is_favorite=True)
+        index_ids = [index.id for index in query.order_by(Index.code).all()]
+
+        started = datetime.now()
+        data = prepare_backtest_data(index_ids, start_date, end_date)
+        prepared = datetime.now()
+        result = run_backtest(
+            data, roe_anchor=args.roe_anchor, roe_slope=args.roe_slope,
+            rebalance=args.rebalance, use_stock_bond=args.stock_bond, cost_bps=args.cost_bps
+        )
+        finished = datetime.now()
+
+    for key, value in result['summary'].items():
+        print(f'{key}: {value}')
+    print(f'数据准备耗时 {(prepared - started).total_seconds():.2f} 秒，'
+          f'回放耗时 {(finished - prepared).total_seconds() * 1000:.1f} 毫秒')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,474 @@
+"""并发负载基准（存储相关改动的回归门禁）
+
+生成合成数据库，启动只读 API 进程，对仪表盘、指数列表、指数详情、股债性价比接口施加并发请求，
+分两个阶段测量：只有读请求；读请求的同时另一个进程持续写入（合成抓取器 SyntheticFetcher
+走 DataFetcher 的真实入库逻辑写入行情、成份股、国债收益率，并执行 run_daily_calculation）。
+探针线程反复申请 SQLite 读锁和写锁（BEGIN IMMEDIATE），记录锁等待时间。
+
+报告各接口的延迟分位数与错误率、写入各步骤耗时与失败次数、锁等待分布。以下情况以非零状态退出：
+错误率超过 --max-error-rate、写入失败、锁等待超时（database is locked）、p99 超过 --max-p99-ms，
+或与 --baseline 指定的历史结果相比 p99 退化超过 --tolerance。修改表结构、索引、写入方式前后
+各运行一次，以改动前 --output 保存的结果作为改动后的 --baseline。
+
+用法:
+    python bench_load.py --db /tmp/bench.db --output baseline.json
+    python bench_load.py --db /tmp/bench.db --baseline baseline.json
+    COMPACT_STORAGE=1 python bench_load.py --db /tmp/bench_compact.db --reseed --baseline baseline.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from loadtest import run_load, _percentile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 读负载请求的接口，{index_id} 替换为第一个自选指数
+DEFAULT_PATHS = [
+    '/api/dashboard',
+    '/api/indices',
+    '/api/indices/{index_id}',
+    '/api/stock-bond-ratio',
+]
+
+WRITE_STEPS = ['index_history', 'constituents', 'bond_yield', 'daily_calculation']
+
+logger = logging.getLogger(__name__)
+
+
+def _synthetic_days(start, end):
+    """合成数据的交易日：工作日且不在休市日表中（不依赖数据库）"""
+    from trading_calendar import TradingCalendar, load_holidays
+    return TradingCalendar([], load_holidays()).trading_days(start, end)
+
+
+def _index_code(i):
+    # 第0个指数为中证800（股债性价比和交易日历依赖它）
+    return '000906' if i == 0 else f'9{i:05d}'
+
+
+def _stock_code(i):
+    return f'{600000 + i:06d}'
+
+
+def _create_synthetic_fetcher(seed=0, stocks=300, years=10):
+    """合成数据抓取器：akshare 调用换成随机游走数据，入库逻辑与 DataFetcher 相同
+
+    延迟导入 data_fetcher，只在写入进程和生成数据库时加载。
+    """
+    from data_fetcher import DataFetcher
+
+    class SyntheticFetcher(DataFetcher):
+        def __init__(self):
+            super().__init__(max_retries=1, min_delay=0, max_delay=0)
+            self.rng = np.random.default_rng(seed)
+
+        def _random_delay(self):
+            pass
+
+        def _fetch_index_history_data(self, index_code, start_date, end_date):
+            days = _synthetic_days(pd.Timestamp(start_date).date(), pd.Timestamp(end_date).date())
+            if not days:
+                raise Exception(f"指数 {index_code} 返回空数据")
+            pe = 15 * np.exp(np.cumsum(self.rng.normal(0, 0.01, len(days))))
+            close = pe * 100
+            return pd.DataFrame({
+                '日期': [d.strftime('%Y-%m-%d') for d in days],
+                '开盘': close, '最高': close * 1.01, '最低': close * 0.99, '收盘': close,
+                '成交量': 1000.0, '成交金额': 100.0, '滚动市盈率': pe, '样本数量': 50,
+            })
+
+        def _fetch_constituents_data(self, index_code):
+            codes = [_stock_code(i) for i in self.rng.choice(stocks, 50, replace=False)]
+            return pd.DataFrame({
+                '日期': date.today().strftime('%Y-%m-%d'),
+                '成分券代码': codes, '成分券名称': codes, '成分券英文名称': codes,
+                '交易所': 'SSE', '权重': 2.0,
+            })
+
+        def _fetch_bond_yield_data(self):
+            # 与 akshare 一样返回完整历史
+            days = _synthetic_days(date.today() - timedelta(days=365 * years), date.today())
+            return pd.DataFrame({
+                '日期': [d.strftime('%Y-%m-%d') for d in days],
+                '中国国债收益率10年': 2.5 + np.cumsum(self.rng.normal(0, 0.01, len(days))),
+            })
+
+    return SyntheticFetcher()
+
+
+def seed_database(app, indices=200, favorites=20, years=10, stocks=300, seed=0):
+    """生成合成数据库（清空已有表）
+
+    Args:
+        app: Flask应用实例
+        indices: 指数数量（含中证800）
+        favorites: 自选指数数量
+        years: 行情与国债收益率年数
+        stocks: 股票数量（成份股与滚动ROE）
+        seed: 随机种子
+    """
+    from sqlalchemy import insert
+    from models import (db, Index, IndexHistory, IndexConstituent, StockTTMRoe, BondYield, SystemConfig,
+                        analyze_database)
+    from calculator import Calculator
+
+    rng = np.random.default_rng(seed)
+    days = _synthetic_days(date.today() - timedelta(days=365 * years), date.today() - timedelta(days=1))
+    report_dates = [date(date.today().year - 1, month, day) for month, day in ((3, 31), (6, 30), (9, 30), (12, 31))]
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        db.session.execute(insert(Index), [
+            {'id': i + 1, 'code': _index_code(i), 'name': f'合成指数{i}', 'name_full': f'合成指数{i}',
+             'is_favorite': 1 <= i <= favorites, 'manual_weight': 1.0}
+            for i in range(indices)
+        ])
+        for i in range(indices):
+            pe = 15 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+            db.session.execute(insert(IndexHistory), [
+                {'index_id': i + 1, 'date': d, 'open': p * 100, 'high': p * 101, 'low': p * 99, 'close': p * 100,
+                 'volume': 1000.0, 'amount': 100.0, 'pe_ttm': p, 'pb': p / 8, 'sample_count': 50}
+                for d, p in zip(days, pe.tolist())
+            ])
+        db.session.execute(insert(BondYield), [
+            {'date': d, 'yield_10y': y}
+            for d, y in zip(days, (2.5 + np.cumsum(rng.normal(0, 0.01, len(days)))).tolist())
+        ])
+        db.session.execute(insert(IndexConstituent), [
+            {'index_id': i + 1, 'date': days[-1], 'stock_code': _stock_code(s), 'stock_name': _stock_code(s),
+             'exchange': 'SSE', 'weight': 2.0}
+            for i in range(favorites + 1)
+            for s in rng.choice(stocks, 50, replace=False).tolist()
+        ])
+        db.session.execute(insert(StockTTMRoe), [
+            {'stock_code': _stock_code(s), 'report_date': report_date,
+             'ttm_net_profit': 100.0, 'avg_equity': 1000.0, 'roe': float(rng.uniform(5, 20))}
+            for s in range(stocks)
+            for report_date in report_dates
+        ])
+        db.session.add(SystemConfig(key='data_initialized', value='true', description='数据是否已初始化'))
+        db.session.commit()
+
+        Calculator().run_daily_calculation()
+        analyze_database()
+
+
+def _write_worker(database_url, write_days, ready, cycle_done, stop, queue):
+    """写入进程：循环执行入库与每日计算，stop 设置后返回各步骤耗时与失败次数
+
+    导入和建立应用后设置 ready，每完成一轮设置 cycle_done。
+    """
+    os.environ['DATABASE_URL'] = database_url
+    logging.disable(logging.INFO)
+    from app_factory import create_app
+    from models import db, Index, tracked_index_condition
+    from calculator import Calculator
+
+    app = create_app()
+    fetcher = _create_synthetic_fetcher()
+    calculator = Calculator()
+    durations = {name: [] for name in WRITE_STEPS}
+    failures = {name: 0 for name in WRITE_STEPS}
+    cycles = 0
+
+    def codes():
+        tracked = [code for code, in db.session.query(Index.code).filter(tracked_index_condition()).all()]
+        return sorted(set(tracked) | {'000906'})
+
+    def fetch_history():
+        end = date.today()
+        start = end - timedelta(days=write_days)
+        return all([fetcher.fetch_index_history(code, start.strftime('%Y%m%d'), end.strftime('%Y%m%d'))
+                    for code in codes()])
+
+    steps = {
+        'index_history': fetch_history,
+        'constituents': lambda: all([fetcher.fetch_index_constituents(code) for code in codes()]),
+        'bond_yield': fetcher.fetch_bond_yield,
+        'daily_calculation': calculator.run_daily_calculation,
+    }
+
+    ready.set()
+    with app.app_context():
+        while not stop.is_set():
+            for name in WRITE_STEPS:
+                if stop.is_set():
+                    break
+                start = time.perf_counter()
+                try:
+                    ok = steps[name]()
+                except Exception as e:
+                    logger.error(f"写入步骤 {name} 失败: {str(e)}")
+                    db.session.rollback()
+                    ok = False
+                durations[name].append(time.perf_counter() - start)
+                failures[name] += ok is False or ok is None
+            else:
+                cycles += 1
+                cycle_done.set()
+
+    queue.put({
+        'cycles': cycles,
+        'steps': {
+            name: {
+                'runs': len(durations[name]),
+                'failures': failures[name],
+                'mean': sum(durations[name]) / len(durations[name]) * 1000 if durations[name] else None,
+                'max': max(durations[name]) * 1000 if durations[name] else None,
+            }
+            for name in WRITE_STEPS
+        },
+    })
+
+
+class LockProbe(threading.Thread):
+    """SQLite 锁等待探针：定期测量申请读锁（共享锁）和写锁（BEGIN IMMEDIATE）的等待时间"""
+
+    def __init__(self, path, interval=0.25, timeout=30):
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        self.timeout = timeout
+        self.stop = threading.Event()
+        self.read_waits = []
+        self.write_waits = []
+        self.locked = 0
+
+    def run(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            while not self.stop.wait(self.interval):
+                try:
+                    start = time.perf_counter()
+                    connection.execute('SELECT count(*) FROM sqlite_master').fetchone()
+                    self.read_waits.append(time.perf_counter() - start)
+
+                    start = time.perf_counter()
+                    connection.execute('BEGIN IMMEDIATE')
+                    self.write_waits.append(time.perf_counter() - start)
+                    connection.execute('ROLLBACK')
+                except sqlite3.OperationalError:
+                    self.locked += 1
+        finally:
+            connection.close()
+
+    def result(self):
+        def summarize(waits):
+            waits = sorted(waits)
+            return {
+                'samples': len(waits),
+                'p50': _percentile(waits, 0.50) * 1000 if waits else None,
+                'p99': _percentile(waits, 0.99) * 1000 if waits else None,
+                'max': waits[-1] * 1000 if waits else None,
+                'total': sum(waits) * 1000,
+            }
+
+        return {'read': summarize(self.read_waits), 'write': summarize(self.write_waits), 'locked': self.locked}
+
+
+def _start_server(database_url, port, timeout=60):
+    """在子进程中启动只读 API（Flask 多线程开发服务器），返回进程"""
+    env = dict(os.environ, DATABASE_URL=database_url)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'flask', '--app', 'read_app', 'run', '--port', str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1).read()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('只读 API 启动失败')
+
+
+def run_phase(base_url, paths, args, db_path=None, with_writes=False):
+    """运行一个测量阶段
+
+    有写入时，读负载在写入进程就绪后开始，至少持续到写入完成一整轮。
+
+    Returns:
+        dict: load（读请求统计）、writes（写入统计，仅 with_writes）、locks（锁等待，仅 SQLite）
+    """
+    probe = LockProbe(db_path) if db_path else None
+    writer = until = None
+    if with_writes:
+        context = multiprocessing.get_context('spawn')
+        ready, cycle_done, stop = context.Event(), context.Event(), context.Event()
+        queue = context.Queue()
+        writer = context.Process(target=_write_worker,
+                                 args=(args.database_url, args.write_days, ready, cycle_done, stop, queue))
+        writer.start()
+        if not ready.wait(120):
+            writer.terminate()
+            raise RuntimeError('写入进程启动失败')
+        until = lambda: cycle_done.is_set() or not writer.is_alive()
+    if probe:
+        probe.start()
+
+    load = run_load(base_url, paths, args.concurrency, args.duration, args.stream_clients, until=until)
+
+    result = {'load': load}
+    if writer:
+        stop.set()
+        result['writes'] = queue.get()
+        writer.join()
+    if probe:
+        probe.stop.set()
+        probe.join()
+        result['locks'] = probe.result()
+    return result
+
+
+def check(result, args, baseline=None):
+    """检查阈值与基线，返回不通过的原因列表"""
+    problems = []
+    for phase, data in result['phases'].items():
+        load = data['load']
+        if load['error_rate'] > args.max_error_rate:
+            problems.append(f"{phase}: 错误率 {load['error_rate']:.2%} 超过 {args.max_error_rate:.2%}")
+        if data.get('locks', {}).get('locked'):
+            problems.append(f"{phase}: 锁等待超时 {data['locks']['locked']} 次")
+        for name, step in data.get('writes', {}).get('steps', {}).items():
+            if step['failures']:
+                problems.append(f"{phase}: 写入步骤 {name} 失败 {step['failures']} 次")
+        for path, stats in load['paths'].items():
+            if args.max_p99_ms and stats['p99'] is not None and stats['p99'] > args.max_p99_ms:
+                problems.append(f"{phase} {path}: p99 {stats['p99']:.0f}ms 超过 {args.max_p99_ms:.0f}ms")
+
+    if baseline:
+        if baseline.get('config') != result['config']:
+            logger.warning("基线的数据规模或负载参数与本次不同，对比结果仅供参考")
+        for phase, data in result['phases'].items():
+            base_phase = baseline['phases'].get(phase)
+            if not base_phase:
+                continue
+            pairs = [
+                (path, stats['p99'], base_phase['load']['paths'].get(path, {}).get('p99'))
+                for path, stats in data['load']['paths'].items()
+            ]
+            if 'locks' in data and 'locks' in base_phase:
+                pairs += [(label, data['locks'][kind]['p99'], base_phase['locks'][kind]['p99'])
+                          for kind, label in (('read', '读锁等待'), ('write', '写锁等待'))]
+            for name, current, base in pairs:
+                # 绝对余量避免几毫秒级的抖动被判为退化
+                if None not in (current, base) and current > base * (1 + args.tolerance) + args.slack_ms:
+                    problems.append(f"{phase} {name}: p99 {current:.0f}ms，基线 {base:.0f}ms")
+    return problems
+
+
+def _print_result(result):
+    for phase, data in result['phases'].items():
+        load = data['load']
+        print(f"\n[{phase}] 请求 {load['requests']}，错误率 {load['error_rate']:.2%}，RPS {load['rps']:.1f}")
+        print(f"{'接口':<32}{'请求数':>8}{'错误':>6}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+        for path, r in sorted(load['paths'].items()):
+            print(f"{path:<32}{r['requests']:>8}{r['errors']:>6}"
+                  f"{r['p50']:>10.1f}{r['p90']:>10.1f}{r['p99']:>10.1f}{r['max']:>10.1f}")
+        if 'writes' in data:
+            writes = data['writes']
+            print(f"写入：完整轮次 {writes['cycles']}")
+            for name, step in writes['steps'].items():
+                mean = f"{step['mean']:.0f}" if step['mean'] is not None else '-'
+                peak = f"{step['max']:.0f}" if step['max'] is not None else '-'
+                print(f"  {name:<20}次数 {step['runs']:>4}  失败 {step['failures']:>3}  平均 {mean}ms  最大 {peak}ms")
+        if 'locks' in data:
+            locks = data['locks']
+            for kind, label in (('read', '读锁'), ('write', '写锁')):
+                w = locks[kind]
+                if w['samples']:
+                    print(f"{label}等待：样本 {w['samples']}  p50 {w['p50']:.1f}ms  p99 {w['p99']:.1f}ms  "
+                          f"最大 {w['max']:.1f}ms  合计 {w['total']:.0f}ms")
+            print(f"锁等待超时：{locks['locked']} 次")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='并发负载基准（读请求 + 写入任务）')
+    parser.add_argument('--db', default=os.path.join(BACKEND_DIR, 'bench_load.db'), help='合成数据库路径')
+    parser.add_argument('--reseed', action='store_true', help='重新生成合成数据库')
+    parser.add_argument('--indices', type=int, default=200, help='合成指数数量')
+    parser.add_argument('--favorites', type=int, default=20, help='自选指数数量')
+    parser.add_argument('--years', type=int, default=10, help='合成行情年数')
+    parser.add_argument('--port', type=int, default=5051, help='只读 API 端口')
+    parser.add_argument('--concurrency', type=int, default=20, help='并发客户端数')
+    parser.add_argument('--duration', type=float, default=30, help='每个阶段的时长（秒）')
+    parser.add_argument('--stream-clients', type=int, default=0, help='同时保持的仪表盘推送长连接数')
+    parser.add_argument('--write-days', type=int, default=30, help='每轮写入的最近行情天数')
+    parser.add_argument('--max-error-rate', type=float, default=0.001, help='允许的最大错误率')
+    parser.add_argument('--max-p99-ms', type=float, help='各接口 p99 上限（毫秒）')
+    parser.add_argument('--baseline', help='基线结果 JSON（--output 保存的文件）')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='相对基线允许的 p99 退化比例')
+    parser.add_argument('--slack-ms', type=float, default=5, help='相对基线比较时的绝对余量（毫秒）')
+    parser.add_argument('--output', help='结果保存路径（JSON）')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    db_path = os.path.abspath(args.db)
+    args.database_url = f'sqlite:///{db_path}'
+    if args.reseed or not os.path.exists(db_path):
+        print(f'生成合成数据库 {db_path}（{args.indices} 个指数 × {args.years} 年）...')
+        os.environ['DATABASE_URL'] = args.database_url
+        from app_factory import create_app
+        logging.disable(logging.INFO)
+        seed_database(create_app(read_only=True), args.indices, args.favorites, args.years)
+        logging.disable(logging.NOTSET)
+
+    paths = [path.format(index_id=2) for path in DEFAULT_PATHS]
+    server = _start_server(args.database_url, args.port)
+    base_url = f'http://127.0.0.1:{args.port}'
+    try:
+        phases = {}
+        print(f'只读阶段：并发 {args.concurrency}，{args.duration:g} 秒...')
+        phases['read_only'] = run_phase(base_url, paths, args, db_path)
+        print(f'读写阶段：并发 {args.concurrency}，{args.duration:g} 秒，同时写入...')
+        phases['with_writes'] = run_phase(base_url, paths, args, db_path, with_writes=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    result = {
+        'config': {
+            'indices': args.indices, 'favorites': args.favorites, 'years': args.years,
+            'concurrency': args.concurrency, 'duration': args.duration, 'stream_clients': args.stream_clients,
+            'write_days': args.write_days, 'compact_storage': os.environ.get('COMPACT_STORAGE', ''),
+        },
+        'phases': phases,
+    }
+    _print_result(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    problems = check(result, args, baseline)
+    if problems:
+        print('\n未通过:')
+        for problem in problems:
+            print(f'  {problem}')
+        sys.exit(1)
+    print('\n通过')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""启动耗时基准
+
+在全新的子进程中分别导入 read_app（只读 API）和 app（完整 API），
+统计导入耗时、常驻内存，并列出已加载的重量级依赖（akshare、APScheduler、pandas）。
+只读入口加载了 akshare 或 APScheduler 时以非零状态退出，可用作部署前检查。
+
+用法:
+    python bench_startup.py [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ENTRY_MODULES = ['read_app', 'app']
+HEAVY_MODULES = ['akshare', 'apscheduler', 'pandas']
+# 只读入口不允许加载的模块
+READ_ONLY_FORBIDDEN = ['akshare', 'apscheduler']
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+except ImportError:
+    rss_mb = None
+print(json.dumps({{
+    'seconds': elapsed,
+    'max_rss_mb': rss_mb,
+    'loaded': [name for name in {heavy!r} if name in sys.modules]
+}}))
+'''
+
+
+def measure(module, repeat=5):
+    """在新进程中重复导入入口模块
+
+    Returns:
+        dict: 导入耗时中位数/最小值（秒）、最大常驻内存（MB）、已加载的重量级依赖
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    rss = [run['max_rss_mb'] for run in runs if run['max_rss_mb'] is not None]
+    return {
+        'module': module,
+        'median_seconds': statistics.median(run['seconds'] for run in runs),
+        'min_seconds': min(run['seconds'] for run in runs),
+        'max_rss_mb': max(rss) if rss else None,
+        'loaded': runs[-1]['loaded']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API 入口启动耗时基准')
+    parser.add_argument('--repeat', type=int, default=5, help='每个入口重复次数')
+    args = parser.parse_args()
+
+    results = [measure(module, args.repeat) for module in ENTRY_MODULES]
+
+    print(f'{"入口":<10}{"中位数(秒)":>12}{"最小(秒)":>10}{"内存(MB)":>10}  已加载依赖')
+    for result in results:
+        rss = f'{result["max_rss_mb"]:.1f}' if result['max_rss_mb'] is not None else '-'
+        print(f'{result["module"]:<10}{result["median_seconds"]:>12.3f}{result["min_seconds"]:>10.3f}{rss:>10}  '
+              f'{", ".join(result["loaded"]) or "无"}')
+
+    read_only = next(r for r in results if r['module'] == 'read_app')
+    forbidden = [name for name in read_only['loaded'] if name in READ_ONLY_FORBIDDEN]
+    if forbidden:
+        print(f'只读入口加载了不应加载的模块: {", ".join(forbidden)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
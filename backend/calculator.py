@@ -1,8 +1,14 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from models import (db, Index, IndexHistory, IndexConstituent, StockFinancial, 
-                    BondYield, CalculatedMetrics, StockBondRatio)
+from models import (db, Index, IndexHistory, IndexConstituent,
+                    StockTTMRoe, BondYield, CalculatedMetrics, StockBondRatio, natural_key_map,
+                    PortfolioIndex, PortfolioPosition, latest_index_rows, tracked_index_condition)
+from snapshot import ValuationSnapshot
+from percentile_engine import (PERCENTILE_METRICS, PercentileLookup, load_series, window_percentiles,
+                               index_percentiles, save_index_percentiles)
+from data_version import bump_data_version, get_data_version
+from trading_calendar import get_trading_calendar
 import logging
 from sqlalchemy import func, extract, case
 
@@ -25,8 +31,32 @@ class Calculator:
         (90, 100, 5)
     ]
     
+    # ROE权重：ROE=ROE_ANCHOR(%)时权重为1，每±1%调整ROE_SLOPE
+    ROE_ANCHOR = 10
+    ROE_SLOPE = 0.1
+    
     def __init__(self):
-        pass
+        # 常驻的各指数有序估值数组，用于假设估值的分位数查询
+        self.percentile_lookup = PercentileLookup()
+    
+    def build_snapshot(self, root=None):
+        """生成只读估值快照（内存映射），供研究进程和并行计算进程零拷贝共享
+        
+        Args:
+            root: 快照根目录，默认 SNAPSHOT_DIR 或 backend/snapshot
+            
+        Returns:
+            str: 快照目录，失败返回 None
+        """
+        try:
+            return ValuationSnapshot.build(root)
+        except Exception as e:
+            logger.error(f"生成估值快照失败: {str(e)}")
+            return None
+    
+    def open_snapshot(self, root=None):
+        """打开当前版本估值快照（只读内存映射），尚未生成时返回 None"""
+        return ValuationSnapshot.open(root)
     
     def get_percentile_range_and_score(self, percentile):
         """根据分位数获取区间和初始分数
@@ -50,6 +80,47 @@ class Calculator:
         
         return "0%-10%", 40
     
+    def lookup_percentiles(self, queries):
+        """查询假设估值（如盘中估值）在近10年历史中的分位数、分位区间和初始分数
+        
+        使用常驻的有序估值数组二分查找，不重新载入历史数据。
+        
+        Args:
+            queries: [{'index_id': 1, 'pe': 12.3, 'pb': 1.4}]，pe/pb 可只给一个
+            
+        Returns:
+            list: 与 queries 对应的结果字典；指数没有历史数据时为 None
+        """
+        items = [
+            (query['index_id'], {metric: query.get(metric) for metric in PERCENTILE_METRICS})
+            for query in queries
+        ]
+        lookups = self.percentile_lookup.lookup(items, get_data_version())
+        
+        results = []
+        for (index_id, values), lookup in zip(items, lookups):
+            if lookup is None:
+                results.append(None)
+                continue
+            
+            result = {'index_id': index_id}
+            for metric, (percentile, sample_count) in lookup.items():
+                result[metric] = {
+                    'value': values[metric],
+                    'percentile': percentile,
+                    'sample_count': sample_count
+                }
+            
+            # PE分位数为主，缺失时使用PB分位数
+            main_percentile = lookup['pe'][0] if lookup['pe'][0] is not None else lookup['pb'][0]
+            percentile_range, initial_score = self.get_percentile_range_and_score(main_percentile)
+            result['percentile'] = main_percentile
+            result['percentile_range'] = percentile_range
+            result['initial_score'] = initial_score
+            results.append(result)
+        
+        return results
+    
     def calculate_roe_weight(self, roe):
         """计算ROE权重
         
@@ -66,7 +137,7 @@ class Calculator:
             return 1.0  # 缺失值或≤0时权重为1（根据需求）
         
         # ROE=10%时权重为1，每±1%调整0.1
-        weight = 1.0 + (roe - 10) * 0.1
+        weight = 1.0 + (roe - self.ROE_ANCHOR) * self.ROE_SLOPE
         
         # 权重不能为负
         return max(0, weight)
@@ -74,6 +145,8 @@ class Calculator:
     def calculate_index_weighted_roe(self, index_id, date=None):
         """计算指数加权ROE
         
+        最新成份股与预计算的滚动ROE（每只股票最新报告期）关联后按权重加权
+        
         Args:
             index_id: 指数ID
             date: 日期，默认为最新日期
@@ -82,80 +155,37 @@ class Calculator:
             float: 加权ROE
         """
         try:
-
-            # 获取最新成份股日期
-            latest_constituent = IndexConstituent.query.filter_by(
-                index_id=index_id
-            ).order_by(IndexConstituent.date.desc()).first()
-
-            if not latest_constituent:
-                return None
-
-            # 获取成分股更新的最新日期
-            cons_date = latest_constituent.date
-            
-            # 获取成份股列表
-            constituents = IndexConstituent.query.filter_by(
-                index_id=index_id,
-                date=cons_date
-            ).all()
-            
-            if not constituents:
-                return None
-            
-            # 计算加权ROE
-            total_weight = 0
-            weighted_roe_sum = 0
-            
-            for constituent in constituents:
-                # 获取该股票近五季度的财务数据（按报告期降序排列）
-                financial = StockFinancial.query.filter_by(
-                    stock_code=constituent.stock_code
-                ).order_by(StockFinancial.report_date.desc()).all()[:5]
-
-                # 需要至少5个季度的数据来计算4个单季度净利润
-                if len(financial) < 5:
-                    continue
-                
-                # 计算单季度净利润（累计净利润相减）
-                # financial[0]是最新季度，financial[4]是最老季度
-                single_quarter_profits = []
-                for i in range(4):
-                    current_profit = financial[i].net_profit
-                    previous_profit = financial[i+1].net_profit if financial[i].report_date.month != 3 else 0
-                    
-                    # 如果当前季度或上一季度数据缺失，跳过
-                    if current_profit is None or previous_profit is None:
-                        continue
-                    
-                    # 单季度净利润 = 本季度累计 - 上季度累计
-                    single_quarter_profit = current_profit - previous_profit
-                    single_quarter_profits.append(single_quarter_profit)
-                
-                # 如果没有足够的单季度数据，跳过该股票
-                if len(single_quarter_profits) < 4:
-                    continue
-                
-                # 计算近四季度单季度净利润之和
-                total_net_profit = sum(single_quarter_profits)
-
-                
-                # 计算近四季度所有者权益的均值（使用最新的4个季度）
-                equity_values = [financial[i].equity for i in range(4) if financial[i].equity is not None]
-                avg_equity = sum(equity_values) / len(equity_values) if equity_values else None
-                
-                # 计算ROE
-                weight = constituent.weight if constituent.weight else 0
-                if avg_equity is not None and avg_equity > 0:
-                    roe = (total_net_profit / avg_equity) * 100  # 转换为百分比
-                    print(f'{constituent.stock_name} 总利润: {total_net_profit}, 权益: {avg_equity}, ROE: {roe}%')
-                    weighted_roe_sum += roe * weight
-
-                    total_weight += weight
-                else:
-                    print(f'{constituent.stock_name} 总利润: {total_net_profit}, 权益: {avg_equity}')
-            
-            if total_weight == 0:
+            # 最新成份股日期
+            cons_date = db.session.query(
+                func.max(IndexConstituent.date)
+            ).filter(
+                IndexConstituent.index_id == index_id
+            ).scalar_subquery()
+            
+            # 每只股票最新报告期
+            latest_report = db.session.query(
+                StockTTMRoe.stock_code,
+                func.max(StockTTMRoe.report_date).label('report_date')
+            ).group_by(StockTTMRoe.stock_code).subquery()
+            
+            weight = func.coalesce(IndexConstituent.weight, 0)
+            weighted_roe_sum, total_weight = db.session.query(
+                func.sum(StockTTMRoe.roe * weight),
+                func.sum(weight)
+            ).select_from(IndexConstituent).join(
+                latest_report,
+                latest_report.c.stock_code == IndexConstituent.stock_code
+            ).join(
+                StockTTMRoe,
+                (StockTTMRoe.stock_code == latest_report.c.stock_code) &
+                (StockTTMRoe.report_date == latest_report.c.report_date)
+            ).filter(
+                IndexConstituent.index_id == index_id,
+                IndexConstituent.date == cons_date,
+                StockTTMRoe.roe.isnot(None)
+            ).one()
+            
+            if not total_weight:
                 return None
             
             return weighted_roe_sum / total_weight
@@ -164,66 +194,76 @@ class Calculator:
             logger.error(f"计算指数 {index_id} 加权ROE失败: {str(e)}")
             return None
     
+    def calculate_all_weighted_roe(self):
+        """一次查询计算所有指数的加权ROE
+        
+        与 calculate_index_weighted_roe 口径相同（各指数最新成份股 × 每只股票最新滚动ROE），
+        按指数分组聚合。
+        
+        Returns:
+            dict: 指数ID -> 加权ROE（无有效成份股权重的指数不在结果中）
+        """
+        try:
+            # 每个指数最新成份股日期
+            cons_date = db.session.query(
+                IndexConstituent.index_id,
+                func.max(IndexConstituent.date).label('date')
+            ).group_by(IndexConstituent.index_id).subquery()
+            
+            # 每只股票最新报告期
+            latest_report = db.session.query(
+                StockTTMRoe.stock_code,
+                func.max(StockTTMRoe.report_date).label('report_date')
+            ).group_by(StockTTMRoe.stock_code).subquery()
+            
+            weight = func.coalesce(IndexConstituent.weight, 0)
+            rows = db.session.query(
+                IndexConstituent.index_id,
+                func.sum(StockTTMRoe.roe * weight),
+                func.sum(weight)
+            ).join(
+                cons_date,
+                (cons_date.c.index_id == IndexConstituent.index_id) &
+                (cons_date.c.date == IndexConstituent.date)
+            ).join(
+                latest_report,
+                latest_report.c.stock_code == IndexConstituent.stock_code
+            ).join(
+                StockTTMRoe,
+                (StockTTMRoe.stock_code == latest_report.c.stock_code) &
+                (StockTTMRoe.report_date == latest_report.c.report_date)
+            ).filter(
+                StockTTMRoe.roe.isnot(None)
+            ).group_by(IndexConstituent.index_id).all()
+            
+            return {
+                index_id: weighted_roe_sum / total_weight
+                for index_id, weighted_roe_sum, total_weight in rows
+                if total_weight
+            }
+            
+        except Exception as e:
+            logger.error(f"批量计算指数加权ROE失败: {str(e)}")
+            return {}
+    
     def calculate_percentile(self, index_id, metric='pe', lookback_days=3650):
         """计算指标分位数
         
         Args:
             index_id: 指数ID
             metric: 指标类型，'pe' or 'pb'
-            lookback_days: 回溯天数，默认10年（3650天）
+            lookback_days: 回溯天数，默认10年（3650天）；成立不足时使用成立至今数据
             
         Returns:
             float: 分位数（0-100）
         """
         try:
-            # 获取历史数据
-            end_date = datetime.now().date()
-            start_date = end_date - timedelta(days=lookback_days)
-            
-            # 获取指数成立日期（第一条数据日期）
-            first_record = IndexHistory.query.filter_by(
-                index_id=index_id
-            ).order_by(IndexHistory.date.asc()).first()
-            
-            if not first_record:
+            if metric not in PERCENTILE_METRICS:
                 return None
             
-            # 如果成立不足10年，使用成立至今数据
-            if first_record.date > start_date:
-                start_date = first_record.date
-            
-            # 查询历史数据
-            history = IndexHistory.query.filter(
-                IndexHistory.index_id == index_id,
-                IndexHistory.date >= start_date,
-                IndexHistory.date <= end_date
-            ).order_by(IndexHistory.date.asc()).all()
-            
-            if not history:
-                return None
-            
-            # 提取指标值
-            if metric == 'pe':
-                values = [h.pe_ttm for h in history if h.pe_ttm is not None and h.pe_ttm > 0]
-            elif metric == 'pb':
-                values = [h.pb for h in history if h.pb is not None and h.pb > 0]
-            else:
-                return None
-            
-            if not values:
-                return None
-            
-            # 获取最新值
-            latest = history[-1]
-            current_value = latest.pe_ttm if metric == 'pe' else latest.pb
-            
-            if current_value is None or current_value <= 0:
-                return None
-            
-            # 计算分位数
-            percentile = (np.sum(np.array(values) <= current_value) / len(values)) * 100
-            
-            return percentile
+            dates, series = load_series(index_id)
+            result = window_percentiles(dates, series[metric], windows=(('lookback', lookback_days),))
+            return result['lookback'][0]
             
         except Exception as e:
             logger.error(f"计算指数 {index_id} {metric} 分位数失败: {str(e)}")
@@ -241,161 +281,206 @@ class Calculator:
         Returns:
             dict: 包含计算结果的字典
         """
-        try:
-            if not date:
-                date = (datetime.now() - timedelta(days=1)).date()
+        if not date:
+            date = get_trading_calendar().previous_trading_day(datetime.now().date())
+        
+        result = self.calculate_stock_bond_ratio_range(
+            dates=[date], skip_percentile=skip_percentile
+        )
+        
+        if result is None or result.empty:
+            logger.warning(f"无法计算股债性价比 (date={date})")
+            return None
+        
+        return result.iloc[0].to_dict()
+    
+    def calculate_stock_bond_ratio_range(self, start_date=None, end_date=None, dates=None,
+                                         skip_percentile=False, save=True):
+        """批量计算一段日期的股债性价比
+        
+        中证800市盈率与国债收益率各只加载一次，按日期做 as-of 对齐
+        （取不晚于目标日期的最近一条数据），向量化计算股债性价比，
+        再按近10年滚动窗口计算分位数，最后批量写回数据库。
+        
+        Args:
+            start_date: 开始日期，与 end_date 一起使用
+            end_date: 结束日期，默认为今天
+            dates: 直接指定目标日期列表（优先于 start_date/end_date）
+            skip_percentile: 是否跳过分位数计算（分位数固定为50）
+            save: 是否写入数据库
             
-            # 获取中证800（代码000906）的市盈率
+        Returns:
+            DataFrame: date, csi800_pe, bond_yield_10y, ratio, percentile_10y, stock_allocation
+        """
+        try:
             csi800 = Index.query.filter_by(code='000906').first()
             if not csi800:
                 logger.warning("未找到中证800指数")
                 return None
             
-            # 获取最新PE数据
-            latest_history = IndexHistory.query.filter(
-                IndexHistory.index_id == csi800.id,
-                IndexHistory.date <= date
-            ).order_by(IndexHistory.date.desc()).first()
+            # 确定目标日期
+            if dates is not None:
+                target_dates = sorted(set(dates))
+            else:
+                end_date = end_date or datetime.now().date()
+                history_dates = db.session.query(IndexHistory.date).filter(
+                    IndexHistory.index_id == csi800.id,
+                    IndexHistory.date >= start_date,
+                    IndexHistory.date <= end_date,
+                    IndexHistory.pe_ttm.isnot(None)
+                ).all()
+                stored_dates = db.session.query(StockBondRatio.date).filter(
+                    StockBondRatio.date >= start_date,
+                    StockBondRatio.date <= end_date
+                ).all()
+                target_dates = sorted({d for d, in history_dates} | {d for d, in stored_dates})
             
-            if not latest_history or not latest_history.pe_ttm:
-                logger.warning(f"未找到中证800市盈率数据 (date={date})")
+            if not target_dates:
+                logger.warning("没有需要计算股债性价比的日期")
                 return None
             
-            # 获取10年国债收益率
-            bond_yield = BondYield.query.filter(
-                BondYield.date <= date
-            ).order_by(BondYield.date.desc()).first()
+            last_date = target_dates[-1]
+            
+            # 一次性加载中证800市盈率与国债收益率
+            pe_df = pd.DataFrame(
+                db.session.query(IndexHistory.date, IndexHistory.pe_ttm).filter(
+                    IndexHistory.index_id == csi800.id,
+                    IndexHistory.date <= last_date
+                ).order_by(IndexHistory.date.asc()).all(),
+                columns=['date', 'csi800_pe']
+            )
+            bond_df = pd.DataFrame(
+                db.session.query(BondYield.date, BondYield.yield_10y).filter(
+                    BondYield.date <= last_date
+                ).order_by(BondYield.date.asc()).all(),
+                columns=['date', 'bond_yield_10y']
+            )
+            
+            if pe_df.empty or bond_df.empty:
+                logger.warning("未找到中证800市盈率或10年国债收益率数据")
+                return None
             
-            if not bond_yield or not bond_yield.yield_10y:
-                logger.warning(f"未找到10年国债收益率数据 (date={date})")
+            # as-of 对齐
+            frame = pd.DataFrame({'date': pd.to_datetime(target_dates)})
+            pe_df['date'] = pd.to_datetime(pe_df['date'])
+            bond_df['date'] = pd.to_datetime(bond_df['date'])
+            frame = pd.merge_asof(frame, pe_df, on='date', direction='backward')
+            frame = pd.merge_asof(frame, bond_df, on='date', direction='backward')
+            
+            # 市盈率或国债收益率缺失（或为0）的日期无法计算
+            valid = (
+                frame['csi800_pe'].notna() & (frame['csi800_pe'] != 0) &
+                frame['bond_yield_10y'].notna() & (frame['bond_yield_10y'] != 0)
+            )
+            frame = frame[valid].reset_index(drop=True)
+            
+            if frame.empty:
+                logger.warning("目标日期均缺少市盈率或国债收益率数据")
                 return None
             
-            # 计算股债性价比
-            pe = latest_history.pe_ttm
-            bond_rate = bond_yield.yield_10y / 100  # 转换为小数
-            ratio = (1 / pe) - bond_rate
+            # 向量化计算股债性价比
+            frame['ratio'] = 1 / frame['csi800_pe'] - frame['bond_yield_10y'] / 100
             
-            # 计算近10年分位数
-            percentile = 50  # 默认值
-            if not skip_percentile:
-                end_date = date
-                start_date = date - timedelta(days=3650)
-                
-                # 获取历史股债性价比数据
-                historical_ratios = StockBondRatio.query.filter(
-                    StockBondRatio.date >= start_date,
-                    StockBondRatio.date <= end_date
-                ).all()
-                
-                ratio_values = [r.ratio for r in historical_ratios if r.ratio is not None]
-                ratio_values.append(ratio)  # 包含当前值
-                
-                if len(ratio_values) > 1:
-                    percentile = (np.sum(np.array(ratio_values) <= ratio) / len(ratio_values)) * 100
+            if skip_percentile:
+                frame['percentile_10y'] = 50.0
+            else:
+                frame['percentile_10y'] = self._rolling_ratio_percentile(frame)
             
             # 股票配置比例 = 分位数
-            stock_allocation = percentile
-            
-            result = {
-                'date': date,
-                'csi800_pe': pe,
-                'bond_yield_10y': bond_yield.yield_10y,
-                'ratio': ratio,
-                'percentile_10y': percentile,
-                'stock_allocation': stock_allocation
-            }
+            frame['stock_allocation'] = frame['percentile_10y']
+            frame['date'] = frame['date'].dt.date
             
-            # 保存到数据库
-            existing = StockBondRatio.query.filter_by(date=date).first()
-            if existing:
-                existing.csi800_pe = pe
-                existing.bond_yield_10y = bond_yield.yield_10y
-                existing.ratio = ratio
-                existing.percentile_10y = percentile
-                existing.stock_allocation = stock_allocation
-            else:
-                record = StockBondRatio(
-                    date=date,
-                    csi800_pe=pe,
-                    bond_yield_10y=bond_yield.yield_10y,
-                    ratio=ratio,
-                    percentile_10y=percentile,
-                    stock_allocation=stock_allocation
-                )
-                db.session.add(record)
+            if save:
+                self._save_stock_bond_ratios(frame)
             
-            db.session.commit()
-            
-            return result
+            return frame
             
         except Exception as e:
             logger.error(f"计算股债性价比失败: {str(e)}")
             db.session.rollback()
             return None
     
+    def _rolling_ratio_percentile(self, frame, lookback_days=3650):
+        """计算每个目标日期股债性价比的近10年分位数
+        
+        窗口数据 = 数据库中已有的股债性价比（本次重算的日期除外）+ 本次计算结果
+        
+        Args:
+            frame: 含 date（Timestamp）、ratio 列的DataFrame，按日期升序
+            lookback_days: 回溯天数
+            
+        Returns:
+            ndarray: 分位数（0-100），窗口内数据不足2条时为50
+        """
+        first_date = frame['date'].iloc[0].date() - timedelta(days=lookback_days)
+        last_date = frame['date'].iloc[-1].date()
+        
+        stored = pd.DataFrame(
+            db.session.query(StockBondRatio.date, StockBondRatio.ratio).filter(
+                StockBondRatio.date >= first_date,
+                StockBondRatio.date <= last_date,
+                StockBondRatio.ratio.isnot(None)
+            ).all(),
+            columns=['date', 'ratio']
+        )
+        stored['date'] = pd.to_datetime(stored['date'])
+        stored = stored[~stored['date'].isin(frame['date'])]
+        
+        window = pd.concat([stored, frame[['date', 'ratio']]]).sort_values('date').set_index('date')['ratio']
+        
+        # 按日期滚动的窗口 [date - lookback_days, date] 内一次完成排名：
+        # method='max' 的百分比排名即窗口内不大于当前值的占比
+        rolling = window.rolling(f'{lookback_days}D', closed='both')
+        percentiles = (rolling.rank(method='max', pct=True) * 100).where(rolling.count() > 1, 50.0)
+        percentiles = percentiles.loc[frame['date']].to_numpy(dtype=float)
+        
+        return percentiles
+    
+    def _save_stock_bond_ratios(self, frame):
+        """批量写入股债性价比（已存在的日期更新，其余插入）"""
+        columns = ['csi800_pe', 'bond_yield_10y', 'ratio', 'percentile_10y', 'stock_allocation']
+        
+        existing = natural_key_map(
+            StockBondRatio, ['date'],
+            StockBondRatio.date >= frame['date'].iloc[0],
+            StockBondRatio.date <= frame['date'].iloc[-1]
+        )
+        
+        inserts = []
+        updates = []
+        for row in frame[['date'] + columns].to_dict('records'):
+            values = {key: float(row[key]) for key in columns}
+            if row['date'] in existing:
+                updates.append({**existing[row['date']], **values})
+            else:
+                inserts.append({'date': row['date'], **values})
+        
+        if inserts:
+            db.session.bulk_insert_mappings(StockBondRatio, inserts)
+        if updates:
+            db.session.bulk_update_mappings(StockBondRatio, updates)
+        db.session.commit()
+        bump_data_version()
+    
     def calculate_historical_stock_bond_ratio(self):
         """计算近10年历史股债性价比数据"""
         try:
             logger.info("开始计算近10年历史股债性价比...")
             
-            # 获取中证800指数
-            csi800 = Index.query.filter_by(code='000906').first()
-            if not csi800:
-                logger.error("未找到中证800指数")
-                return False
-            
-            # 获取近10年的所有历史数据日期
             end_date = datetime.now().date()
             start_date = end_date - timedelta(days=3650)
             
-            # 获取所有有PE数据的日期
-            history_records = IndexHistory.query.filter(
-                IndexHistory.index_id == csi800.id,
-                IndexHistory.date >= start_date,
-                IndexHistory.date <= end_date,
-                IndexHistory.pe_ttm.isnot(None)
-            ).order_by(IndexHistory.date.asc()).all()
+            result = self.calculate_stock_bond_ratio_range(start_date, end_date)
             
-            if not history_records:
+            if result is None or result.empty:
                 logger.warning("没有找到中证800历史数据")
                 return False
             
-            logger.info(f"找到 {len(history_records)} 条历史数据，开始计算...")
-            
-            # 第一遍：计算所有日期的股债性价比（不计算分位数）
-            for record in history_records:
-                self.calculate_stock_bond_ratio(record.date, skip_percentile=True)
-            
-            # 第二遍：重新计算所有日期的分位数
-            logger.info("开始计算分位数...")
-            all_ratios = StockBondRatio.query.filter(
-                StockBondRatio.date >= start_date,
-                StockBondRatio.date <= end_date
-            ).order_by(StockBondRatio.date.asc()).all()
-            
-            for ratio_record in all_ratios:
-                # 获取该日期之前10年的数据
-                lookback_start = ratio_record.date - timedelta(days=3650)
-                
-                historical_ratios = StockBondRatio.query.filter(
-                    StockBondRatio.date >= lookback_start,
-                    StockBondRatio.date <= ratio_record.date
-                ).all()
-                
-                ratio_values = [r.ratio for r in historical_ratios if r.ratio is not None]
-                
-                if len(ratio_values) > 1:
-                    percentile = (np.sum(np.array(ratio_values) <= ratio_record.ratio) / len(ratio_values)) * 100
-                    ratio_record.percentile_10y = percentile
-                    ratio_record.stock_allocation = percentile
-            
-            db.session.commit()
-            logger.info(f"成功计算 {len(all_ratios)} 条历史股债性价比数据")
+            logger.info(f"成功计算 {len(result)} 条历史股债性价比数据")
             return True
             
         except Exception as e:
             logger.error(f"计算历史股债性价比失败: {str(e)}")
-            db.session.rollback()
             return False
     
     def calculate_index_metrics(self, index_id, date=None):
@@ -417,13 +502,14 @@ class Calculator:
             if not index:
                 return None
             
-            # 只计算自选指数
-            if not index.is_favorite:
+            # 只计算自选指数和组合中的指数
+            if not index.is_favorite and PortfolioIndex.query.filter_by(index_id=index_id).first() is None:
                 return None
             
-            # 计算PE和PB分位数
-            pe_percentile = self.calculate_percentile(index_id, 'pe')
-            pb_percentile = self.calculate_percentile(index_id, 'pb')
+            # 一次载入序列，计算PE和PB各回溯窗口的分位数（主分位数取近10年）
+            percentiles = index_percentiles(index_id)
+            pe_percentile = percentiles['pe']['10y'][0]
+            pb_percentile = percentiles['pb']['10y'][0]
             
             # 使用PE分位数作为主要依据（也可以改为PB或综合）
             main_percentile = pe_percentile if pe_percentile is not None else pb_percentile
@@ -511,6 +597,7 @@ class Calculator:
                 record = CalculatedMetrics(**result)
                 db.session.add(record)
             
+            save_index_percentiles(index_id, date, percentiles)
             db.session.commit()
             
             return result
@@ -582,15 +669,92 @@ class Calculator:
             logger.error(f"计算目标仓位失败: {str(e)}")
             db.session.rollback()
     
+    def calculate_portfolio_positions(self, date=None, portfolio_ids=None):
+        """计算各组合的目标仓位
+        
+        使用各指数最新的共享指标（ROE权重、初始分数），按组合内人为权重计算综合权重和综合分数，
+        再按综合分数占比分配仓位。所有组合共用一次成员查询和一次指标查询，
+        结果整批替换该日期的 portfolio_positions 记录。
+        
+        Args:
+            date: 日期，默认为上一个交易日
+            portfolio_ids: 只计算指定组合，默认全部组合
+            
+        Returns:
+            dict: 组合ID -> 分配了仓位的指数数量，失败返回 None
+        """
+        try:
+            if not date:
+                date = get_trading_calendar().previous_trading_day(datetime.now().date())
+            
+            query = PortfolioIndex.query
+            if portfolio_ids is not None:
+                query = query.filter(PortfolioIndex.portfolio_id.in_(portfolio_ids))
+            members = query.order_by(PortfolioIndex.portfolio_id, PortfolioIndex.index_id).all()
+            
+            metrics = latest_index_rows(CalculatedMetrics, {member.index_id for member in members})
+            
+            portfolios = {}
+            for member in members:
+                portfolios.setdefault(member.portfolio_id, []).append(member)
+            if portfolio_ids is not None:
+                for portfolio_id in portfolio_ids:
+                    portfolios.setdefault(portfolio_id, [])
+            
+            rows = []
+            counts = {}
+            for portfolio_id, portfolio_members in portfolios.items():
+                positions = []
+                for member in portfolio_members:
+                    metric = metrics.get(member.index_id)
+                    if metric is None or metric.initial_score is None or metric.roe_weight is None:
+                        continue
+                    manual_weight = member.manual_weight if member.manual_weight is not None else 1.0
+                    composite_weight = metric.roe_weight * manual_weight
+                    positions.append({
+                        'portfolio_id': portfolio_id,
+                        'index_id': member.index_id,
+                        'date': date,
+                        'metrics_date': metric.date,
+                        'composite_weight': composite_weight,
+                        'composite_score': metric.initial_score * composite_weight,
+                        'target_position': 0
+                    })
+                
+                total_score = sum(p['composite_score'] for p in positions if p['composite_score'])
+                if total_score:
+                    for position in positions:
+                        if position['composite_score']:
+                            position['target_position'] = position['composite_score'] / total_score * 100
+                
+                counts[portfolio_id] = len(positions)
+                rows.extend(positions)
+            
+            db.session.query(PortfolioPosition).filter(
+                PortfolioPosition.date == date,
+                PortfolioPosition.portfolio_id.in_(list(portfolios))
+            ).delete(synchronize_session=False)
+            if rows:
+                db.session.bulk_insert_mappings(PortfolioPosition, rows)
+            db.session.commit()
+            
+            logger.info(f"成功计算 {len(portfolios)} 个组合的目标仓位")
+            return counts
+            
+        except Exception as e:
+            logger.error(f"计算组合目标仓位失败: {str(e)}")
+            db.session.rollback()
+            return None
+    
     def run_daily_calculation(self, date=None):
         """执行每日计算任务
         
         Args:
-            date: 日期，默认为今天
+            date: 日期，默认为上一个交易日
         """
         try:
             if not date:
-                date = (datetime.now() - timedelta(days=1)).date()
+                date = get_trading_calendar().previous_trading_day(datetime.now().date())
             
             logger.info(f"开始执行 {date} 的每日计算...")
             
@@ -601,10 +765,32 @@ class Calculator:
                           f"分位数: {stock_bond_result['percentile_10y']:.2f}%, "
                           f"股票配置: {stock_bond_result['stock_allocation']:.2f}%")
             
-            # 2. 计算所有自选指数的指标
-            favorite_indices = Index.query.filter_by(is_favorite=True).all()
+            # 2. 计算所有自选指数的指标和目标仓位
+            self.run_index_calculation(date)
             
-            for index in favorite_indices:
+            logger.info(f"{date} 的每日计算完成")
+            return True
+            
+        except Exception as e:
+            logger.error(f"每日计算失败: {str(e)}")
+            return False
+    
+    def run_index_calculation(self, date=None):
+        """计算自选指数与各组合指数的指标和目标仓位
+        
+        指数级指标对自选与所有组合中的指数（并集）每个指数只计算一次，
+        各组合的目标仓位在共享指标之上计算，组合数量增加不会增加指标计算量。
+        
+        Args:
+            date: 日期，默认为上一个交易日
+        """
+        try:
+            if not date:
+                date = get_trading_calendar().previous_trading_day(datetime.now().date())
+            
+            tracked_indices = Index.query.filter(tracked_index_condition()).all()
+            
+            for index in tracked_indices:
                 result = self.calculate_index_metrics(index.id, date)
                 if result:
                     logger.info(f"指数 {index.name} ({index.code}): "
@@ -612,12 +798,12 @@ class Calculator:
                               f"区间={result['percentile_range']}, "
                               f"综合分数={result['composite_score']:.2f}")
             
-            # 3. 计算目标仓位
+            # 计算目标仓位（自选 + 各组合）
             self.calculate_all_positions(date)
-            
-            logger.info(f"{date} 的每日计算完成")
+            self.calculate_portfolio_positions(date)
+            bump_data_version()
             return True
             
         except Exception as e:
-            logger.error(f"每日计算失败: {str(e)}")
+            logger.error(f"计算自选指数指标失败: {str(e)}")
             return False
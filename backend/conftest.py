@@ -0,0 +1,23 @@
+"""
+测试公共夹具：每个测试使用独立的临时 SQLite 数据库
+"""
+import pytest
+from app_factory import create_app
+from models import db
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """完整应用（读接口 + 写接口），已创建数据表并进入应用上下文"""
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "test.db"}')
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
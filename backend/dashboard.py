@@ -0,0 +1,198 @@
+"""仪表盘数据与推送
+
+build_dashboard() 组装仪表盘数据（自选指数最新指标与估值、最新股债性价比），
+/api/dashboard 与推送接口共用，同一进程内按数据版本号缓存。
+
+dashboard_events() 生成 Server-Sent Events 事件流：连接时推送一次完整数据（snapshot），
+之后按间隔轮询数据版本号，版本号变化（每日任务计算完成、修改人为权重、切换自选等）时
+只推送有变化的指数和股债性价比（delta）。版本号不变时每次轮询只读一行配置，
+长时间打开页面的客户端不再定时重新拉取整个仪表盘。
+
+同步（WSGI）事件流每个连接占用一个线程并各自轮询，只用于开发环境（python app.py）：
+连接最长保持 STREAM_MAX_LIFETIME 秒后结束，浏览器按 retry 间隔自动重连，
+重连时带上的 Last-Event-ID 与当前数据版本号一致则不再重发完整数据。
+生产环境的推送由 asgi_app.py 提供（每个进程只有一个轮询任务）。
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from models import db, Index, IndexHistory, CalculatedMetrics, StockBondRatio, latest_index_rows
+from data_version import get_data_version
+
+logger = logging.getLogger(__name__)
+
+# 数据版本号轮询间隔（秒）
+POLL_INTERVAL = 2
+# 无数据变化时的心跳间隔（秒），保持代理连接并及时发现已断开的客户端
+HEARTBEAT_INTERVAL = 15
+# 同步事件流的最长连接时间（秒），到期后结束响应释放线程，由浏览器重连
+STREAM_MAX_LIFETIME = 300
+# 浏览器重连等待时间（毫秒）
+RECONNECT_DELAY_MS = 1000
+
+_cache_lock = threading.Lock()
+_cache = {'version': None, 'payload': None}
+
+
+def _load_dashboard():
+    """查询仪表盘数据（自选指数的最新指标和行情各一次查询）"""
+    latest_ratio = StockBondRatio.query.order_by(StockBondRatio.date.desc()).first()
+
+    favorite_indices = Index.query.filter_by(is_favorite=True).all()
+    favorite_ids = [index.id for index in favorite_indices]
+    metrics = latest_index_rows(CalculatedMetrics, favorite_ids)
+    histories = latest_index_rows(IndexHistory, favorite_ids)
+
+    return dashboard_payload(latest_ratio, favorite_indices, metrics, histories)
+
+
+def dashboard_payload(latest_ratio, favorite_indices, metrics, histories):
+    """由查询结果组装仪表盘数据（同步接口与异步接口共用）
+
+    Args:
+        latest_ratio: 最新股债性价比记录
+        favorite_indices: 自选指数列表
+        metrics: index_id -> 最新计算指标
+        histories: index_id -> 最新行情
+
+    Returns:
+        dict: 仪表盘数据，没有计算指标的指数不包含在内
+    """
+    indices_data = []
+    for index in favorite_indices:
+        latest_metrics = metrics.get(index.id)
+        latest_history = histories.get(index.id)
+        if latest_metrics:
+            indices_data.append({
+                'index': index.to_dict(),
+                'metrics': latest_metrics.to_dict(),
+                'valuation': {
+                    'pe_ttm': latest_history.pe_ttm if latest_history else None,
+                    'pb': latest_history.pb if latest_history else None,
+                    'close': latest_history.close if latest_history else None
+                }
+            })
+
+    return {
+        'stock_bond_ratio': latest_ratio.to_dict() if latest_ratio else None,
+        'indices': indices_data,
+        'update_time': datetime.now().isoformat()
+    }
+
+
+def build_dashboard(version=None):
+    """仪表盘数据（按数据版本号缓存，版本号不变时直接返回缓存）
+
+    Args:
+        version: 数据版本号，默认读取当前版本号
+
+    Returns:
+        dict: 仪表盘数据
+    """
+    if version is None:
+        version = get_data_version()
+
+    with _cache_lock:
+        if _cache['version'] == version:
+            return _cache['payload']
+
+    payload = _load_dashboard()
+    with _cache_lock:
+        _cache['version'] = version
+        _cache['payload'] = payload
+    return payload
+
+
+def dashboard_delta(previous, current):
+    """比较两份仪表盘数据
+
+    Args:
+        previous: 客户端已有的仪表盘数据
+        current: 最新仪表盘数据
+
+    Returns:
+        dict: 差异，没有变化时返回 None。包含:
+            indices: 新增或有变化的指数条目
+            removed: 已移出自选的指数 id
+            order: 最新的指数 id 顺序
+            stock_bond_ratio: 仅在变化时包含
+            update_time: 数据生成时间
+    """
+    old = {item['index']['id']: item for item in previous['indices']}
+    new = {item['index']['id']: item for item in current['indices']}
+
+    delta = {
+        'indices': [item for index_id, item in new.items() if old.get(index_id) != item],
+        'removed': [index_id for index_id in old if index_id not in new],
+        'order': list(new),
+    }
+    if current['stock_bond_ratio'] != previous['stock_bond_ratio']:
+        delta['stock_bond_ratio'] = current['stock_bond_ratio']
+
+    if not delta['indices'] and not delta['removed'] and list(old) == delta['order'] \
+            and 'stock_bond_ratio' not in delta:
+        return None
+
+    delta['update_time'] = current['update_time']
+    return delta
+
+
+def _event(name, version, data):
+    return f"event: {name}\nid: {version}\ndata: {current_app.json.dumps(data)}\n\n"
+
+
+def dashboard_events(poll_interval=POLL_INTERVAL, heartbeat_interval=HEARTBEAT_INTERVAL,
+                     max_lifetime=STREAM_MAX_LIFETIME, last_event_id=None):
+    """仪表盘 SSE 事件流（需在请求上下文中迭代，见 stream_with_context）
+
+    每次查询后关闭会话，连接在轮询间隔内不占用数据库连接。
+
+    Args:
+        poll_interval: 数据版本号轮询间隔（秒）
+        heartbeat_interval: 心跳间隔（秒）
+        max_lifetime: 最长连接时间（秒），到期后结束，浏览器自动重连
+        last_event_id: 重连时浏览器发送的 Last-Event-ID（客户端已有数据的版本号）
+
+    Yields:
+        str: SSE 消息（重连间隔、snapshot、delta 事件或心跳注释）
+    """
+    deadline = time.monotonic() + max_lifetime
+    try:
+        version = get_data_version()
+        payload = build_dashboard(version)
+    finally:
+        db.session.close()
+    yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+    if last_event_id != str(version):
+        yield _event('snapshot', version, payload)
+
+    idle = 0
+    while time.monotonic() + poll_interval <= deadline:
+        time.sleep(poll_interval)
+        message = None
+        try:
+            current = get_data_version()
+            if current != version:
+                latest = build_dashboard(current)
+                delta = dashboard_delta(payload, latest)
+                version, payload = current, latest
+                if delta is not None:
+                    message = _event('delta', version, delta)
+        except Exception as e:
+            logger.error(f"推送仪表盘数据失败: {str(e)}")
+            db.session.rollback()
+        finally:
+            db.session.close()
+
+        if message is not None:
+            idle = 0
+        else:
+            idle += poll_interval
+            if idle >= heartbeat_interval:
+                idle = 0
+                message = ': keepalive\n\n'
+
+        if message is not None:
+            yield message
@@ -1,8 +1,12 @@
-import akshare as ak
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from models import db, Index, IndexHistory, IndexConstituent, StockFinancial, BondYield
+from stock_roe import refresh_stock_ttm_roe
+from data_version import bump_data_version
+from staging import merge_frame
+from financial_planner import FinancialRefreshPlanner
+from concurrent.futures import ThreadPoolExecutor
 import time
 import random
 import logging
@@ -12,6 +16,31 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _akshare():
+    """延迟导入 akshare：依赖树很大，只在实际抓取时加载，只读进程不会导入"""
+    import akshare
+    return akshare
+
+
+def _parse_dates(series, fmt='%Y-%m-%d'):
+    """日期列向量化解析为 date，无法解析的为 NaT"""
+    return pd.to_datetime(series.astype(str), format=fmt, errors='coerce').dt.date
+
+
+def _numeric(df, column):
+    """数值列向量化转换，列缺失或无法解析的值为 NaN"""
+    if column not in df:
+        return pd.Series(np.nan, index=df.index)
+    return pd.to_numeric(df[column], errors='coerce')
+
+
+def _text(df, column):
+    """文本列去除首尾空白，缺失值为空字符串"""
+    if column not in df:
+        return pd.Series('', index=df.index)
+    return df[column].fillna('').astype(str).str.strip()
+
+
 def retry_on_failure(max_retries=10, min_delay=2, max_delay=10):
     """
     重试装饰器：API调用失败时自动重试
@@ -85,10 +114,14 @@ class DataFetcher:
     @retry_on_failure(max_retries=10, min_delay=3, max_delay=10)
     def _fetch_indices_data(self):
         """内部方法：获取指数数据（带重试）"""
-        return ak.index_csindex_all()
+        return _akshare().index_csindex_all()
     
     def fetch_all_indices(self):
-        """获取所有中证指数列表"""
+        """获取所有中证指数列表
+
+        采用集合式同步：一次查询载入已有指数，向量化比对出新增/变更/未变行，
+        再用批量插入和批量更新写回，名称未变化的指数不会被写入。
+        """
         try:
             logger.info("开始获取所有中证指数列表...")
             # 获取所有中证指数（带重试机制）
@@ -98,36 +131,63 @@ class DataFetcher:
                 logger.error("获取指数列表失败")
                 return False
             
-            indices = []
-            for _, row in df.iterrows():
-                index_code = str(row.get('指数代码', '')).strip()
-                index_name = str(row.get('指数简称', '')).strip()
-                index_name_full = str(row.get('指数全称', '')).strip()
-                
-                if not index_code:
-                    continue
-                
-                # 检查是否已存在
-                existing = Index.query.filter_by(code=index_code).first()
-                if existing:
-                    existing.name = index_name
-                    existing.name_full = index_name_full
-                    existing.updated_at = datetime.now()
-                else:
-                    index = Index(
-                        code=index_code,
-                        name=index_name,
-                        name_full=index_name_full,
-                        is_favorite=False,
-                        manual_weight=1.0
-                    )
-                    indices.append(index)
+            # 清洗接口数据
+            catalog = pd.DataFrame({
+                'code': df['指数代码'].astype(str).str.strip(),
+                'name': df['指数简称'].fillna('').astype(str).str.strip(),
+                'name_full': df['指数全称'].fillna('').astype(str).str.strip()
+            })
+            catalog = catalog[catalog['code'] != ''].drop_duplicates('code', keep='last')
+            
+            # 一次查询载入已有指数
+            existing = pd.DataFrame(
+                db.session.query(Index.id, Index.code, Index.name, Index.name_full).all(),
+                columns=['id', 'code', 'name_old', 'name_full_old']
+            )
+            merged = catalog.merge(existing, on='code', how='left')
+            
+            is_new = merged['id'].isna()
+            is_changed = ~is_new & (
+                (merged['name'] != merged['name_old'].fillna('')) |
+                (merged['name_full'] != merged['name_full_old'].fillna(''))
+            )
             
-            if indices:
-                db.session.bulk_save_objects(indices)
-                db.session.commit()
+            now = datetime.now()
+            inserts = [
+                {
+                    'code': row.code,
+                    'name': row.name,
+                    'name_full': row.name_full,
+                    'is_favorite': False,
+                    'manual_weight': 1.0,
+                    'created_at': now,
+                    'updated_at': now
+                }
+                for row in merged[is_new].itertuples(index=False)
+            ]
+            updates = [
+                {
+                    'id': int(row.id),
+                    'name': row.name,
+                    'name_full': row.name_full,
+                    'updated_at': now
+                }
+                for row in merged[is_changed].itertuples(index=False)
+            ]
+            
+            if inserts:
+                db.session.bulk_insert_mappings(Index, inserts)
+            if updates:
+                db.session.bulk_update_mappings(Index, updates)
+            db.session.commit()
+            
+            if inserts or updates:
+                bump_data_version(ingest=True)
             
-            logger.info(f"成功获取 {len(df)} 个指数，新增 {len(indices)} 个")
+            logger.info(
+                f"成功获取 {len(catalog)} 个指数，新增 {len(inserts)} 个，"
+                f"更新 {len(updates)} 个，未变化 {len(catalog) - len(inserts) - len(updates)} 个"
+            )
             return True
             
         except Exception as e:
@@ -138,7 +198,7 @@ class DataFetcher:
     @retry_on_failure(max_retries=10, min_delay=3, max_delay=10)
     def _fetch_index_history_data(self, index_code, start_date, end_date):
         """内部方法：获取指数历史数据（带重试）"""
-        df = ak.stock_zh_index_hist_csindex(
+        df = _akshare().stock_zh_index_hist_csindex(
             symbol=index_code,
             start_date=start_date,
             end_date=end_date
@@ -172,54 +232,25 @@ class DataFetcher:
                 logger.error(f"指数 {index_code} 历史数据获取失败")
                 return False
             
-            # 数据清洗和入库
-            records = []
-            for _, row in df.iterrows():
-                date_str = str(row.get('日期', ''))
-                if not date_str:
-                    continue
-                
-                try:
-                    date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                except:
-                    continue
-                
-                # 检查是否已存在
-                existing = IndexHistory.query.filter_by(
-                    index_id=index.id,
-                    date=date_obj
-                ).first()
-                
-                if existing:
-                    # 更新现有记录
-                    existing.open = float(row.get('开盘', 0)) if pd.notna(row.get('开盘')) else None
-                    existing.high = float(row.get('最高', 0)) if pd.notna(row.get('最高')) else None
-                    existing.low = float(row.get('最低', 0)) if pd.notna(row.get('最低')) else None
-                    existing.close = float(row.get('收盘', 0)) if pd.notna(row.get('收盘')) else None
-                    existing.volume = float(row.get('成交量', 0)) if pd.notna(row.get('成交量')) else None
-                    existing.amount = float(row.get('成交金额', 0)) if pd.notna(row.get('成交金额')) else None
-                    existing.pe_ttm = float(row.get('滚动市盈率', 0)) if pd.notna(row.get('滚动市盈率')) else None
-                    existing.sample_count = int(row.get('样本数量', 0)) if pd.notna(row.get('样本数量')) else None
-                else:
-                    # 新增记录
-                    record = IndexHistory(
-                        index_id=index.id,
-                        date=date_obj,
-                        open=float(row.get('开盘', 0)) if pd.notna(row.get('开盘')) else None,
-                        high=float(row.get('最高', 0)) if pd.notna(row.get('最高')) else None,
-                        low=float(row.get('最低', 0)) if pd.notna(row.get('最低')) else None,
-                        close=float(row.get('收盘', 0)) if pd.notna(row.get('收盘')) else None,
-                        volume=float(row.get('成交量', 0)) if pd.notna(row.get('成交量')) else None,
-                        amount=float(row.get('成交金额', 0)) if pd.notna(row.get('成交金额')) else None,
-                        pe_ttm=float(row.get('滚动市盈率', 0)) if pd.notna(row.get('滚动市盈率')) else None,
-                        sample_count=int(row.get('样本数量', 0)) if pd.notna(row.get('样本数量')) else None
-                    )
-                    records.append(record)
-            
-            if records:
-                db.session.bulk_save_objects(records)
-            
+            # 数据清洗（向量化，不持有数据库锁）
+            frame = pd.DataFrame({
+                'index_id': index.id,
+                'date': _parse_dates(df['日期']),
+                'open': _numeric(df, '开盘'),
+                'high': _numeric(df, '最高'),
+                'low': _numeric(df, '最低'),
+                'close': _numeric(df, '收盘'),
+                'volume': _numeric(df, '成交量'),
+                'amount': _numeric(df, '成交金额'),
+                'pe_ttm': _numeric(df, '滚动市盈率'),
+                'sample_count': _numeric(df, '样本数量').round().astype('Int64')
+            })
+            frame = frame[frame['date'].notna()].drop_duplicates('date', keep='last')
+            
+            # 经暂存表一次合并入库（市净率不由该接口提供，已有值保留）
+            merge_frame(IndexHistory, frame, ['index_id', 'date'])
             db.session.commit()
+            bump_data_version(ingest=True)
             logger.info(f"指数 {index_code} 历史数据入库成功，共 {len(df)} 条")
             
             self._random_delay()
@@ -233,7 +264,7 @@ class DataFetcher:
     @retry_on_failure(max_retries=10, min_delay=3, max_delay=10)
     def _fetch_constituents_data(self, index_code):
         """内部方法：获取成份股数据（带重试）"""
-        df = ak.index_stock_cons_weight_csindex(symbol=index_code)
+        df = _akshare().index_stock_cons_weight_csindex(symbol=index_code)
         if df.empty:
             raise Exception(f"指数 {index_code} 返回空成份股数据")
         return df
@@ -262,35 +293,27 @@ class DataFetcher:
             except:
                 date_obj = datetime.now().date()
             
-            # 删除该日期的旧数据
-            IndexConstituent.query.filter_by(
-                index_id=index.id,
-                date=date_obj
-            ).delete()
-            
-            # 插入新数据
-            records = []
-            for _, row in df.iterrows():
-                stock_code = str(row.get('成分券代码', '')).strip()
-                if not stock_code:
-                    continue
-                
-                record = IndexConstituent(
-                    index_id=index.id,
-                    date=date_obj,
-                    stock_code=stock_code,
-                    stock_name=str(row.get('成分券名称', '')).strip(),
-                    stock_name_en=str(row.get('成分券英文名称', '')).strip(),
-                    exchange=str(row.get('交易所', '')).strip(),
-                    weight=float(row.get('权重', 0)) if pd.notna(row.get('权重')) else None
-                )
-                records.append(record)
-            
-            if records:
-                db.session.bulk_save_objects(records)
+            frame = pd.DataFrame({
+                'index_id': index.id,
+                'date': date_obj,
+                'stock_code': _text(df, '成分券代码'),
+                'stock_name': _text(df, '成分券名称'),
+                'stock_name_en': _text(df, '成分券英文名称'),
+                'exchange': _text(df, '交易所'),
+                'weight': _numeric(df, '权重')
+            })
+            frame = frame[frame['stock_code'] != ''].drop_duplicates('stock_code', keep='last')
+            
+            # 经暂存表合并，并删除该日期下已不在成份股中的旧数据
+            if not frame.empty:
+                merge_frame(IndexConstituent, frame, ['index_id', 'date', 'stock_code'], prune=[
+                    IndexConstituent.index_id == index.id,
+                    IndexConstituent.date == date_obj
+                ])
                 db.session.commit()
+                bump_data_version(ingest=True)
             
-            logger.info(f"指数 {index_code} 成份股入库成功，共 {len(records)} 只")
+            logger.info(f"指数 {index_code} 成份股入库成功，共 {len(frame)} 只")
             
             self._random_delay()
             return True
@@ -302,9 +325,13 @@ class DataFetcher:
     
     @retry_on_failure(max_retries=10, min_delay=3, max_delay=10)
     def _fetch_financials_data(self, report_date):
-        """内部方法：获取财务数据（带重试）"""
-        df1 = ak.stock_lrb_em(date=report_date)
-        df2 = ak.stock_zcfz_em(date=report_date)
+        """内部方法：获取财务数据（带重试），利润表与资产负债表并发下载"""
+        ak = _akshare()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            income_future = pool.submit(ak.stock_lrb_em, date=report_date)
+            balance_future = pool.submit(ak.stock_zcfz_em, date=report_date)
+            df1 = income_future.result()
+            df2 = balance_future.result()
         if df1.empty or df2.empty:
             raise Exception(f"报告期 {report_date} 返回空数据")
         # 按照股票代码横向合并
@@ -324,61 +351,33 @@ class DataFetcher:
             
             # 调用akshare接口（带重试）
             df = self._fetch_financials_data(report_date)
-            print(f'{report_date}财务数据抓取成功')
             if df is False or df is None:
                 logger.error(f"报告期 {report_date} 财务数据获取失败")
                 return False
-            
-            records = []
-            for _, row in df.iterrows():
-                stock_code = str(row.get('股票代码', '')).strip()
-                if not stock_code:
-                    continue
-                
-                # 解析报告期
-                try:
-                    date_obj = datetime.strptime(report_date, '%Y%m%d').date()
-                except:
-                    continue
-                
-                # 检查是否已存在
-                existing = StockFinancial.query.filter_by(
-                    stock_code=stock_code,
-                    report_date=date_obj
-                ).first()
-                
-                roe_val = row.get('净资产收益率')
-                stock_name = str(row.get('股票简称', '')).strip()
-                net_profit = float(row.get('净利润', 0)) if pd.notna(row.get('净利润')) else None
-                equity = float(row.get('股东权益合计', 0)) if pd.notna(row.get('股东权益合计')) else None
-
-                if pd.notna(roe_val):
-                    roe_val = float(roe_val)
-                else:
-                    roe_val = None
-
-                if existing:
-                    existing.stock_name = stock_name
-                    existing.net_profit = net_profit
-                    existing.equity = equity
-                    existing.roe = roe_val
-                else:
-                    record = StockFinancial(
-                        stock_code=stock_code,
-                        stock_name=stock_name,
-                        report_date=date_obj,
-                        net_profit=net_profit,
-                        equity=equity,
-                        roe=roe_val
-                    )
-                    records.append(record)
-
-            if records:
-                db.session.bulk_save_objects(records)
-            
+            logger.info(f"报告期 {report_date} 财务数据抓取成功，共 {len(df)} 条")
+            
+            # 解析报告期
+            date_obj = datetime.strptime(report_date, '%Y%m%d').date()
+            
+            frame = pd.DataFrame({
+                'stock_code': _text(df, '股票代码'),
+                'stock_name': _text(df, '股票简称'),
+                'report_date': date_obj,
+                'net_profit': _numeric(df, '净利润'),
+                'equity': _numeric(df, '股东权益合计'),
+                'roe': _numeric(df, '净资产收益率')
+            })
+            frame = frame[frame['stock_code'] != ''].drop_duplicates('stock_code', keep='last')
+            
+            # 经暂存表一次合并入库
+            merge_frame(StockFinancial, frame, ['stock_code', 'report_date'])
             db.session.commit()
             logger.info(f"财务数据入库成功，共 {len(df)} 条")
             
+            # 增量更新该报告期及之后的滚动ROE
+            refresh_stock_ttm_roe(date_obj)
+            bump_data_version(ingest=True)
+            
             self._random_delay()
             return True
             
@@ -390,7 +389,7 @@ class DataFetcher:
     @retry_on_failure(max_retries=10, min_delay=3, max_delay=10)
     def _fetch_bond_yield_data(self):
         """内部方法：获取国债数据（带重试）"""
-        df = ak.bond_zh_us_rate()
+        df = _akshare().bond_zh_us_rate()
         if df.empty:
             raise Exception("国债收益率返回空数据")
         return df
@@ -408,48 +407,24 @@ class DataFetcher:
                 return False
             
             # 筛选10年期数据
-            df_10y = df[['日期', '中国国债收益率10年']]
-            
-            records = []
-            for _, row in df_10y.iterrows():
-                date_str = str(row.get('日期', ''))
-                if not date_str:
-                    continue
-                
-                try:
-                    date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                except:
-                    continue
-                
-                # 检查日期范围
-                if start_date and date_obj < datetime.strptime(start_date, '%Y%m%d').date():
-                    continue
-                if end_date and date_obj > datetime.strptime(end_date, '%Y%m%d').date():
-                    continue
-                
-                # 检查是否已存在
-                existing = BondYield.query.filter_by(date=date_obj).first()
-                
-                yield_val = row.get('中国国债收益率10年')
-                if pd.notna(yield_val):
-                    yield_val = float(yield_val)
-                else:
-                    yield_val = None
-                
-                if existing:
-                    existing.yield_10y = yield_val
-                else:
-                    record = BondYield(
-                        date=date_obj,
-                        yield_10y=yield_val
-                    )
-                    records.append(record)
-            
-            if records:
-                db.session.bulk_save_objects(records)
-            
+            frame = pd.DataFrame({
+                'date': _parse_dates(df['日期']),
+                'yield_10y': _numeric(df, '中国国债收益率10年')
+            })
+            frame = frame[frame['date'].notna()]
+            
+            # 检查日期范围
+            if start_date:
+                frame = frame[frame['date'] >= datetime.strptime(start_date, '%Y%m%d').date()]
+            if end_date:
+                frame = frame[frame['date'] <= datetime.strptime(end_date, '%Y%m%d').date()]
+            frame = frame.drop_duplicates('date', keep='last')
+            
+            # 经暂存表一次合并入库
+            merge_frame(BondYield, frame, ['date'])
             db.session.commit()
-            logger.info(f"国债收益率数据入库成功，共 {len(records)} 条")
+            bump_data_version(ingest=True)
+            logger.info(f"国债收益率数据入库成功，共 {len(frame)} 条")
             
             return True
             
@@ -459,33 +434,39 @@ class DataFetcher:
             return False
     
     def fetch_latest_financials(self):
-        """获取最新季度财务数据"""
+        """按刷新计划获取财务数据
+        
+        只抓取缺失、仍在披露期内或需要收尾的报告期，非披露季不下载任何数据。
+        """
         try:
-            # 获取最近6个季度的财务数据
-            now = datetime.now()
-            year = now.year
-            
-            # 确定最近的报告期
-            if now.month >= 10:
-                quarters = [f"{year}0930", f"{year}0630", f"{year}0331", f"{year-1}1231", f"{year-1}0930", f"{year-1}0630"]
-            elif now.month >= 7:
-                quarters = [f"{year}0630", f"{year}0331", f"{year-1}1231", f"{year-1}0930", f"{year-1}0630", f"{year-1}0331"]
-            elif now.month >= 4:
-                quarters = [f"{year}0331", f"{year-1}1231", f"{year-1}0930", f"{year-1}0630", f"{year-1}0331", f"{year-2}1231"]
-            else:
-                quarters = [f"{year-1}1231", f"{year-1}0930", f"{year-1}0630", f"{year-1}0331", f"{year-2}1231", f"{year-2}0930"]
-
-            # 检查财务数据是否已存在
-            exist_item = StockFinancial.query.first()
-            if exist_item:
-                self.fetch_stock_financials(quarters[0])
-                self._random_delay()
-            else:
-                for quarter in quarters:
-                    self.fetch_stock_financials(quarter)
-                    self._random_delay()
+            planner = FinancialRefreshPlanner()
+            plan = planner.plan()
+            to_fetch = [item for item in plan if item['fetch']]
+            
+            for item in plan:
+                if item['status'] == 'incomplete':
+                    logger.warning(
+                        f"报告期 {item['period']} 财务数据可能不完整: "
+                        f"{item['count']}/{item['expected']} 条"
+                    )
             
-            return True
+            if not to_fetch:
+                logger.info("财务数据均已完整，无需抓取")
+                return True
+            
+            logger.info(
+                "需要抓取的报告期: " +
+                ', '.join(f"{item['period']}({item['status']})" for item in to_fetch)
+            )
+            
+            results = []
+            for item in to_fetch:
+                success = self.fetch_stock_financials(item['period'])
+                if success:
+                    planner.mark_finalized(item['period'])
+                results.append(success)
+            
+            return all(results)
             
         except Exception as e:
             logger.error(f"获取最新财务数据失败: {str(e)}")
@@ -0,0 +1,67 @@
+"""数据版本号
+
+SystemConfig 中的 data_version 计数器：行情、成份股、财务、国债收益率或计算结果
+写入成功后加1。读侧缓存以版本号作为失效依据，
+版本号不变即可直接复用缓存结果。
+
+ingest_version 只在抓取或导入原始数据（行情、成份股、财务、国债收益率）后加1，
+自选、人为权重、组合调整和计算结果写入不会改变它。只依赖原始数据的缓存
+（如全目录估值筛选）以它为失效依据，避免用户操作触发整段历史的重新计算。
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import update, cast, Integer
+from models import db, SystemConfig
+
+logger = logging.getLogger(__name__)
+
+DATA_VERSION_KEY = 'data_version'
+INGEST_VERSION_KEY = 'ingest_version'
+
+
+def _get_version(key):
+    value = db.session.query(SystemConfig.value).filter(SystemConfig.key == key).scalar()
+    return int(value) if value else 0
+
+
+def get_data_version():
+    """当前数据版本号（尚未写入过数据时为0）"""
+    return _get_version(DATA_VERSION_KEY)
+
+
+def get_ingest_version():
+    """当前原始数据入库版本号（尚未入库过数据时为0）"""
+    return _get_version(INGEST_VERSION_KEY)
+
+
+def _increment(key, description):
+    # 单条 UPDATE，多线程写入时不会丢失计数
+    result = db.session.execute(
+        update(SystemConfig)
+        .where(SystemConfig.key == key)
+        .values(value=cast(SystemConfig.value, Integer) + 1, updated_at=datetime.now())
+    )
+    if result.rowcount == 0:
+        db.session.add(SystemConfig(key=key, value='1', description=description))
+
+
+def bump_data_version(ingest=False):
+    """数据版本号加1
+    
+    Args:
+        ingest: 是否为原始数据入库（抓取或导入），是则同时递增 ingest_version
+    
+    Returns:
+        int: 新版本号，失败返回 None
+    """
+    try:
+        _increment(DATA_VERSION_KEY, '数据版本号（数据写入后递增，用于缓存失效）')
+        if ingest:
+            _increment(INGEST_VERSION_KEY, '原始数据入库版本号（抓取或导入后递增，用于只依赖原始数据的缓存失效）')
+        db.session.commit()
+        return get_data_version()
+        
+    except Exception as e:
+        logger.error(f"更新数据版本号失败: {str(e)}")
+        db.session.rollback()
+        return None
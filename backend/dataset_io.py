@@ -0,0 +1,265 @@
+"""数据集导出/导入（Parquet）
+
+把历史行情、成份股、财务、国债收益率和计算结果导出为按年份分区的 Parquet 文件，
+并可批量导回数据库，用于在不同环境之间迁移数据或重建 invest.db，
+避免重新从 akshare 抓取。导出的文件也可直接用于研究分析（pandas/pyarrow 读取）。
+
+用法:
+    python dataset_io.py export <目录> [--tables index_history bond_yields ...]
+    python dataset_io.py import <目录> [--mode replace|append]
+
+依赖 pyarrow（可选依赖，仅导出/导入时需要）。
+"""
+import argparse
+import logging
+import os
+import shutil
+import pandas as pd
+from datetime import date
+from sqlalchemy import select, insert, text
+from data_version import bump_data_version
+from models import (db, Index, IndexHistory, IndexConstituent, StockFinancial,
+                    BondYield, CalculatedMetrics, IndexPercentile, StockBondRatio, SystemConfig,
+                    analyze_database)
+
+try:
+    import pyarrow.dataset as pa_dataset
+except ImportError:
+    pa_dataset = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 数据集表配置：(模型, 分区日期列)
+# 引用指数的表导出时用指数代码代替 index_id，导入时再映射回目标库的 ID
+DATASET_TABLES = {
+    'indices': (Index, None),
+    'index_history': (IndexHistory, 'date'),
+    'index_constituents': (IndexConstituent, 'date'),
+    'stock_financials': (StockFinancial, 'report_date'),
+    'bond_yields': (BondYield, 'date'),
+    'calculated_metrics': (CalculatedMetrics, 'date'),
+    'index_percentiles': (IndexPercentile, 'date'),
+    'stock_bond_ratios': (StockBondRatio, 'date'),
+}
+
+EXPORT_CHUNK_SIZE = 200000
+IMPORT_BATCH_SIZE = 50000
+
+
+def _require_pyarrow():
+    if pa_dataset is None:
+        raise RuntimeError("Parquet 导出/导入需要安装 pyarrow: pip install pyarrow")
+
+
+def _data_columns(model):
+    """需要导出的列（去掉自增主键）"""
+    return [c for c in model.__table__.columns if c.name != 'id']
+
+
+def _date_columns(model):
+    """日期列（Parquet 中以时间戳存储，入库前需转回 date）"""
+    return [c.name for c in model.__table__.columns if c.type.python_type is date]
+
+
+def export_dataset(output_dir, tables=None):
+    """导出数据集为 Parquet
+
+    Args:
+        output_dir: 输出目录，每张表一个子目录，按年份分区
+        tables: 需要导出的表名列表，默认全部
+
+    Returns:
+        dict: 每张表导出的行数
+    """
+    _require_pyarrow()
+    tables = tables or list(DATASET_TABLES)
+    os.makedirs(output_dir, exist_ok=True)
+
+    counts = {}
+    for name in tables:
+        model, partition_column = DATASET_TABLES[name]
+        table_dir = os.path.join(output_dir, name)
+        if os.path.exists(table_dir):
+            shutil.rmtree(table_dir)
+
+        columns = _data_columns(model)
+        if 'index_id' in model.__table__.columns:
+            columns = [c for c in columns if c.name != 'index_id']
+            stmt = select(Index.code.label('index_code'), *columns).join(
+                Index, Index.id == model.__table__.c.index_id
+            )
+        else:
+            stmt = select(*columns)
+
+        total = 0
+        with db.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(stmt)
+            keys = list(result.keys())
+            while True:
+                rows = result.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+
+                chunk = pd.DataFrame(rows, columns=keys)
+                for column in _date_columns(model):
+                    chunk[column] = pd.to_datetime(chunk[column])
+
+                if partition_column:
+                    chunk['year'] = chunk[partition_column].dt.year
+                    chunk.to_parquet(table_dir, partition_cols=['year'], index=False)
+                else:
+                    os.makedirs(table_dir, exist_ok=True)
+                    chunk.to_parquet(os.path.join(table_dir, f'part-{total}.parquet'), index=False)
+                total += len(chunk)
+
+        counts[name] = total
+        logger.info(f"导出 {name} 成功，共 {total} 条")
+
+    return counts
+
+
+def _sync_indices(batches):
+    """按指数代码同步指数目录，返回 代码 -> ID 映射"""
+    existing = dict(db.session.query(Index.code, Index.id).all())
+
+    for frame in batches:
+        frame = frame.astype(object).where(frame.notna(), None)
+        new_rows = [r for r in frame.to_dict('records') if r['code'] not in existing]
+        if new_rows:
+            db.session.execute(insert(Index.__table__), new_rows)
+            existing = dict(db.session.query(Index.code, Index.id).all())
+
+    return existing
+
+
+def _iter_batches(table_dir):
+    """分批读取分区 Parquet 数据集"""
+    dataset = pa_dataset.dataset(table_dir, format='parquet', partitioning='hive')
+    for batch in dataset.to_batches(batch_size=IMPORT_BATCH_SIZE):
+        frame = batch.to_pandas()
+        if 'year' in frame:
+            frame = frame.drop(columns=['year'])
+        yield frame
+
+
+def import_dataset(input_dir, tables=None, mode='replace'):
+    """从 Parquet 数据集导入数据库
+
+    导入期间暂时删除普通二级索引、关闭同步写盘，
+    在单个事务内分批插入，结束后再重建索引。
+
+    Args:
+        input_dir: export_dataset 生成的目录
+        tables: 需要导入的表名列表，默认目录中存在的全部表
+        mode: 'replace' 先清空目标表再导入；'append' 与已有数据按唯一键合并（覆盖）
+
+    Returns:
+        dict: 每张表导入的行数
+    """
+    _require_pyarrow()
+    if mode not in ('replace', 'append'):
+        raise ValueError(f"不支持的导入模式: {mode}")
+
+    tables = tables or [name for name in DATASET_TABLES if os.path.isdir(os.path.join(input_dir, name))]
+    counts = {}
+
+    try:
+        db.session.execute(text('PRAGMA synchronous = OFF'))
+        db.session.execute(text('PRAGMA defer_foreign_keys = ON'))
+
+        # 指数目录总是先同步，用于映射 index_id
+        index_dir = os.path.join(input_dir, 'indices')
+        if os.path.isdir(index_dir):
+            code_to_id = _sync_indices(_iter_batches(index_dir))
+        else:
+            code_to_id = dict(db.session.query(Index.code, Index.id).all())
+
+        for name in tables:
+            if name == 'indices':
+                continue
+
+            model, _ = DATASET_TABLES[name]
+            table = model.__table__
+            table_dir = os.path.join(input_dir, name)
+
+            if mode == 'replace':
+                db.session.execute(table.delete())
+
+            # 导入期间暂缓维护普通索引
+            conn = db.session.connection()
+            deferred_indexes = [idx for idx in table.indexes if not idx.unique]
+            for idx in deferred_indexes:
+                idx.drop(conn, checkfirst=True)
+
+            stmt = insert(table)
+            if mode == 'append':
+                stmt = stmt.prefix_with('OR REPLACE')
+
+            total = 0
+            for frame in _iter_batches(table_dir):
+                if 'index_code' in frame:
+                    frame['index_id'] = frame.pop('index_code').map(code_to_id)
+                    frame = frame[frame['index_id'].notna()].copy()
+                    frame['index_id'] = frame['index_id'].astype(int)
+                for column in _date_columns(model):
+                    frame[column] = pd.to_datetime(frame[column]).dt.date
+
+                records = frame.astype(object).where(frame.notna(), None).to_dict('records')
+                if records:
+                    conn.execute(stmt, records)
+                total += len(records)
+
+            for idx in deferred_indexes:
+                idx.create(conn)
+
+            counts[name] = total
+            logger.info(f"导入 {name} 成功，共 {total} 条")
+
+        config = SystemConfig.query.filter_by(key='data_initialized').first()
+        if config:
+            config.value = 'true'
+        else:
+            db.session.add(SystemConfig(key='data_initialized', value='true', description='数据是否已初始化'))
+
+        db.session.commit()
+
+    except Exception as e:
+        logger.error(f"导入数据集失败: {str(e)}")
+        db.session.rollback()
+        raise
+    finally:
+        db.session.execute(text('PRAGMA synchronous = FULL'))
+
+    # 派生的滚动ROE表随财务数据重建
+    if 'stock_financials' in counts:
+        from stock_roe import refresh_stock_ttm_roe
+        refresh_stock_ttm_roe()
+
+    analyze_database()
+    bump_data_version(ingest=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据集导出/导入（Parquet）')
+    parser.add_argument('action', choices=['export', 'import'])
+    parser.add_argument('path', help='数据集目录')
+    parser.add_argument('--tables', nargs='+', choices=list(DATASET_TABLES), help='指定表，默认全部')
+    parser.add_argument('--mode', choices=['replace', 'append'], default='replace', help='导入模式')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        db.create_all()
+        if args.action == 'export':
+            counts = export_dataset(args.path, args.tables)
+        else:
+            counts = import_dataset(args.path, args.tables, args.mode)
+
+    for name, count in counts.items():
+        print(f'{name}: {count}')
+
+
+if __name__ == '__main__':
+    main()
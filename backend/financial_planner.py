@@ -0,0 +1,145 @@
+"""财务数据刷新计划
+
+根据已入库的各报告期行数与披露期窗口，决定每日任务需要抓取哪些报告期：
+- missing:    尚无数据，需要抓取；
+- filling:    处于披露期内（报告期结束后至法定披露截止日 + 宽限期），仍在陆续披露，需要抓取；
+- finalizing: 披露期已结束但尚未做过收尾抓取，抓取一次补齐最后披露的公司；
+- complete:   已完成收尾抓取，或行数已达到预期（全部公司披露完毕），不再抓取；
+- incomplete: 已完成收尾抓取但行数明显少于预期，不自动抓取，仅提示。
+
+非披露季时所有报告期均为 complete，每日任务不会下载财务数据。
+"""
+import logging
+from datetime import date, datetime, timedelta
+from sqlalchemy import func
+from models import db, StockFinancial, SystemConfig
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 报告期月份 -> (截止月份, 截止日, 是否次年)
+DISCLOSURE_DEADLINES = {
+    3: (4, 30, False),   # 一季报：4月30日前
+    6: (8, 31, False),   # 半年报：8月31日前
+    9: (10, 31, False),  # 三季报：10月31日前
+    12: (4, 30, True),   # 年报：次年4月30日前
+}
+GRACE_DAYS = 7  # 截止日后的宽限期（补充披露、数据源延迟）
+COMPLETE_RATIO = 0.98  # 行数达到预期的比例即视为全部披露
+INCOMPLETE_RATIO = 0.9  # 收尾后低于该比例提示数据不完整
+PERIOD_COUNT = 6  # 需要保留的最近报告期数（计算滚动ROE至少需要5期）
+
+FINAL_KEY_PREFIX = 'financials_final_'
+
+MISSING = 'missing'
+FILLING = 'filling'
+FINALIZING = 'finalizing'
+COMPLETE = 'complete'
+INCOMPLETE = 'incomplete'
+
+FETCH_STATUSES = (MISSING, FILLING, FINALIZING)
+
+
+def recent_periods(today=None, count=PERIOD_COUNT):
+    """最近的报告期（报告期结束日早于今天），按时间倒序"""
+    today = today or datetime.now().date()
+    year = today.year
+    periods = []
+    while len(periods) < count:
+        for month, day in ((12, 31), (9, 30), (6, 30), (3, 31)):
+            period = date(year, month, day)
+            if period < today and len(periods) < count:
+                periods.append(period)
+        year -= 1
+    return periods
+
+
+def disclosure_deadline(period):
+    """报告期法定披露截止日"""
+    month, day, next_year = DISCLOSURE_DEADLINES[period.month]
+    return date(period.year + 1 if next_year else period.year, month, day)
+
+
+class FinancialRefreshPlanner:
+    """财务数据刷新计划"""
+    
+    def __init__(self, today=None):
+        self.today = today or datetime.now().date()
+    
+    def plan(self, periods=None):
+        """生成刷新计划
+        
+        Args:
+            periods: 需要检查的报告期（date 列表），默认最近 PERIOD_COUNT 期
+            
+        Returns:
+            list[dict]: 每个报告期的 period / status / count / expected / deadline / fetch
+        """
+        periods = periods or recent_periods(self.today)
+        
+        counts = dict(
+            db.session.query(StockFinancial.report_date, func.count(StockFinancial.report_date))
+            .group_by(StockFinancial.report_date).all()
+        )
+        finalized = {
+            row.key[len(FINAL_KEY_PREFIX):]
+            for row in SystemConfig.query.filter(SystemConfig.key.like(f'{FINAL_KEY_PREFIX}%')).all()
+        }
+        
+        # 预期行数：已过披露期的报告期中的最大行数（没有则取全部报告期最大值）
+        closed = [c for p, c in counts.items() if self._window_end(p) < self.today]
+        expected = max(closed or counts.values() or [0])
+        
+        plan = []
+        for period in periods:
+            count = counts.get(period, 0)
+            in_window = self.today <= self._window_end(period)
+            
+            reached_expected = bool(closed) and count >= expected * COMPLETE_RATIO
+            
+            if count == 0:
+                status = MISSING
+            elif in_window:
+                status = COMPLETE if reached_expected else FILLING
+            elif reached_expected:
+                status = COMPLETE
+            elif period.strftime('%Y%m%d') not in finalized:
+                status = FINALIZING
+            elif count < expected * INCOMPLETE_RATIO:
+                status = INCOMPLETE
+            else:
+                status = COMPLETE
+            
+            plan.append({
+                'period': period.strftime('%Y%m%d'),
+                'status': status,
+                'count': count,
+                'expected': expected,
+                'deadline': disclosure_deadline(period).strftime('%Y-%m-%d'),
+                'fetch': status in FETCH_STATUSES
+            })
+        
+        return plan
+    
+    def mark_finalized(self, period):
+        """记录报告期已在披露期结束后完成收尾抓取
+        
+        Args:
+            period: 报告期字符串，如 "20240331"
+        """
+        period_date = datetime.strptime(period, '%Y%m%d').date()
+        if self.today <= self._window_end(period_date):
+            return
+        
+        key = f'{FINAL_KEY_PREFIX}{period}'
+        if not SystemConfig.query.filter_by(key=key).first():
+            db.session.add(SystemConfig(
+                key=key,
+                value=self.today.strftime('%Y-%m-%d'),
+                description=f'报告期 {period} 财务数据已完成收尾抓取'
+            ))
+            db.session.commit()
+    
+    @staticmethod
+    def _window_end(period):
+        return disclosure_deadline(period) + timedelta(days=GRACE_DAYS)
@@ -0,0 +1,253 @@
+"""指数行情缺口扫描与定向补抓
+
+抓取失败被重试装饰器吞掉（返回 False）后，index_history 会缺少个别交易日而无人察觉。
+本模块把各指数已入库的日期与参考交易日对比，找出缺口，并只按缺口所在的日期区间重新抓取。
+
+参考交易日取自交易日历（中证800已入库日期，其外按工作日与 holidays.csv 推算，截至上一交易日），
+每个指数只检查其首个入库日期之后的区间（不回补更早的历史）。不在交易日历中的日期
+（如按其他交易所日历发布的指数）不参与比较，也不会让其他指数出现补不上的“缺口”。
+日期映射为参考交易日中的位置后，同一指数相邻两条记录的位置差大于1即为缺口，对所有指数一次完成，无需逐日比较。
+
+补抓后仍缺失的交易日记入 history_gap_attempts 表；数据源可用（本次有补抓成功，或中证800已有上一交易日行情）时
+连续 MAX_REPAIR_ATTEMPTS 次补抓仍为空的交易日视为该指数当日确实没有行情，之后不再扫描和补抓。
+"""
+import logging
+from datetime import date, datetime
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert
+from models import db, Index, IndexHistory, HistoryGapAttempt, tracked_index_condition
+from trading_calendar import CALENDAR_INDEX_CODE, get_trading_calendar
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 同一指数两个缺口之间相隔不超过该交易日数时合并为一次抓取
+DEFAULT_MERGE_WITHIN = 5
+
+# 补抓后仍为空达到该次数的交易日不再补抓
+MAX_REPAIR_ATTEMPTS = 3
+
+
+def _ordinals(dates):
+    return np.fromiter((d.toordinal() for d in dates), dtype=np.int64, count=len(dates))
+
+
+def reference_trading_days(start, end=None):
+    """参考交易日（升序 ordinal 数组）
+
+    Args:
+        start: 起始日期
+        end: 截止日期，默认上一交易日
+    """
+    calendar = get_trading_calendar()
+    end = end or calendar.previous_trading_day(datetime.now().date())
+    return _ordinals(calendar.trading_days(start, end))
+
+
+def _default_index_ids():
+    # 每日维护行情的指数：自选、组合中的指数与中证800
+    return [index_id for index_id, in db.session.query(Index.id).filter(
+        tracked_index_condition() | (Index.code == CALENDAR_INDEX_CODE)
+    ).all()]
+
+
+def _reference_positions(reference, ids, ordinals):
+    """只保留交易日历中的日期，返回 (指数ID数组, 在参考交易日中的位置数组)"""
+    positions = np.searchsorted(reference, ordinals)
+    on_calendar = positions < len(reference)
+    on_calendar[on_calendar] = reference[positions[on_calendar]] == ordinals[on_calendar]
+    return ids[on_calendar], positions[on_calendar]
+
+
+def scan_history_gaps(index_ids=None):
+    """扫描指数行情缺口
+
+    已放弃补抓的交易日（见 MAX_REPAIR_ATTEMPTS）视为已覆盖，不计为缺口。
+
+    Args:
+        index_ids: 指数ID列表，默认自选、组合中的指数与中证800
+
+    Returns:
+        list: [{index_id, code, name, start, end, missing_days}]，start/end 为缺口首尾交易日（date）
+    """
+    index_ids = _default_index_ids() if index_ids is None else list(index_ids)
+    if not index_ids:
+        return []
+
+    rows = db.session.query(IndexHistory.index_id, IndexHistory.date).filter(
+        IndexHistory.index_id.in_(index_ids)
+    ).order_by(IndexHistory.index_id, IndexHistory.date).all()
+    if not rows:
+        return []
+    abandoned = db.session.query(HistoryGapAttempt.index_id, HistoryGapAttempt.date).filter(
+        HistoryGapAttempt.index_id.in_(index_ids),
+        HistoryGapAttempt.attempts >= MAX_REPAIR_ATTEMPTS
+    ).all()
+
+    ids = np.fromiter((index_id for index_id, _ in rows + abandoned), dtype=np.int64, count=len(rows) + len(abandoned))
+    ordinals = _ordinals([d for _, d in rows + abandoned])
+    reference = reference_trading_days(date.fromordinal(int(ordinals.min())))
+    if len(reference) == 0:
+        return []
+
+    # 已覆盖的交易日（入库或已放弃），按 (指数, 位置) 排序去重
+    ids, positions = _reference_positions(reference, ids, ordinals)
+    order = np.lexsort((positions, ids))
+    ids, positions = ids[order], positions[order]
+    keep = np.r_[True, (ids[1:] != ids[:-1]) | (positions[1:] != positions[:-1])]
+    ids, positions = ids[keep], positions[keep]
+    if len(ids) == 0:
+        return []
+
+    # 内部缺口：同一指数相邻两条记录之间跳过了参考交易日
+    inner = np.nonzero((ids[1:] == ids[:-1]) & (np.diff(positions) > 1))[0]
+    # 尾部缺口：最后一条记录之后还有参考交易日
+    last = np.r_[ids[1:] != ids[:-1], True]
+    trailing = last & (positions < len(reference) - 1)
+
+    gap_ids = np.concatenate([ids[inner], ids[trailing]])
+    gap_start = np.concatenate([positions[inner] + 1, positions[trailing] + 1])
+    gap_end = np.concatenate([positions[inner + 1] - 1, np.full(int(trailing.sum()), len(reference) - 1)])
+
+    indices = {index.id: index for index in Index.query.filter(Index.id.in_(np.unique(gap_ids).tolist())).all()}
+    gaps = [
+        {
+            'index_id': int(index_id),
+            'code': indices[index_id].code,
+            'name': indices[index_id].name,
+            'start': date.fromordinal(int(reference[start])),
+            'end': date.fromordinal(int(reference[end])),
+            'missing_days': int(end - start + 1),
+            '_positions': (int(start), int(end)),
+        }
+        for index_id, start, end in zip(gap_ids.tolist(), gap_start.tolist(), gap_end.tolist())
+    ]
+    gaps.sort(key=lambda gap: (gap['code'], gap['start']))
+    return gaps
+
+
+def plan_repairs(gaps, merge_within=DEFAULT_MERGE_WITHIN):
+    """把缺口合并为抓取请求
+
+    同一指数相邻缺口之间已入库的交易日不超过 merge_within 个时合并为一个区间，
+    多抓几天已有数据比多发一次请求便宜。
+
+    Returns:
+        list: [{code, start, end, missing_days}]
+    """
+    requests = []
+    for gap in sorted(gaps, key=lambda gap: (gap['code'], gap['_positions'])):
+        previous = requests[-1] if requests else None
+        if (previous and previous['code'] == gap['code']
+                and gap['_positions'][0] - previous['_end_position'] - 1 <= merge_within):
+            previous['end'] = gap['end']
+            previous['missing_days'] += gap['missing_days']
+            previous['_end_position'] = gap['_positions'][1]
+            continue
+        requests.append({
+            'code': gap['code'],
+            'start': gap['start'],
+            'end': gap['end'],
+            'missing_days': gap['missing_days'],
+            '_end_position': gap['_positions'][1],
+        })
+    for request in requests:
+        request.pop('_end_position')
+    return requests
+
+
+def public_gap(gap):
+    """去掉内部字段、日期转为字符串（用于接口返回）"""
+    return {
+        key: value.strftime('%Y-%m-%d') if isinstance(value, date) else value
+        for key, value in gap.items() if not key.startswith('_')
+    }
+
+
+def repair_history_gaps(fetcher, index_ids=None, merge_within=DEFAULT_MERGE_WITHIN):
+    """扫描缺口并按区间补抓
+
+    Args:
+        fetcher: DataFetcher实例
+        index_ids: 指数ID列表，默认自选、组合中的指数与中证800
+        merge_within: 合并相邻缺口的阈值（交易日数）
+
+    Returns:
+        dict: gaps（补抓前的缺口数）、missing_days、requests（抓取请求，含是否成功）、
+            remaining（补抓后仍存在的缺口，如该指数当日确实无行情），失败返回 None
+    """
+    try:
+        gaps = scan_history_gaps(index_ids)
+        if not gaps:
+            logger.info("指数行情无缺口")
+            return {'gaps': 0, 'missing_days': 0, 'requests': [], 'remaining': []}
+
+        plan = plan_repairs(gaps, merge_within)
+        logger.info(f"发现 {len(gaps)} 处行情缺口（共 {sum(gap['missing_days'] for gap in gaps)} 个交易日），"
+                    f"补抓 {len(plan)} 次")
+
+        for request in plan:
+            request['success'] = bool(fetcher.fetch_index_history(
+                request['code'], request['start'].strftime('%Y%m%d'), request['end'].strftime('%Y%m%d')
+            ))
+
+        # 交易日历可能因补抓的中证800行情而变化
+        calendar = get_trading_calendar(refresh=True)
+        remaining = scan_history_gaps(sorted({gap['index_id'] for gap in gaps}))
+        abandoned = 0
+        if remaining:
+            sample = ', '.join(f"{gap['code']} {gap['start']}~{gap['end']}" for gap in remaining[:10])
+            logger.warning(f"补抓后仍有 {len(remaining)} 处行情缺口: {sample}")
+            if any(request['success'] for request in plan) or _calendar_is_current(calendar):
+                abandoned = _record_attempts(remaining, plan, calendar)
+
+        return {
+            'gaps': len(gaps),
+            'missing_days': sum(gap['missing_days'] for gap in gaps),
+            'requests': [public_gap(request) for request in plan],
+            'remaining': [public_gap(gap) for gap in remaining],
+            'abandoned': abandoned,
+        }
+
+    except Exception as e:
+        logger.error(f"补抓行情缺口失败: {str(e)}")
+        db.session.rollback()
+        return None
+
+
+def _calendar_is_current(calendar):
+    """中证800已有上一交易日行情（数据源可用，补抓为空不是抓取故障所致）"""
+    return calendar.last_known is not None and \
+        calendar.last_known >= calendar.previous_trading_day(datetime.now().date())
+
+
+def _record_attempts(remaining, plan, calendar):
+    """记录补抓后仍缺失的交易日（只记本次请求覆盖的日期），返回本次达到放弃次数的交易日数"""
+    requested = {}
+    for request in plan:
+        requested.setdefault(request['code'], []).append((request['start'], request['end']))
+
+    now = datetime.now()
+    rows = [
+        {'index_id': gap['index_id'], 'date': day, 'attempts': 1, 'last_attempt': now}
+        for gap in remaining
+        for day in calendar.trading_days(gap['start'], gap['end'])
+        if any(start <= day <= end for start, end in requested.get(gap['code'], ()))
+    ]
+    if not rows:
+        return 0
+
+    table = HistoryGapAttempt.__table__
+    statement = insert(table)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['index_id', 'date'],
+        set_={'attempts': table.c.attempts + 1, 'last_attempt': statement.excluded.last_attempt}
+    ), rows)
+    db.session.commit()
+
+    abandoned = db.session.query(HistoryGapAttempt).filter(
+        HistoryGapAttempt.last_attempt == now, HistoryGapAttempt.attempts == MAX_REPAIR_ATTEMPTS
+    ).count()
+    if abandoned:
+        logger.warning(f"{abandoned} 个交易日连续 {MAX_REPAIR_ATTEMPTS} 次补抓仍无行情，不再补抓")
+    return abandoned
@@ -0,0 +1,202 @@
+"""可断点续传的首次数据初始化
+
+初始化按步骤拆分为条目（指数目录、国债收益率、每个指数的历史行情、每个报告期的财务数据、
+历史股债性价比），每个条目完成后写入 InitCheckpoint 表。
+任何原因中断（超时、akshare 故障、进程重启）后再次调用，已完成的条目直接跳过，
+只处理失败或尚未执行的条目。
+
+必需条目完成后即标记为已初始化，其余条目（个别指数行情、报告期、全目录行情）仍未完成时
+可以继续调用补齐，见 resumable()。
+"""
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from models import db, Index, InitCheckpoint, SystemConfig, analyze_database, tracked_index_condition
+from financial_planner import FinancialRefreshPlanner, recent_periods
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DONE = 'done'
+FAILED = 'failed'
+RUNNING = 'running'
+
+CSI800_CODE = '000906'
+
+INITIALIZED_KEY = 'data_initialized'
+FULL_CATALOG_KEY = 'init_full_catalog'  # 曾请求全目录初始化，续传时沿用
+
+# 决定初始化是否完成的条目；其余条目（自选等指数的历史行情、各报告期财务数据）失败时只报告，
+# 不妨碍使用：如刚结束、仍在披露期内的报告期接口返回空数据，之后由每日任务或再次调用补齐
+REQUIRED_ITEMS = (
+    ('catalog', 'all'),
+    ('bond_yield', 'all'),
+    ('index_history', CSI800_CODE),
+    ('stock_bond_ratio', 'all'),
+)
+
+
+class DataInitializer:
+    """首次数据初始化（带检查点）"""
+    
+    def __init__(self, fetcher, calculator):
+        self.fetcher = fetcher
+        self.calculator = calculator
+    
+    def run(self, full_catalog=False):
+        """执行（或继续）初始化
+        
+        Args:
+            full_catalog: 是否抓取全部指数的历史行情（默认只抓中证800、自选指数和组合中的指数）；
+                请求过一次后，之后的续传都按全目录执行
+            
+        Returns:
+            dict: 初始化进度，completed 为 True 表示必需条目全部完成
+        """
+        if full_catalog:
+            self._set_config(FULL_CATALOG_KEY, 'true', '初始化是否抓取全部指数的历史行情')
+        full_catalog = self._is_full_catalog()
+        
+        start_date = (datetime.now() - timedelta(days=3650)).strftime('%Y%m%d')
+        
+        # 1. 指数目录（其余步骤都依赖指数目录，失败则中止）
+        logger.info("1. 获取指数列表...")
+        if not self._run_item('catalog', 'all', self.fetcher.fetch_all_indices):
+            return self.progress()
+        
+        # 2. 国债收益率
+        logger.info("2. 获取国债收益率...")
+        self._run_item('bond_yield', 'all', lambda: self.fetcher.fetch_bond_yield(start_date))
+        
+        # 3. 指数历史行情（中证800用于股债性价比计算）
+        codes = [CSI800_CODE]
+        query = Index.query if full_catalog else Index.query.filter(tracked_index_condition())
+        codes += [code for code, in query.with_entities(Index.code).order_by(Index.code).all() if code != CSI800_CODE]
+        logger.info(f"3. 获取指数历史数据（{len(codes)} 个）...")
+        for code in codes:
+            self._run_item('index_history', code,
+                           lambda code=code: self.fetcher.fetch_index_history(code, start_date))
+        
+        # 4. 财务数据（逐个报告期）
+        logger.info("4. 获取财务数据...")
+        planner = FinancialRefreshPlanner()
+        for period in recent_periods():
+            period_str = period.strftime('%Y%m%d')
+            self._run_item('financials', period_str,
+                           lambda p=period_str: self._fetch_financials(planner, p))
+        
+        # 5. 近10年历史股债性价比（依赖中证800行情与国债收益率）
+        if self._is_done('bond_yield', 'all') and self._is_done('index_history', CSI800_CODE):
+            logger.info("5. 计算近10年历史股债性价比...")
+            self._run_item('stock_bond_ratio', 'all', self.calculator.calculate_historical_stock_bond_ratio)
+        
+        progress = self.progress()
+        if progress['completed']:
+            analyze_database()
+            self._set_config(INITIALIZED_KEY, 'true', '数据是否已初始化')
+            logger.info("数据初始化完成")
+            if progress['incomplete']:
+                logger.warning(f"以下条目未完成，不影响使用，可再次调用补齐: {', '.join(progress['incomplete'])}")
+        else:
+            logger.warning(f"数据初始化未全部完成: {len(progress['failed'])} 项失败，可再次调用继续")
+        
+        return progress
+    
+    def progress(self):
+        """初始化进度统计"""
+        rows = InitCheckpoint.query.all()
+        steps = {}
+        for row in rows:
+            step = steps.setdefault(row.step, {'done': 0, 'failed': 0, 'running': 0})
+            step[row.status if row.status in step else 'running'] += 1
+        
+        required = {f'{step}:{item}' for step, item in REQUIRED_ITEMS}
+        unfinished = [f'{r.step}:{r.item}' for r in rows if r.status != DONE]
+        completed = all(self._is_done(step, item) for step, item in REQUIRED_ITEMS)
+        
+        return {
+            'completed': completed,
+            'steps': steps,
+            'failed': [item for item in unfinished if item in required],
+            'incomplete': [item for item in unfinished if item not in required]
+        }
+    
+    def is_initialized(self):
+        """必需条目是否已完成（已标记为已初始化）"""
+        config = SystemConfig.query.filter_by(key=INITIALIZED_KEY).first()
+        return config is not None and config.value == 'true'
+    
+    def resumable(self, full_catalog=False):
+        """已初始化后是否仍有可以续传的条目
+        
+        失败或中断的非必需条目，以及（请求过全目录初始化时）尚未抓取行情的指数。
+        
+        Args:
+            full_catalog: 本次是否请求全目录初始化
+        """
+        if self.progress()['incomplete']:
+            return True
+        if not (full_catalog or self._is_full_catalog()):
+            return False
+        done_codes = select(InitCheckpoint.item).where(
+            InitCheckpoint.step == 'index_history', InitCheckpoint.status == DONE
+        )
+        return db.session.query(Index.id).filter(~Index.code.in_(done_codes)).first() is not None
+    
+    def _is_full_catalog(self):
+        config = SystemConfig.query.filter_by(key=FULL_CATALOG_KEY).first()
+        return config is not None and config.value == 'true'
+    
+    def _fetch_financials(self, planner, period):
+        success = self.fetcher.fetch_stock_financials(period)
+        if success:
+            planner.mark_finalized(period)
+        return success
+    
+    def _is_done(self, step, item):
+        checkpoint = InitCheckpoint.query.filter_by(step=step, item=item).first()
+        return checkpoint is not None and checkpoint.status == DONE
+    
+    def _run_item(self, step, item, func):
+        """执行单个条目，已完成则跳过
+        
+        Returns:
+            bool: 条目是否已完成
+        """
+        checkpoint = InitCheckpoint.query.filter_by(step=step, item=item).first()
+        if checkpoint and checkpoint.status == DONE:
+            return True
+        
+        if not checkpoint:
+            checkpoint = InitCheckpoint(step=step, item=item, attempts=0)
+            db.session.add(checkpoint)
+        checkpoint.status = RUNNING
+        checkpoint.attempts = (checkpoint.attempts or 0) + 1
+        checkpoint.error = None
+        db.session.commit()
+        
+        try:
+            success = func() is not False
+            error = None if success else '执行失败'
+        except Exception as e:
+            db.session.rollback()
+            success = False
+            error = str(e)
+        
+        checkpoint = InitCheckpoint.query.filter_by(step=step, item=item).first()
+        checkpoint.status = DONE if success else FAILED
+        checkpoint.error = error
+        db.session.commit()
+        
+        if not success:
+            logger.error(f"初始化条目 {step}:{item} 失败: {error}")
+        return success
+    
+    def _set_config(self, key, value, description):
+        config = SystemConfig.query.filter_by(key=key).first()
+        if not config:
+            config = SystemConfig(key=key, value=value, description=description)
+            db.session.add(config)
+        else:
+            config.value = value
+        db.session.commit()
@@ -0,0 +1,134 @@
+"""数据库租约锁
+
+多个进程（或多台主机）共享同一个数据库时，用租约保证同一时间只有一个持有者运行定时任务：
+持有者每隔一段时间续约，超过有效期没有续约视为失效，其他进程可以接管。
+获取和续约都是一条带条件的 UPDATE，由数据库保证原子性，不依赖文件锁或外部服务。
+数据库暂时不可用（如管道大量写入时 SQLite 报 database is locked）时抛出 LeaseError，
+与“租约已被他人持有”（返回 False）区分：前者无法确认持有状态，调用方不应据此停止调度。
+
+租约到期时间按各进程本地时钟计算，多主机部署时主机间的时钟偏差应远小于有效期。
+"""
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import case, or_, update
+from sqlalchemy.exc import IntegrityError
+from models import db, SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseError(Exception):
+    """读写租约时数据库出错，无法确认租约状态"""
+
+
+def default_holder():
+    """当前进程的持有者标识"""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class LeaseLock:
+    """基于 scheduler_leases 表的租约锁（需在应用上下文中调用）"""
+
+    def __init__(self, name, ttl=60, holder=None):
+        """
+        Args:
+            name: 租约名称，同名租约互斥
+            ttl: 有效期（秒），持有者应在有效期内续约
+            holder: 持有者标识，默认主机名:进程号:随机串
+        """
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder or default_holder()
+        self.expires_at = None  # 最近一次成功获取或续约后的到期时间（本地记录）
+
+    def acquire(self):
+        """获取租约；已持有时续约
+
+        租约空闲、已过期或本来就由自己持有时才更新成功。
+
+        Returns:
+            bool: 当前是否持有租约（False 表示已确认由其他持有者持有）
+
+        Raises:
+            LeaseError: 数据库出错，无法确认租约状态
+        """
+        table = SchedulerLease.__table__
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=self.ttl)
+
+        try:
+            result = db.session.execute(
+                update(table).where(
+                    table.c.name == self.name,
+                    or_(table.c.holder == self.holder, table.c.holder.is_(None), table.c.expires_at < now)
+                ).values(
+                    holder=self.holder,
+                    acquired_at=case((table.c.holder == self.holder, table.c.acquired_at), else_=now),
+                    renewed_at=now,
+                    expires_at=expires_at
+                )
+            )
+            if result.rowcount == 0:
+                if db.session.query(SchedulerLease.id).filter_by(name=self.name).first() is not None:
+                    db.session.rollback()
+                    return False
+                db.session.add(SchedulerLease(
+                    name=self.name, holder=self.holder,
+                    acquired_at=now, renewed_at=now, expires_at=expires_at
+                ))
+            db.session.commit()
+            self.expires_at = expires_at
+            return True
+        except IntegrityError:
+            # 其他进程同时创建了这条租约
+            db.session.rollback()
+            return False
+        except Exception as e:
+            logger.error(f"获取租约 {self.name} 失败: {str(e)}")
+            db.session.rollback()
+            raise LeaseError(str(e)) from e
+
+    def renew(self):
+        """续约（与 acquire 相同：仍由自己持有或尚未被他人接管时成功）
+
+        Returns:
+            bool: 续约后是否持有租约
+
+        Raises:
+            LeaseError: 数据库出错，无法确认租约状态
+        """
+        return self.acquire()
+
+    def still_valid(self):
+        """最近一次成功续约的到期时间未过（续约因数据库出错失败时，据此判断租约是否仍归自己）"""
+        return self.expires_at is not None and self.expires_at > datetime.now()
+
+    def release(self):
+        """释放租约（只释放自己持有的），其他进程无需等待过期即可接管
+
+        Returns:
+            bool: 成功返回True
+        """
+        table = SchedulerLease.__table__
+        try:
+            db.session.execute(
+                update(table).where(
+                    table.c.name == self.name, table.c.holder == self.holder
+                ).values(holder=None, expires_at=None)
+            )
+            db.session.commit()
+            self.expires_at = None
+            return True
+        except Exception as e:
+            logger.error(f"释放租约 {self.name} 失败: {str(e)}")
+            db.session.rollback()
+            return False
+
+    def is_held(self):
+        """当前是否持有未过期的租约（只读，不续约）"""
+        lease = SchedulerLease.query.filter_by(name=self.name).first()
+        return (lease is not None and lease.holder == self.holder
+                and lease.expires_at is not None and lease.expires_at > datetime.now())
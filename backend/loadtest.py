@@ -0,0 +1,173 @@
+"""读接口压测
+
+对一个或多个服务地址（如 Flask 只读入口与异步入口）用相同的请求组合施压，
+统计吞吐量和 p50/p90/p99 延迟。可同时保持若干仪表盘推送长连接（--stream-clients），
+模拟整天打开页面的客户端占用服务端连接时普通请求的延迟。
+
+用法:
+    python read_app.py                                   # Flask 只读入口，端口 5001
+    uvicorn asgi_app:app --port 5002                     # 异步只读入口
+    python loadtest.py --target flask=http://localhost:5001 --target asgi=http://localhost:5002 \\
+        --concurrency 100 --duration 20 --stream-clients 200
+"""
+import argparse
+import http.client
+import itertools
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = [
+    '/api/dashboard',
+    '/api/system/status',
+    '/api/indices?is_favorite=true',
+    '/api/indices',
+    '/api/indices/1?days=3650',
+    '/api/stock-bond-ratio',
+]
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def _summarize(latencies, errors, elapsed):
+    """请求数、错误数、错误率、吞吐量与延迟分位数（毫秒）"""
+    latencies = sorted(latencies)
+    ms = lambda value: value * 1000 if value is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'error_rate': errors / len(latencies) if latencies else 0,
+        'rps': len(latencies) / elapsed if elapsed else 0,
+        'p50': ms(_percentile(latencies, 0.50)),
+        'p90': ms(_percentile(latencies, 0.90)),
+        'p99': ms(_percentile(latencies, 0.99)),
+        'max': ms(latencies[-1] if latencies else None),
+    }
+
+
+def _connect(base_url, timeout):
+    parts = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    return connection_class(parts.netloc, timeout=timeout)
+
+
+def _hold_stream(base_url, stop, connected, timeout):
+    """保持一个仪表盘推送连接直到 stop 被设置"""
+    connection = _connect(base_url, timeout)
+    try:
+        connection.request('GET', '/api/stream/dashboard')
+        response = connection.getresponse()
+        connected.append(response.status == 200)
+        while not stop.is_set() and response.readline():
+            pass
+    except (OSError, http.client.HTTPException):
+        connected.append(False)
+    finally:
+        connection.close()
+
+
+def run_load(base_url, paths, concurrency, duration, stream_clients=0, timeout=30, until=None):
+    """对一个服务地址施压
+
+    Args:
+        base_url: 服务地址，如 http://localhost:5001
+        paths: 请求路径列表（各并发客户端轮流请求）
+        concurrency: 并发客户端数
+        duration: 持续时间（秒）
+        stream_clients: 同时保持的 /api/stream/dashboard 长连接数
+        timeout: 单个请求超时（秒）
+        until: 可选的无参函数，到时后继续施压直到它返回 True（如等待写入任务完成一轮）
+
+    Returns:
+        dict: requests、errors、error_rate、rps、p50/p90/p99/max（毫秒）、
+            streams（成功建立的长连接数）、paths（各路径的同样统计）
+    """
+    stop = threading.Event()
+    connected = []
+    streams = [
+        threading.Thread(target=_hold_stream, args=(base_url, stop, connected, timeout), daemon=True)
+        for _ in range(stream_clients)
+    ]
+    for thread in streams:
+        thread.start()
+    while len(connected) < stream_clients and not stop.wait(0.1):
+        pass
+
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset):
+        # 每个客户端复用一个 keep-alive 连接，出错后重连
+        connection = _connect(base_url, timeout)
+        local_samples = []
+        for path in itertools.islice(itertools.cycle(paths), offset, None):
+            if time.perf_counter() >= deadline and (until is None or until()):
+                break
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = _connect(base_url, timeout)
+                ok = False
+            local_samples.append((path, time.perf_counter() - start, ok))
+        connection.close()
+        with lock:
+            samples.extend(local_samples)
+
+    started = time.perf_counter()
+    clients = [threading.Thread(target=client, args=(i % len(paths),)) for i in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    by_path = {}
+    for path, latency, ok in samples:
+        by_path.setdefault(path, []).append((latency, ok))
+    return {
+        **_summarize([latency for _, latency, _ in samples], sum(not ok for _, _, ok in samples), elapsed),
+        'streams': sum(connected),
+        'paths': {
+            path: _summarize([latency for latency, _ in items], sum(not ok for _, ok in items), elapsed)
+            for path, items in by_path.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='读接口压测')
+    parser.add_argument('--target', action='append', required=True,
+                        help='名称=服务地址，可重复，如 flask=http://localhost:5001')
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS, help='请求路径')
+    parser.add_argument('--concurrency', type=int, default=50, help='并发客户端数')
+    parser.add_argument('--duration', type=float, default=20, help='每个服务的压测时间（秒）')
+    parser.add_argument('--stream-clients', type=int, default=0, help='同时保持的仪表盘推送长连接数')
+    args = parser.parse_args()
+
+    results = []
+    for target in args.target:
+        name, _, url = target.partition('=')
+        print(f'压测 {name} ({url})，并发 {args.concurrency}，长连接 {args.stream_clients}，{args.duration:g} 秒...')
+        results.append((name, run_load(url.rstrip('/'), args.paths, args.concurrency, args.duration,
+                                       args.stream_clients)))
+
+    print(f"\n{'服务':<10}{'请求数':>8}{'错误':>6}{'长连接':>7}{'RPS':>9}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for name, r in results:
+        fmt = lambda value: f'{value:10.1f}' if value is not None else f"{'-':>10}"
+        print(f"{name:<10}{r['requests']:>8}{r['errors']:>6}{r['streams']:>7}{r['rps']:>9.1f}"
+              f"{fmt(r['p50'])}{fmt(r['p90'])}{fmt(r['p99'])}{fmt(r['max'])}")
+
+
+if __name__ == '__main__':
+    main()
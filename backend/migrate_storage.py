@@ -0,0 +1,143 @@
+"""时序表存储布局迁移
+
+把已有数据库的时序表（index_history、calculated_metrics、stock_financials、stock_ttm_roe、
+bond_yields、stock_bond_ratios）迁移到 COMPACT_STORAGE 环境变量选择的布局：
+- 紧凑布局：去掉自增 id，以自然键为主键（WITHOUT ROWID），日期存为整数 ordinal；
+- 标准布局：自增 id + 自然键唯一约束，日期存为文本。
+
+每张表在同一个事务内重建（新表按主键顺序插入），已是目标布局的表跳过，
+全部完成后 VACUUM 回收空间并更新统计信息。
+
+用法:
+    COMPACT_STORAGE=1 python migrate_storage.py    # 迁移到紧凑布局
+    python migrate_storage.py                      # 迁回标准布局
+"""
+import logging
+import os
+from datetime import date, datetime
+from sqlalchemy import inspect, text
+from models import (db, COMPACT_STORAGE, IndexHistory, CalculatedMetrics, StockFinancial,
+                    StockTTMRoe, BondYield, StockBondRatio, analyze_database)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 参与迁移的时序表及其自然键
+TIME_SERIES_TABLES = [
+    (IndexHistory, ('index_id', 'date')),
+    (CalculatedMetrics, ('index_id', 'date')),
+    (StockFinancial, ('stock_code', 'report_date')),
+    (StockTTMRoe, ('stock_code', 'report_date')),
+    (BondYield, ('date',)),
+    (StockBondRatio, ('date',)),
+]
+
+# SQLite 儒略日与 Python date ordinal 的差值：julianday('0001-01-01') = 1721425.5 对应 ordinal 1
+JULIAN_DAY_OFFSET = 1721424.5
+
+
+def _is_compact(conn, table_name):
+    """已有表是否为紧凑布局（没有 id 列）"""
+    columns = [row[1] for row in conn.execute(text(f'PRAGMA table_info("{table_name}")'))]
+    return 'id' not in columns
+
+
+def _select_expression(column):
+    """读取旧表列并转换为目标布局的存储格式"""
+    name = f'"{column.name}"'
+    if column.type.python_type is not date:
+        return name
+    if COMPACT_STORAGE:
+        return f'CAST(julianday({name}) - {JULIAN_DAY_OFFSET} AS INTEGER)'
+    return f'date({name} + {JULIAN_DAY_OFFSET})'
+
+
+def migrate_table(model, key):
+    """把一张表重建为目标布局
+
+    Args:
+        model: 模型类
+        key: 自然键列名（新表按此顺序插入）
+
+    Returns:
+        int: 迁移的行数；已是目标布局或表不存在时返回 None
+    """
+    table = model.__table__
+    conn = db.session.connection()
+
+    if not inspect(conn).has_table(table.name):
+        return None
+    source_compact = _is_compact(conn, table.name)
+    if source_compact == COMPACT_STORAGE:
+        logger.info(f"{table.name} 已是目标布局，跳过")
+        return None
+
+    # 索引名在库内全局唯一，先删除旧表的索引再重命名旧表
+    old_name = f'{table.name}_old'
+    for (index_name,) in conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"
+    ), {'table': table.name}).all():
+        conn.execute(text(f'DROP INDEX "{index_name}"'))
+    conn.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"'))
+
+    table.create(conn)
+
+    columns = [c for c in table.columns if c.name != 'id']
+    insert_list = ', '.join(f'"{c.name}"' for c in columns)
+    select_list = ', '.join(_select_expression(c) for c in columns)
+    order_by = ', '.join(f'"{name}"' for name in key)
+    conn.execute(text(
+        f'INSERT INTO "{table.name}" ({insert_list}) SELECT {select_list} FROM "{old_name}" ORDER BY {order_by}'
+    ))
+    count = conn.execute(text(f'SELECT COUNT(*) FROM "{table.name}"')).scalar()
+    conn.execute(text(f'DROP TABLE "{old_name}"'))
+    return count
+
+
+def migrate_storage():
+    """迁移全部时序表到目标布局
+
+    Returns:
+        dict: 表名 -> 迁移的行数（跳过的表不包含在内）
+    """
+    layout = '紧凑' if COMPACT_STORAGE else '标准'
+    start = datetime.now()
+    counts = {}
+
+    for model, key in TIME_SERIES_TABLES:
+        try:
+            count = migrate_table(model, key)
+            db.session.commit()
+            if count is not None:
+                counts[model.__tablename__] = count
+                logger.info(f"{model.__tablename__} 迁移到{layout}布局成功，共 {count} 条")
+        except Exception as e:
+            logger.error(f"{model.__tablename__} 迁移失败: {str(e)}")
+            db.session.rollback()
+            raise
+
+    if counts:
+        with db.engine.connect() as conn:
+            conn.execution_options(isolation_level='AUTOCOMMIT').execute(text('VACUUM'))
+        analyze_database()
+
+    logger.info(f"存储布局迁移完成，耗时 {(datetime.now() - start).total_seconds():.2f} 秒")
+    return counts
+
+
+def main():
+    from app import app
+    with app.app_context():
+        path = db.engine.url.database
+        size_before = os.path.getsize(path) if path and os.path.exists(path) else None
+        counts = migrate_storage()
+        size_after = os.path.getsize(path) if path and os.path.exists(path) else None
+
+    for name, count in counts.items():
+        print(f'{name}: {count}')
+    if size_before and size_after:
+        print(f'数据库大小: {size_before / 1024 / 1024:.1f} MB -> {size_after / 1024 / 1024:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,112 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import text, and_, func, or_, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.types import TypeDecorator
+from datetime import date, datetime
+import logging
+import os
 
 db = SQLAlchemy()
 
+logger = logging.getLogger(__name__)
+
+# 紧凑存储模式：时序表去掉自增 id，以自然键为主键（WITHOUT ROWID 聚簇存储），日期存为整数 ordinal。
+# 已有数据库切换模式前需运行 migrate_storage.py
+COMPACT_STORAGE = os.environ.get('COMPACT_STORAGE', '').lower() in ('1', 'true', 'yes')
+
+
+class OrdinalDate(TypeDecorator):
+    """以整数（date.toordinal()）存储的日期类型，读写时与 date 相互转换"""
+    impl = db.Integer
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, datetime):
+            value = value.date()
+        return value.toordinal()
+    
+    def process_result_value(self, value, dialect):
+        return date.fromordinal(value) if value is not None else None
+    
+    @property
+    def python_type(self):
+        return date
+
+
+# 时序表日期列类型
+StorageDate = OrdinalDate if COMPACT_STORAGE else db.Date
+
+
+def natural_key_args(name, *columns):
+    """时序表的 __table_args__：紧凑模式下自然键即主键（WITHOUT ROWID），否则为唯一约束"""
+    if COMPACT_STORAGE:
+        return {'sqlite_with_rowid': False}
+    return (db.UniqueConstraint(*columns, name=name),)
+
+
+def natural_key_map(model, key_columns, *criteria):
+    """查询已存在记录：自然键 -> 主键字典
+    
+    用于 bulk_update_mappings，与存储模式无关（标准模式主键为 id，紧凑模式主键为自然键）。
+    
+    Args:
+        model: 模型类
+        key_columns: 自然键列名列表
+        criteria: 过滤条件
+    
+    Returns:
+        dict: 单列自然键为值本身，多列为元组
+    """
+    primary_key = model.__mapper__.primary_key
+    rows = db.session.query(
+        *[getattr(model, column) for column in key_columns], *primary_key
+    ).filter(*criteria).all()
+    
+    count = len(key_columns)
+    return {
+        (tuple(row[:count]) if count > 1 else row[0]): {
+            column.key: value for column, value in zip(primary_key, row[count:])
+        }
+        for row in rows
+    }
+
+
+def latest_rows_select(model, index_ids=None):
+    """各指数最新日期一行的查询语句（同步会话与异步会话共用）
+    
+    从指数表出发，每个指数用 (index_id, date) 索引取最大日期再定位该行；
+    比对整张时序表 GROUP BY index_id 快两个数量级（全目录 800 个指数约 10ms 对 700ms）。
+    
+    Args:
+        model: 按 index_id、date 存储的模型类（IndexHistory、CalculatedMetrics 等）
+        index_ids: 指数ID集合，默认全部指数
+    """
+    inner = aliased(model)
+    latest_date = select(func.max(inner.date)).where(inner.index_id == Index.id).scalar_subquery()
+    
+    query = select(model).select_from(Index).join(
+        model, and_(model.index_id == Index.id, model.date == latest_date)
+    )
+    if index_ids is not None:
+        query = query.where(Index.id.in_(list(index_ids)))
+    return query
+
+
+def latest_index_rows(model, index_ids=None):
+    """各指数最新日期的一行
+    
+    Args:
+        model: 按 index_id、date 存储的模型类
+        index_ids: 指数ID集合，默认全部指数
+    
+    Returns:
+        dict: index_id -> 记录
+    """
+    rows = db.session.scalars(latest_rows_select(model, index_ids)).all()
+    return {row.index_id: row for row in rows}
+
 
 class Index(db.Model):
     """指数基本信息表"""
@@ -36,9 +140,11 @@ class IndexHistory(db.Model):
     """指数历史数据表"""
     __tablename__ = 'index_history'
     
-    id = db.Column(db.Integer, primary_key=True)
-    index_id = db.Column(db.Integer, db.ForeignKey('indices.id'), nullable=False, index=True)
-    date = db.Column(db.Date, nullable=False, index=True)
+    if not COMPACT_STORAGE:
+        id = db.Column(db.Integer, primary_key=True)
+    index_id = db.Column(db.Integer, db.ForeignKey('indices.id'), nullable=False,
+                         index=not COMPACT_STORAGE, primary_key=COMPACT_STORAGE)
+    date = db.Column(StorageDate, nullable=False, index=True, primary_key=COMPACT_STORAGE, autoincrement=False)
     open = db.Column(db.Float)
     high = db.Column(db.Float)
     low = db.Column(db.Float)
@@ -49,9 +155,7 @@ class IndexHistory(db.Model):
     pb = db.Column(db.Float)  # 市净率
     sample_count = db.Column(db.Integer)  # 样本数量
     
-    __table_args__ = (
-        db.UniqueConstraint('index_id', 'date', name='uix_index_date'),
-    )
+    __table_args__ = natural_key_args('uix_index_date', 'index_id', 'date')
     
     def to_dict(self):
         return {
@@ -90,27 +194,45 @@ class StockFinancial(db.Model):
     """股票财务数据表"""
     __tablename__ = 'stock_financials'
     
-    id = db.Column(db.Integer, primary_key=True)
-    stock_code = db.Column(db.String(20), nullable=False, index=True)
+    if not COMPACT_STORAGE:
+        id = db.Column(db.Integer, primary_key=True)
+    stock_code = db.Column(db.String(20), nullable=False, index=not COMPACT_STORAGE, primary_key=COMPACT_STORAGE)
     stock_name = db.Column(db.String(100))
-    report_date = db.Column(db.Date, nullable=False, index=True)  # 报告期
+    report_date = db.Column(StorageDate, nullable=False, index=True, primary_key=COMPACT_STORAGE, autoincrement=False)  # 报告期
     net_profit = db.Column(db.Float)  # 净利润
     equity = db.Column(db.Float)  # 净资产
     roe = db.Column(db.Float)  # 净资产收益率（%）
     
-    __table_args__ = (
-        db.UniqueConstraint('stock_code', 'report_date', name='uix_stock_report'),
-    )
+    __table_args__ = natural_key_args('uix_stock_report', 'stock_code', 'report_date')
+
+
+class StockTTMRoe(db.Model):
+    """股票滚动ROE表（由财务数据派生，财务数据入库时增量更新）"""
+    __tablename__ = 'stock_ttm_roe'
+    
+    if not COMPACT_STORAGE:
+        id = db.Column(db.Integer, primary_key=True)
+    stock_code = db.Column(db.String(20), nullable=False, index=not COMPACT_STORAGE, primary_key=COMPACT_STORAGE)
+    report_date = db.Column(StorageDate, nullable=False, index=True, primary_key=COMPACT_STORAGE, autoincrement=False)  # 报告期
+    ttm_net_profit = db.Column(db.Float)  # 近四季度单季净利润之和
+    avg_equity = db.Column(db.Float)  # 近四季度净资产均值
+    roe = db.Column(db.Float)  # 滚动ROE（%）
+    
+    __table_args__ = natural_key_args('uix_ttm_roe_stock_report', 'stock_code', 'report_date')
 
 
 class BondYield(db.Model):
     """国债收益率表"""
     __tablename__ = 'bond_yields'
     
-    id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, unique=True, nullable=False, index=True)
+    if not COMPACT_STORAGE:
+        id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(StorageDate, unique=not COMPACT_STORAGE, nullable=False, index=not COMPACT_STORAGE,
+                     primary_key=COMPACT_STORAGE, autoincrement=False)
     yield_10y = db.Column(db.Float)  # 10年国债收益率（%）
     
+    __table_args__ = {'sqlite_with_rowid': not COMPACT_STORAGE}
+    
     def to_dict(self):
         return {
             'date': self.date.strftime('%Y-%m-%d'),
@@ -122,9 +244,11 @@ class CalculatedMetrics(db.Model):
     """计算指标表（每日计算结果）"""
     __tablename__ = 'calculated_metrics'
     
-    id = db.Column(db.Integer, primary_key=True)
-    index_id = db.Column(db.Integer, db.ForeignKey('indices.id'), nullable=False, index=True)
-    date = db.Column(db.Date, nullable=False, index=True)
+    if not COMPACT_STORAGE:
+        id = db.Column(db.Integer, primary_key=True)
+    index_id = db.Column(db.Integer, db.ForeignKey('indices.id'), nullable=False,
+                         index=not COMPACT_STORAGE, primary_key=COMPACT_STORAGE)
+    date = db.Column(StorageDate, nullable=False, index=True, primary_key=COMPACT_STORAGE, autoincrement=False)
     
     # 估值分位数
     pe_percentile = db.Column(db.Float)  # PE分位数
@@ -148,9 +272,7 @@ class CalculatedMetrics(db.Model):
     operation_percent = db.Column(db.Float)  # 建议加仓/减仓百分比
     previous_range = db.Column(db.String(20))  # 前一日分位区间
     
-    __table_args__ = (
-        db.UniqueConstraint('index_id', 'date', name='uix_metrics_index_date'),
-    )
+    __table_args__ = natural_key_args('uix_metrics_index_date', 'index_id', 'date')
     
     def to_dict(self):
         return {
@@ -170,18 +292,48 @@ class CalculatedMetrics(db.Model):
         }
 
 
+class IndexPercentile(db.Model):
+    """指数多窗口估值分位数表（与 calculated_metrics 同日计算）"""
+    __tablename__ = 'index_percentiles'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    index_id = db.Column(db.Integer, db.ForeignKey('indices.id'), nullable=False, index=True)
+    date = db.Column(db.Date, nullable=False, index=True)
+    metric = db.Column(db.String(10), nullable=False)  # 'pe'/'pb'
+    lookback = db.Column(db.String(10), nullable=False)  # 回溯窗口 '3y'/'5y'/'10y'/'all'
+    percentile = db.Column(db.Float)  # 分位数（0-100）
+    sample_count = db.Column(db.Integer)  # 窗口内有效样本数
+    
+    __table_args__ = (
+        db.UniqueConstraint('index_id', 'date', 'metric', 'lookback', name='uix_percentile_index_date_metric_lookback'),
+    )
+    
+    def to_dict(self):
+        return {
+            'date': self.date.strftime('%Y-%m-%d'),
+            'metric': self.metric,
+            'lookback': self.lookback,
+            'percentile': self.percentile,
+            'sample_count': self.sample_count
+        }
+
+
 class StockBondRatio(db.Model):
     """股债性价比表"""
     __tablename__ = 'stock_bond_ratios'
     
-    id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, unique=True, nullable=False, index=True)
+    if not COMPACT_STORAGE:
+        id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(StorageDate, unique=not COMPACT_STORAGE, nullable=False, index=not COMPACT_STORAGE,
+                     primary_key=COMPACT_STORAGE, autoincrement=False)
     csi800_pe = db.Column(db.Float)  # 中证800市盈率
     bond_yield_10y = db.Column(db.Float)  # 10年国债收益率
     ratio = db.Column(db.Float)  # 股债性价比 = 1/PE - 国债收益率
     percentile_10y = db.Column(db.Float)  # 近10年分位数
     stock_allocation = db.Column(db.Float)  # 股票配置比例（%）
     
+    __table_args__ = {'sqlite_with_rowid': not COMPACT_STORAGE}
+    
     def to_dict(self):
         return {
             'date': self.date.strftime('%Y-%m-%d'),
@@ -202,3 +354,204 @@ class SystemConfig(db.Model):
     value = db.Column(db.Text)
     description = db.Column(db.String(200))
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class PipelineStage(db.Model):
+    """每日任务阶段运行状态表"""
+    __tablename__ = 'pipeline_stages'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    status = db.Column(db.String(20))  # 'running'/'success'/'failed'/'skipped'/'blocked'
+    fingerprint = db.Column(db.String(500))  # 最近一次成功运行时的输入指纹
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    duration = db.Column(db.Float)  # 耗时（秒）
+    error = db.Column(db.Text)
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'fingerprint': self.fingerprint,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'duration': self.duration,
+            'error': self.error
+        }
+
+
+class InitCheckpoint(db.Model):
+    """初始化进度检查点表（每个步骤的每个条目一行，用于断点续传）"""
+    __tablename__ = 'init_checkpoints'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    step = db.Column(db.String(50), nullable=False)  # 如 'index_history'
+    item = db.Column(db.String(50), nullable=False)  # 如指数代码、报告期
+    status = db.Column(db.String(20))  # 'running'/'done'/'failed'
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    __table_args__ = (
+        db.UniqueConstraint('step', 'item', name='uix_checkpoint_step_item'),
+    )
+
+
+class HistoryGapAttempt(db.Model):
+    """行情缺口补抓记录（补抓后仍缺失的交易日，多次补抓仍为空即不再补抓）"""
+    __tablename__ = 'history_gap_attempts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    index_id = db.Column(db.Integer, db.ForeignKey('indices.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    attempts = db.Column(db.Integer, default=0)  # 补抓后仍缺失的次数
+    last_attempt = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint('index_id', 'date', name='uix_gap_attempt_index_date'),
+    )
+
+
+class SchedulerLease(db.Model):
+    """跨进程租约表（保证同一时间只有一个定时任务调度器运行）"""
+    __tablename__ = 'scheduler_leases'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    holder = db.Column(db.String(200))  # 持有者标识：主机名:进程号:随机串，释放后为空
+    acquired_at = db.Column(db.DateTime)  # 当前持有者取得租约的时间
+    renewed_at = db.Column(db.DateTime)  # 最近一次续约时间
+    expires_at = db.Column(db.DateTime)  # 到期时间，过期后其他进程可以接管
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'holder': self.holder,
+            'acquired_at': self.acquired_at.isoformat() if self.acquired_at else None,
+            'renewed_at': self.renewed_at.isoformat() if self.renewed_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
+
+class ResponseCache(db.Model):
+    """预热的接口响应（每日任务完成后生成，数据版本号变化即失效）"""
+    __tablename__ = 'response_cache'
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(500), unique=True, nullable=False)  # 路径 + 排序后的查询参数
+    data_version = db.Column(db.Integer, nullable=False)  # 生成时的数据版本号
+    body = db.Column(db.LargeBinary, nullable=False)  # zlib 压缩的 JSON 响应体
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+
+class ScreenerResult(db.Model):
+    """全目录估值筛选结果（每日任务预计算，所有进程共用，原始数据入库版本号变化即失效）"""
+    __tablename__ = 'screener_results'
+
+    index_id = db.Column(db.Integer, db.ForeignKey('indices.id'), primary_key=True, autoincrement=False)
+    ingest_version = db.Column(db.Integer, nullable=False)  # 计算时的原始数据入库版本号
+    latest_date = db.Column(db.String(10))  # 最新行情日期 YYYY-MM-DD
+    pe_ttm = db.Column(db.Float)
+    pb = db.Column(db.Float)
+    pe_percentile = db.Column(db.Float)
+    pb_percentile = db.Column(db.Float)
+    weighted_roe = db.Column(db.Float)
+    computed_at = db.Column(db.DateTime, default=datetime.now)
+
+
+class Portfolio(db.Model):
+    """组合表（每个组合有自己的指数集合与人为权重）
+    
+    指数级指标（分位数、加权ROE、初始分数）每个指数每天只计算一次，各组合共享；
+    组合只在共享指标之上计算综合权重和目标仓位（portfolio_positions）。
+    Index 上的 is_favorite/manual_weight 仍作为默认组合（自选）使用。
+    """
+    __tablename__ = 'portfolios'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    description = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    indices = db.relationship('PortfolioIndex', backref='portfolio', lazy='dynamic', cascade='all, delete-orphan')
+    positions = db.relationship('PortfolioPosition', backref='portfolio', lazy='dynamic', cascade='all, delete-orphan')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class PortfolioIndex(db.Model):
+    """组合成员表（组合内的指数及其人为权重）"""
+    __tablename__ = 'portfolio_indices'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+    index_id = db.Column(db.Integer, db.ForeignKey('indices.id'), nullable=False, index=True)
+    manual_weight = db.Column(db.Float, default=1.0)  # 人为权重
+    
+    __table_args__ = (
+        db.UniqueConstraint('portfolio_id', 'index_id', name='uix_portfolio_index'),
+    )
+    
+    def to_dict(self):
+        return {
+            'index_id': self.index_id,
+            'manual_weight': self.manual_weight
+        }
+
+
+class PortfolioPosition(db.Model):
+    """组合目标仓位表（在共享的指数指标之上按组合权重分配）"""
+    __tablename__ = 'portfolio_positions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+    index_id = db.Column(db.Integer, db.ForeignKey('indices.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    metrics_date = db.Column(db.Date)  # 所用共享指标的日期
+    composite_weight = db.Column(db.Float)  # 综合权重 = ROE权重 × 组合内人为权重
+    composite_score = db.Column(db.Float)  # 综合分数 = 初始分数 × 综合权重
+    target_position = db.Column(db.Float)  # 目标仓位（%）
+    
+    __table_args__ = (
+        db.UniqueConstraint('portfolio_id', 'date', 'index_id', name='uix_portfolio_position'),
+    )
+    
+    def to_dict(self):
+        return {
+            'index_id': self.index_id,
+            'date': self.date.strftime('%Y-%m-%d'),
+            'metrics_date': self.metrics_date.strftime('%Y-%m-%d') if self.metrics_date else None,
+            'composite_weight': self.composite_weight,
+            'composite_score': self.composite_score,
+            'target_position': self.target_position
+        }
+
+
+def tracked_index_condition():
+    """需要每日抓取和计算的指数：自选指数与任一组合中的指数"""
+    return or_(Index.is_favorite == True, Index.id.in_(select(PortfolioIndex.index_id)))
+
+
+def analyze_database():
+    """更新 SQLite 查询规划统计信息（ANALYZE）
+    
+    没有统计信息时，按日期范围读取全部指数行情的查询会选用单列日期索引（逐行回表再排序），
+    数据量大时慢一个数量级；更新统计信息后改用 (index_id, date) 唯一索引顺序扫描。
+    analysis_limit 限制每个索引的采样行数，大库上也只需不到一秒。
+    """
+    try:
+        db.session.execute(text('PRAGMA analysis_limit = 1000'))
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"更新数据库统计信息失败: {str(e)}")
+        db.session.rollback()
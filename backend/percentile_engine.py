@@ -0,0 +1,340 @@
+"""多窗口估值分位数引擎
+
+每个指数只载入一次完整的 PE/PB 序列，同时计算多个回溯窗口（近3年/5年/10年/成立以来）
+两个指标的分位数。所有窗口都以计算日期为终点，因此窗口是序列的后缀：
+先求“有效值”和“不大于当前值”两个标记的后缀累计和，每个窗口再用一次二分查找
+定位起点即可得到计数，增加窗口几乎没有额外开销。
+"""
+import logging
+import threading
+from collections import Counter
+import numpy as np
+from datetime import date, datetime
+from sqlalchemy import func
+from models import db, IndexHistory, IndexPercentile, natural_key_map
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 回溯窗口：(名称, 天数)，None 表示成立以来
+PERCENTILE_WINDOWS = (
+    ('3y', 1095),
+    ('5y', 1825),
+    ('10y', 3650),
+    ('all', None),
+)
+
+# 指标名 -> IndexHistory 列名
+PERCENTILE_METRICS = {
+    'pe': 'pe_ttm',
+    'pb': 'pb',
+}
+
+
+def load_series(index_id):
+    """载入指数完整估值序列
+
+    Returns:
+        tuple: (日期ordinal数组, {指标: 数值数组})，缺失值为 NaN
+    """
+    rows = db.session.query(
+        IndexHistory.date, *[getattr(IndexHistory, column) for column in PERCENTILE_METRICS.values()]
+    ).filter(
+        IndexHistory.index_id == index_id
+    ).order_by(IndexHistory.date.asc()).all()
+
+    dates = np.array([r[0].toordinal() for r in rows], dtype=np.int64)
+    values = {
+        metric: np.array([r[offset] for r in rows], dtype=float)
+        for offset, metric in enumerate(PERCENTILE_METRICS, start=1)
+    }
+    return dates, values
+
+
+def window_percentiles(dates, values, as_of=None, windows=PERCENTILE_WINDOWS):
+    """计算一个指标在多个回溯窗口内的分位数
+
+    口径与 Calculator.calculate_percentile 一致：窗口为 [as_of - 天数, as_of]，
+    当前值为窗口内最后一条记录（缺失或≤0时分位数为空），
+    分位数 = 窗口内有效值（>0）中不大于当前值的占比。
+
+    Args:
+        dates: 日期ordinal数组（升序）
+        values: 指标值数组（缺失为 NaN）
+        as_of: 计算日期（date），默认今天
+        windows: (名称, 天数) 序列
+
+    Returns:
+        dict: 窗口名称 -> (分位数或 None, 窗口内有效样本数)
+    """
+    as_of = (as_of or datetime.now().date()).toordinal()
+    end = int(np.searchsorted(dates, as_of, side='right'))
+    empty = {name: (None, 0) for name, _ in windows}
+    if end == 0:
+        return empty
+
+    values = values[:end]
+    current = values[-1]
+
+    # 后缀累计和：suffix[i] 为 [i, end) 区间内的计数，末尾补0
+    valid = values > 0
+    not_above = valid & (values <= current)
+    suffix_valid = np.r_[np.cumsum(valid[::-1])[::-1], 0]
+    suffix_not_above = np.r_[np.cumsum(not_above[::-1])[::-1], 0]
+
+    lookbacks = np.array([as_of - days if days is not None else dates[0] for _, days in windows], dtype=np.int64)
+    starts = np.searchsorted(dates[:end], lookbacks, side='left')
+    valid_counts = suffix_valid[starts]
+    not_above_counts = suffix_not_above[starts]
+
+    result = {}
+    for (name, _), start, valid_count, not_above_count in zip(windows, starts, valid_counts, not_above_counts):
+        if start >= end or not current > 0 or valid_count == 0:
+            result[name] = (None, int(valid_count))
+        else:
+            result[name] = (float(not_above_count / valid_count * 100), int(valid_count))
+    return result
+
+
+def index_percentiles(index_id, as_of=None, windows=PERCENTILE_WINDOWS):
+    """计算单个指数所有指标、所有窗口的分位数（只查询一次数据库）
+
+    Returns:
+        dict: 指标 -> {窗口名称 -> (分位数或 None, 有效样本数)}
+    """
+    dates, series = load_series(index_id)
+    return {
+        metric: window_percentiles(dates, values, as_of, windows)
+        for metric, values in series.items()
+    }
+
+
+def save_index_percentiles(index_id, date, percentiles):
+    """写入指数多窗口分位数（已存在的记录更新，其余插入；不提交事务）
+
+    Args:
+        index_id: 指数ID
+        date: 计算日期
+        percentiles: index_percentiles 的返回值
+    """
+    existing = natural_key_map(
+        IndexPercentile, ['metric', 'lookback'],
+        IndexPercentile.index_id == index_id,
+        IndexPercentile.date == date
+    )
+
+    inserts = []
+    updates = []
+    for metric, by_window in percentiles.items():
+        for window, (percentile, sample_count) in by_window.items():
+            values = {'percentile': percentile, 'sample_count': sample_count}
+            key = existing.get((metric, window))
+            if key:
+                updates.append({**key, **values})
+            else:
+                inserts.append({'index_id': index_id, 'date': date, 'metric': metric, 'lookback': window, **values})
+
+    if inserts:
+        db.session.bulk_insert_mappings(IndexPercentile, inserts)
+    if updates:
+        db.session.bulk_update_mappings(IndexPercentile, updates)
+
+
+class _SortedWindow:
+    """单个指数回溯窗口内的估值数据：按日期排列的原始序列 + 每个指标排好序的有效值"""
+
+    __slots__ = ('dates', 'values', 'sorted_values', 'window_start')
+
+    def __init__(self, window_start):
+        self.dates = np.array([], dtype=np.int64)
+        self.values = {metric: np.array([]) for metric in PERCENTILE_METRICS}
+        self.sorted_values = {metric: np.array([]) for metric in PERCENTILE_METRICS}
+        self.window_start = window_start
+
+    @property
+    def last_date(self):
+        return int(self.dates[-1]) if len(self.dates) else None
+
+    def drop_before(self, ordinal):
+        """移除早于 ordinal 的记录"""
+        self._keep(int(np.searchsorted(self.dates, ordinal, side='left')), len(self.dates))
+
+    def drop_from(self, ordinal):
+        """移除不早于 ordinal 的记录（用于替换重新抓取的最新一天）"""
+        self._keep(0, int(np.searchsorted(self.dates, ordinal, side='left')))
+
+    def _keep(self, start, end):
+        """只保留 [start, end) 区间，被移除的有效值同时从有序数组中删除"""
+        if start == 0 and end == len(self.dates):
+            return
+        for metric, values in self.values.items():
+            removed = np.concatenate([values[:start], values[end:]])
+            self.sorted_values[metric] = _remove_sorted(self.sorted_values[metric], removed[removed > 0])
+            self.values[metric] = values[start:end]
+        self.dates = self.dates[start:end]
+
+    def append(self, dates, values):
+        """追加新记录（日期晚于已有记录）"""
+        self.dates = np.concatenate([self.dates, dates])
+        for metric, new_values in values.items():
+            self.values[metric] = np.concatenate([self.values[metric], new_values])
+            added = np.sort(new_values[new_values > 0])
+            current = self.sorted_values[metric]
+            self.sorted_values[metric] = np.insert(current, np.searchsorted(current, added), added)
+
+
+def _remove_sorted(sorted_values, removed):
+    """从有序数组中删除一组值（每个值删除一次，重复值按出现次数删除）"""
+    if len(removed) == 0:
+        return sorted_values
+    removed = np.sort(removed)
+    # 相同值依次落在有序数组中相邻的位置
+    offsets = np.arange(len(removed)) - np.searchsorted(removed, removed, side='left')
+    positions = np.searchsorted(sorted_values, removed, side='left') + offsets
+    return np.delete(sorted_values, positions)
+
+
+class PercentileLookup:
+    """估值分位数查询
+
+    为每个查询过的指数常驻近 lookback_days 天的有序估值数组，
+    任意假设估值（如盘中 PE）的分位数通过一次二分查找得到。
+    数据版本号变化后，只增量读取各指数最新日期及之后的行情并插入有序数组，
+    同时剔除滑出窗口的旧数据；窗口内行数变化（历史行被补录）的指数整体重新载入。
+    """
+
+    def __init__(self, lookback_days=3650):
+        self.lookback_days = lookback_days
+        self._windows = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def lookup(self, items, version):
+        """批量查询分位数
+
+        Args:
+            items: [(index_id, {指标: 估值})]
+            version: 当前数据版本号
+
+        Returns:
+            list: 与 items 对应的 {指标: (分位数或 None, 窗口内有效样本数)}；
+                  指数没有行情时为 None
+        """
+        window_start = datetime.now().date().toordinal() - self.lookback_days
+
+        with self._lock:
+            if version != self._version:
+                self._refresh(window_start)
+                self._version = version
+
+            missing = sorted({index_id for index_id, _ in items if index_id not in self._windows})
+            if missing:
+                self._load(missing, window_start)
+
+            results = []
+            for index_id, values in items:
+                window = self._windows.get(index_id)
+                if window is None or not len(window.dates):
+                    results.append(None)
+                    continue
+
+                if window.window_start < window_start:
+                    window.drop_before(window_start)
+                    window.window_start = window_start
+
+                result = {}
+                for metric, value in values.items():
+                    sorted_values = window.sorted_values[metric]
+                    if value is None or not value > 0 or not len(sorted_values):
+                        result[metric] = (None, len(sorted_values))
+                    else:
+                        count = np.searchsorted(sorted_values, value, side='right')
+                        result[metric] = (float(count / len(sorted_values) * 100), len(sorted_values))
+                results.append(result)
+
+            return results
+
+    def invalidate(self, index_id=None):
+        """丢弃缓存（默认全部）"""
+        with self._lock:
+            if index_id is None:
+                self._windows.clear()
+            else:
+                self._windows.pop(index_id, None)
+
+    def _load(self, index_ids, window_start):
+        """首次查询：一次查询载入多个指数窗口内的行情"""
+        for index_id in index_ids:
+            self._windows[index_id] = _SortedWindow(window_start)
+        self._append(self._query(index_ids, date.fromordinal(window_start)))
+
+    def _refresh(self, window_start):
+        """数据更新后增量刷新：只读取各指数最新日期及之后的行情（最新一天可能被重新抓取）
+
+        最新日期之前的行被补录（缺口补抓、按区间重新抓取）时增量读取看不到，
+        因此同时按指数统计窗口内的行数，与缓存的行数不一致的指数整体重新载入。
+        """
+        for window in self._windows.values():
+            window.drop_before(window_start)
+            window.window_start = window_start
+
+        # 尚无行情的指数下次查询时重新整体载入
+        for index_id in [i for i, window in self._windows.items() if window.last_date is None]:
+            del self._windows[index_id]
+        if not self._windows:
+            return
+
+        index_ids = sorted(self._windows)
+        counts = dict(db.session.query(IndexHistory.index_id, func.count(IndexHistory.date)).filter(
+            IndexHistory.index_id.in_(index_ids),
+            IndexHistory.date >= date.fromordinal(window_start)
+        ).group_by(IndexHistory.index_id).all())
+
+        since = min(window.last_date for window in self._windows.values())
+        rows = self._query(index_ids, date.fromordinal(since))
+
+        # 库中最新日期之前的行数应与缓存中最新日期之前的记录数相同
+        tail = Counter(row[0] for row in rows if row[1].toordinal() >= self._windows[row[0]].last_date)
+        stale = [
+            index_id for index_id, window in self._windows.items()
+            if counts.get(index_id, 0) - tail[index_id] != len(window.dates) - 1
+        ]
+        for index_id in stale:
+            del self._windows[index_id]
+
+        for window in self._windows.values():
+            window.drop_from(window.last_date)
+
+        self._append([
+            row for row in rows
+            if row[0] in self._windows and (
+                self._windows[row[0]].last_date is None or row[1].toordinal() > self._windows[row[0]].last_date
+            )
+        ])
+
+        if stale:
+            self._load(stale, window_start)
+
+    def _query(self, index_ids, since):
+        columns = [getattr(IndexHistory, column) for column in PERCENTILE_METRICS.values()]
+        return db.session.query(IndexHistory.index_id, IndexHistory.date, *columns).filter(
+            IndexHistory.index_id.in_(index_ids),
+            IndexHistory.date >= since
+        ).order_by(IndexHistory.index_id, IndexHistory.date).all()
+
+    def _append(self, rows):
+        """按指数分组追加行（rows 已按指数、日期排序）"""
+        start = 0
+        while start < len(rows):
+            index_id = rows[start][0]
+            end = start
+            while end < len(rows) and rows[end][0] == index_id:
+                end += 1
+            group = rows[start:end]
+            dates = np.array([r[1].toordinal() for r in group], dtype=np.int64)
+            values = {
+                metric: np.array([r[offset] for r in group], dtype=float)
+                for offset, metric in enumerate(PERCENTILE_METRICS, start=2)
+            }
+            self._windows[index_id].append(dates, values)
+            start = end
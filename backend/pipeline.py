@@ -0,0 +1,197 @@
+"""阶段化任务管道
+
+把每日更新任务声明为带依赖关系的阶段（DAG）：
+- 互不依赖的阶段在线程池中并发执行，整体耗时缩短为最长依赖链；
+- 阶段可提供输入指纹，与上次成功运行的指纹相同则跳过；
+- 每个阶段的状态持久化到 PipelineStage 表，失败的阶段可以单独重跑。
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from flask import has_app_context
+from models import db, PipelineStage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUCCESS = 'success'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+BLOCKED = 'blocked'
+RUNNING = 'running'
+
+
+class Stage:
+    """任务阶段"""
+    
+    def __init__(self, name, func, depends_on=(), fingerprint=None, description='', after=()):
+        """
+        Args:
+            name: 阶段名称
+            func: 阶段函数，无参数，返回 False 视为失败
+            depends_on: 依赖的阶段名称（任一失败则本阶段不执行）
+            fingerprint: 计算输入指纹的函数（无参数，返回字符串），为空则每次都执行
+            description: 阶段说明
+            after: 只约束顺序的阶段名称：待其结束后执行，不论其成功与否
+        """
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.after = tuple(after)
+        self.fingerprint = fingerprint
+        self.description = description
+
+
+class Pipeline:
+    """按依赖关系并发执行的任务管道"""
+    
+    def __init__(self, app, stages, max_workers=4):
+        """
+        Args:
+            app: Flask应用实例（每个阶段在独立的应用上下文中执行）
+            stages: Stage 列表
+            max_workers: 最大并发阶段数
+        """
+        self.app = app
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers
+        
+        for stage in stages:
+            for dep in stage.depends_on + stage.after:
+                if dep not in self.stages:
+                    raise ValueError(f"阶段 {stage.name} 依赖不存在的阶段 {dep}")
+        
+        # 拓扑排序检查循环依赖，否则循环中的阶段永远无法开始
+        remaining = {stage.name: set(stage.depends_on + stage.after) for stage in stages}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps & set(remaining)]
+            if not ready:
+                raise ValueError(f"阶段存在循环依赖: {', '.join(sorted(remaining))}")
+            for name in ready:
+                remaining.pop(name)
+    
+    def run(self, only=None, force=False):
+        """执行管道
+        
+        Args:
+            only: 只执行指定阶段（不在列表中的依赖视为已满足），用于单独重跑失败阶段
+            force: 忽略输入指纹，强制执行
+            
+        Returns:
+            dict: 阶段名称 -> 状态
+        """
+        selected = set(only) if only else set(self.stages)
+        unknown = selected - set(self.stages)
+        if unknown:
+            raise ValueError(f"未知阶段: {', '.join(sorted(unknown))}")
+        
+        pending = {
+            name: [dep for dep in self.stages[name].depends_on + self.stages[name].after if dep in selected]
+            for name in selected
+        }
+        results = {}
+        started = time.time()
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            while pending or running:
+                # 被阻断的阶段立即得到结果，可能使其他阶段变为可开始，直到没有新的可开始阶段
+                ready = [n for n, deps in pending.items() if all(d in results for d in deps)]
+                while ready:
+                    for name in ready:
+                        deps = pending.pop(name)
+                        if any(results[d] in (FAILED, BLOCKED) for d in deps if d in self.stages[name].depends_on):
+                            results[name] = BLOCKED
+                            self._record(name, status=BLOCKED, error='上游阶段失败')
+                            logger.warning(f"[阶段 {name}] 上游阶段失败，跳过")
+                            continue
+                        running[pool.submit(self._run_stage, self.stages[name], force)] = name
+                    ready = [n for n, deps in pending.items() if all(d in results for d in deps)]
+                
+                if not running:
+                    if not pending:
+                        continue
+                    # 没有可开始的阶段也没有运行中的阶段（不应出现），避免空转
+                    for name in pending:
+                        results[name] = BLOCKED
+                        self._record(name, status=BLOCKED, error='依赖无法满足')
+                    logger.error(f"阶段依赖无法满足: {', '.join(sorted(pending))}")
+                    break
+                
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        
+        logger.info(f"任务管道执行完成，耗时 {time.time() - started:.1f} 秒: {results}")
+        return results
+    
+    def _run_stage(self, stage, force):
+        """在独立应用上下文中执行单个阶段"""
+        with self.app.app_context():
+            try:
+                fingerprint = stage.fingerprint() if stage.fingerprint else None
+                
+                if not force and fingerprint is not None:
+                    record = PipelineStage.query.filter_by(name=stage.name).first()
+                    if record and record.status in (SUCCESS, SKIPPED) and record.fingerprint == fingerprint:
+                        logger.info(f"[阶段 {stage.name}] 输入未变化，跳过")
+                        self._record(stage.name, status=SKIPPED)
+                        return SKIPPED
+                
+                logger.info(f"[阶段 {stage.name}] 开始执行")
+                started_at = datetime.now()
+                self._record(stage.name, status=RUNNING, started_at=started_at, finished_at=None, error=None)
+                
+                result = stage.func()
+                
+                finished_at = datetime.now()
+                duration = (finished_at - started_at).total_seconds()
+                if result is False:
+                    self._record(stage.name, status=FAILED, finished_at=finished_at, duration=duration,
+                                 error='阶段返回失败')
+                    logger.error(f"[阶段 {stage.name}] 执行失败")
+                    return FAILED
+                
+                self._record(stage.name, status=SUCCESS, fingerprint=fingerprint,
+                             finished_at=finished_at, duration=duration)
+                logger.info(f"[阶段 {stage.name}] 执行成功，耗时 {duration:.1f} 秒")
+                return SUCCESS
+                
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"[阶段 {stage.name}] 执行异常: {str(e)}")
+                self._record(stage.name, status=FAILED, finished_at=datetime.now(), error=str(e))
+                return FAILED
+    
+    def _record(self, name, **fields):
+        """持久化阶段状态（复用当前应用上下文的会话，避免同线程两个连接争用写锁）"""
+        if not has_app_context():
+            with self.app.app_context():
+                return self._record(name, **fields)
+        
+        try:
+            record = PipelineStage.query.filter_by(name=name).first()
+            if not record:
+                record = PipelineStage(name=name)
+                db.session.add(record)
+            for key, value in fields.items():
+                setattr(record, key, value)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"记录阶段 {name} 状态失败: {str(e)}")
+    
+    def status(self):
+        """各阶段最近一次运行状态"""
+        with self.app.app_context():
+            records = {r.name: r.to_dict() for r in PipelineStage.query.all()}
+        return [
+            {
+                **records.get(name, {'name': name, 'status': None}),
+                'depends_on': list(stage.depends_on),
+                'after': list(stage.after),
+                'description': stage.description
+            }
+            for name, stage in self.stages.items()
+        ]
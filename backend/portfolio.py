@@ -0,0 +1,189 @@
+"""组合管理
+
+组合的创建、修改、删除与成员设置，以及组合详情（成员的共享指数指标 + 组合目标仓位）。
+
+指数级指标（分位数、加权ROE、初始分数）存放在 calculated_metrics，每个指数每天只计算一次，
+所有组合共享；组合只保存成员与人为权重，目标仓位由 Calculator.calculate_portfolio_positions
+在共享指标之上计算。成员变化后只重新计算该组合的仓位，新加入且尚无指标的指数当场计算一次。
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import func
+from models import (db, Index, IndexHistory, CalculatedMetrics, Portfolio, PortfolioIndex,
+                    PortfolioPosition, latest_index_rows)
+from data_version import bump_data_version
+from trading_calendar import get_trading_calendar
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_members(items):
+    """校验成员列表
+
+    Args:
+        items: [{"index_id": 1, "manual_weight": 1.5}, ...]，manual_weight 缺省为1.0
+
+    Returns:
+        dict: index_id -> manual_weight
+    """
+    if not isinstance(items, list):
+        raise ValueError('indices 必须为列表')
+
+    members = {}
+    for item in items:
+        index_id = item.get('index_id') if isinstance(item, dict) else None
+        if not isinstance(index_id, int):
+            raise ValueError('每个成员必须包含整数 index_id')
+        manual_weight = item.get('manual_weight', 1.0)
+        if manual_weight is None or manual_weight < 0:
+            raise ValueError('权重必须大于等于0')
+        members[index_id] = float(manual_weight)
+
+    found = {index_id for index_id, in db.session.query(Index.id).filter(Index.id.in_(list(members))).all()}
+    missing = sorted(set(members) - found)
+    if missing:
+        raise ValueError(f"指数不存在: {', '.join(map(str, missing))}")
+    return members
+
+
+def _check_name(name, portfolio_id=None):
+    if not name or not str(name).strip():
+        raise ValueError('组合名称不能为空')
+    existing = Portfolio.query.filter_by(name=name).first()
+    if existing is not None and existing.id != portfolio_id:
+        raise ValueError(f'组合名称已存在: {name}')
+
+
+def create_portfolio(calculator, name, description=None, indices=None):
+    """创建组合
+
+    Args:
+        calculator: Calculator实例（计算成员指标与目标仓位）
+        name: 组合名称（唯一）
+        description: 说明
+        indices: 成员列表，格式见 _parse_members
+
+    Returns:
+        Portfolio: 新建的组合
+    """
+    _check_name(name)
+    members = _parse_members(indices or [])
+
+    portfolio = Portfolio(name=name, description=description)
+    db.session.add(portfolio)
+    db.session.flush()
+    _replace_members(calculator, portfolio, members)
+    return portfolio
+
+
+def update_portfolio(calculator, portfolio, name=None, description=None, indices=None):
+    """修改组合名称、说明或成员（参数为 None 的项保持不变）
+
+    Args:
+        calculator: Calculator实例
+        portfolio: 组合
+        name: 新名称
+        description: 新说明
+        indices: 新的完整成员列表（替换原有成员）
+
+    Returns:
+        Portfolio: 修改后的组合
+    """
+    if name is not None:
+        _check_name(name, portfolio.id)
+        portfolio.name = name
+    if description is not None:
+        portfolio.description = description
+    portfolio.updated_at = datetime.now()
+
+    if indices is not None:
+        _replace_members(calculator, portfolio, _parse_members(indices))
+    else:
+        db.session.commit()
+    return portfolio
+
+
+def delete_portfolio(portfolio):
+    """删除组合（同时删除成员与目标仓位记录）"""
+    db.session.delete(portfolio)
+    db.session.commit()
+    bump_data_version()
+
+
+def _replace_members(calculator, portfolio, members):
+    """替换组合成员并重新计算该组合的目标仓位"""
+    PortfolioIndex.query.filter_by(portfolio_id=portfolio.id).delete(synchronize_session=False)
+    db.session.add_all([
+        PortfolioIndex(portfolio_id=portfolio.id, index_id=index_id, manual_weight=manual_weight)
+        for index_id, manual_weight in members.items()
+    ])
+    db.session.commit()
+
+    # 只为还没有共享指标的指数计算一次（已有指标的指数由每日任务统一更新）
+    date = get_trading_calendar().previous_trading_day(datetime.now().date())
+    computed = {index_id for index_id, in db.session.query(CalculatedMetrics.index_id).filter(
+        CalculatedMetrics.index_id.in_(list(members))
+    ).distinct().all()}
+    for index_id in sorted(set(members) - computed):
+        if calculator.calculate_index_metrics(index_id, date) is None:
+            logger.warning(f"指数 {index_id} 暂无可用行情，请刷新指数数据后再计算")
+
+    calculator.calculate_portfolio_positions(date, portfolio_ids=[portfolio.id])
+    bump_data_version()
+
+
+def list_portfolios():
+    """全部组合及成员数量"""
+    counts = dict(db.session.query(
+        PortfolioIndex.portfolio_id, func.count(PortfolioIndex.id)
+    ).group_by(PortfolioIndex.portfolio_id).all())
+
+    return [
+        {**portfolio.to_dict(), 'index_count': counts.get(portfolio.id, 0)}
+        for portfolio in Portfolio.query.order_by(Portfolio.id).all()
+    ]
+
+
+def portfolio_detail(portfolio):
+    """组合详情：成员的共享指标、最新行情估值与最新一期组合目标仓位
+
+    Returns:
+        dict: portfolio、position_date、indices（每个成员一项）
+    """
+    members = portfolio.indices.order_by(PortfolioIndex.index_id).all()
+    index_ids = [member.index_id for member in members]
+
+    indices = {index.id: index for index in Index.query.filter(Index.id.in_(index_ids)).all()}
+    metrics = latest_index_rows(CalculatedMetrics, index_ids)
+    histories = latest_index_rows(IndexHistory, index_ids)
+
+    position_date = db.session.query(func.max(PortfolioPosition.date)).filter(
+        PortfolioPosition.portfolio_id == portfolio.id
+    ).scalar()
+    positions = {
+        position.index_id: position
+        for position in PortfolioPosition.query.filter_by(portfolio_id=portfolio.id, date=position_date).all()
+    } if position_date else {}
+
+    items = []
+    for member in members:
+        metric = metrics.get(member.index_id)
+        history = histories.get(member.index_id)
+        position = positions.get(member.index_id)
+        items.append({
+            'index': indices[member.index_id].to_dict(),
+            'manual_weight': member.manual_weight,
+            'metrics': metric.to_dict() if metric else None,
+            'position': position.to_dict() if position else None,
+            'valuation': {
+                'pe_ttm': history.pe_ttm if history else None,
+                'pb': history.pb if history else None,
+                'close': history.close if history else None
+            }
+        })
+
+    return {
+        'portfolio': portfolio.to_dict(),
+        'position_date': position_date.strftime('%Y-%m-%d') if position_date else None,
+        'indices': items
+    }
@@ -0,0 +1,294 @@
+"""按需请求性能剖析
+
+设置环境变量 PROFILING_ENABLED=1 后，带请求头 X-Profile: 1（或查询参数 __profile=1）的请求会被剖析：
+后台线程每隔 PROFILE_INTERVAL 毫秒采集一次处理该请求的线程调用栈，合并为折叠栈格式
+（flamegraph.pl、speedscope 可直接打开），同时记录请求期间执行的 SQL 语句及耗时。
+每次剖析写入 PROFILE_DIR 下的 <id>.json（请求信息与 SQL）和 <id>.folded（折叠栈），
+只保留最近 PROFILE_KEEP 个（环形缓冲），响应头 X-Profile-Id 返回本次剖析的 id。
+
+未开启时不注册任何请求钩子、SQL 事件监听和管理接口，普通请求没有额外开销；
+开启后未带标记的请求只多一次请求头检查。剖析结果含 SQL 语句，必须同时设置 PROFILING_TOKEN，
+否则不开启：X-Profile 请求头（或 __profile 参数）须等于该值才会剖析，管理接口也须带此请求头。
+
+管理接口:
+    GET /api/admin/profiles                 最近的剖析记录（不含 SQL 明细）
+    GET /api/admin/profiles/<id>            剖析详情（含 SQL 语句）
+    GET /api/admin/profiles/<id>/folded     折叠栈文本（flamegraph.pl <id>.folded > flame.svg）
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from flask import Blueprint, Response, current_app, g, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILE_DIR = os.environ.get(
+    'PROFILE_DIR', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'profiles')
+)
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 1))  # 采样间隔（毫秒）
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PARAM = '__profile'
+EXTENSION_KEY = 'profiling'
+MAX_SQL_STATEMENTS = 1000
+
+# 当前线程正在剖析的请求（SQL 事件监听按线程归属语句）
+_active = threading.local()
+
+
+class StackSampler(threading.Thread):
+    """定期采集指定线程的调用栈，按折叠栈（根;...;叶）计数"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if frames:
+                self.stacks[';'.join(reversed(frames))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+class RequestProfiler:
+    """请求剖析：判断是否剖析、开始/结束采样，保存结果并维护环形缓冲"""
+
+    def __init__(self, directory=PROFILE_DIR, keep=PROFILE_KEEP, interval=PROFILE_INTERVAL, token=PROFILING_TOKEN):
+        """
+        Args:
+            directory: 剖析结果目录
+            keep: 保留的剖析记录数
+            interval: 采样间隔（毫秒）
+            token: 触发剖析和访问管理接口所需的请求头值
+        """
+        self.directory = directory
+        self.keep = keep
+        self.interval = interval / 1000
+        self.token = token
+        self._lock = threading.Lock()
+
+    def authorized(self, value):
+        return bool(self.token) and value == self.token
+
+    def start(self):
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        _active.profile = g._profile = {
+            'started_at': datetime.now(),
+            'start': time.perf_counter(),
+            'sampler': sampler,
+            'sql': [],
+            'sql_count': 0,
+            'sql_time': 0.0,
+        }
+        sampler.start()
+
+    def finish(self, status):
+        """结束当前请求的剖析并保存，返回剖析 id"""
+        profile = g.pop('_profile', None)
+        _active.profile = None
+        if profile is None:
+            return None
+
+        stacks = profile['sampler'].stop()
+        duration = time.perf_counter() - profile['start']
+        profile_id = f"{profile['started_at']:%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:6]}"
+        record = {
+            'id': profile_id,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': status,
+            'started_at': profile['started_at'].strftime('%Y-%m-%d %H:%M:%S.%f'),
+            'duration_ms': duration * 1000,
+            'samples': sum(stacks.values()),
+            'interval_ms': self.interval * 1000,
+            'pid': os.getpid(),
+            'sql_count': profile['sql_count'],
+            'sql_ms': profile['sql_time'] * 1000,
+            'sql': profile['sql'],
+        }
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f'{profile_id}.folded'), 'w', encoding='utf-8') as f:
+                f.writelines(f'{stack} {count}\n' for stack, count in stacks.most_common())
+            with open(os.path.join(self.directory, f'{profile_id}.json'), 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+            self._prune()
+        except OSError as e:
+            logger.error(f"保存剖析结果失败: {str(e)}")
+            return None
+
+        logger.info(f"剖析 {record['method']} {record['path']}: {record['duration_ms']:.0f}ms，"
+                    f"SQL {record['sql_count']} 条 {record['sql_ms']:.0f}ms，结果 {profile_id}")
+        return profile_id
+
+    def _prune(self):
+        """只保留最近 keep 个剖析记录（id 以时间开头，按文件名排序即按时间排序）"""
+        with self._lock:
+            ids = sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+            for profile_id in ids[:max(0, len(ids) - self.keep)]:
+                for suffix in ('.json', '.folded'):
+                    try:
+                        os.remove(os.path.join(self.directory, profile_id + suffix))
+                    except FileNotFoundError:
+                        pass
+
+    def path(self, profile_id, suffix):
+        # id 只含字母、数字和连字符，防止路径穿越
+        if not profile_id or not all(c.isalnum() or c == '-' for c in profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + suffix)
+        return path if os.path.exists(path) else None
+
+    def list(self):
+        if not os.path.isdir(self.directory):
+            return []
+        records = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            record.pop('sql', None)
+            records.append(record)
+        return records
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_active, 'profile', None) is not None:
+        conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = getattr(_active, 'profile', None)
+    starts = conn.info.get('profile_query_start')
+    if profile is None or not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    profile['sql_count'] += 1
+    profile['sql_time'] += elapsed
+    if len(profile['sql']) < MAX_SQL_STATEMENTS:
+        profile['sql'].append({
+            'statement': statement,
+            'duration_ms': elapsed * 1000,
+            'executemany': len(parameters) if executemany else None,
+        })
+
+
+def _before_request():
+    profiler = current_app.extensions[EXTENSION_KEY]
+    if profiler.authorized(request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_PARAM)):
+        profiler.start()
+
+
+def _after_request(response):
+    if '_profile' in g:
+        profile_id = current_app.extensions[EXTENSION_KEY].finish(response.status_code)
+        if profile_id:
+            response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def _teardown_request(exc):
+    # 视图抛出未处理异常时 after_request 不会执行
+    if '_profile' in g:
+        current_app.extensions[EXTENSION_KEY].finish(500)
+
+
+profiling_api = Blueprint('profiling_api', __name__, url_prefix='/api/admin')
+
+
+@profiling_api.before_request
+def _check_token():
+    if not current_app.extensions[EXTENSION_KEY].authorized(request.headers.get(PROFILE_HEADER)):
+        return jsonify({'success': False, 'error': '需要 X-Profile 请求头'}), 403
+
+
+@profiling_api.route('/profiles', methods=['GET'])
+def list_profiles():
+    """最近的剖析记录"""
+    return jsonify({'success': True, 'data': current_app.extensions[EXTENSION_KEY].list()})
+
+
+@profiling_api.route('/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """剖析详情（含 SQL 语句）"""
+    path = current_app.extensions[EXTENSION_KEY].path(profile_id, '.json')
+    if path is None:
+        return jsonify({'success': False, 'error': '剖析记录不存在'}), 404
+    with open(path, encoding='utf-8') as f:
+        return jsonify({'success': True, 'data': json.load(f)})
+
+
+@profiling_api.route('/profiles/<profile_id>/folded', methods=['GET'])
+def get_profile_folded(profile_id):
+    """折叠栈文本"""
+    path = current_app.extensions[EXTENSION_KEY].path(profile_id, '.folded')
+    if path is None:
+        return jsonify({'success': False, 'error': '剖析记录不存在'}), 404
+    with open(path, encoding='utf-8') as f:
+        return Response(f.read(), mimetype='text/plain',
+                        headers={'Content-Disposition': f'inline; filename={profile_id}.folded'})
+
+
+def init_profiling(app, enabled=PROFILING_ENABLED, profiler=None):
+    """按配置注册剖析钩子与管理接口
+
+    Args:
+        app: Flask应用实例
+        enabled: 是否开启，默认取环境变量 PROFILING_ENABLED
+        profiler: RequestProfiler实例（可选，默认按环境变量创建）
+
+    Returns:
+        bool: 是否已开启
+    """
+    if not enabled:
+        return False
+
+    profiler = profiler or RequestProfiler()
+    if not profiler.token:
+        logger.error("已设置 PROFILING_ENABLED 但未设置 PROFILING_TOKEN，不开启请求剖析")
+        return False
+
+    app.extensions[EXTENSION_KEY] = profiler
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.register_blueprint(profiling_api)
+
+    # Engine 级监听对所有连接生效，未在剖析的线程只做一次属性检查
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    logger.info(f"已开启按需请求剖析，结果目录 {app.extensions[EXTENSION_KEY].directory}")
+    return True
@@ -0,0 +1,16 @@
+"""只读 API 入口
+
+只注册读接口，不导入 akshare、APScheduler，也不启动定时任务，启动快、内存占用小，
+可按需水平扩展多个 worker；写接口由 app.py 负责，定时任务由 worker.py 单独运行。
+
+用法:
+    gunicorn -w 4 -b 0.0.0.0:5001 read_app:app
+    python read_app.py
+"""
+from app_factory import create_app
+
+app = create_app(read_only=True)
+
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5001)
@@ -0,0 +1,121 @@
+"""接口响应预热缓存
+
+每日任务计算完成后，用应用的测试客户端依次请求仪表盘、指数列表、股债性价比以及自选与组合指数
+在常用区间下的详情，把序列化后的响应体（zlib 压缩）连同当时的数据版本号写入 response_cache 表。
+读接口先按“路径 + 排序后的查询参数”查找与当前数据版本号一致的响应，命中则直接返回，
+当天第一个请求与之后的请求一样快；任何数据写入递增版本号后缓存自动失效，回到正常查询。
+
+缓存存放在数据库中，所有 worker 进程共用一份。按天数区间查询的响应以预热当天为起点，
+次日在下一次数据写入前命中缓存时，区间起点会早一天。
+"""
+import logging
+import zlib
+from datetime import datetime
+from functools import wraps
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from flask import current_app, request
+from sqlalchemy import and_, cast, Integer
+from models import db, Index, ResponseCache, SystemConfig, tracked_index_condition
+from data_version import DATA_VERSION_KEY, get_data_version
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 预热请求的 WSGI environ 标记：跳过缓存查找，重新生成响应
+WARM_ENVIRON_KEY = 'invest.cache_warm'
+
+# 指数详情、股债性价比预热的天数区间（1年、3年、5年、10年）
+WARM_DAYS = (365, 1095, 1825, 3650)
+
+
+def _make_key(path, args):
+    query = urlencode(sorted(args))
+    return f'{path}?{query}' if query else path
+
+
+def cache_key():
+    """当前请求的缓存键"""
+    return _make_key(request.path, request.args.items(multi=True))
+
+
+def cached_response(view):
+    """读接口装饰器：存在当前数据版本号的预热响应时直接返回"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.environ.get(WARM_ENVIRON_KEY):
+            return view(*args, **kwargs)
+
+        body = db.session.query(ResponseCache.body).join(
+            SystemConfig, and_(
+                SystemConfig.key == DATA_VERSION_KEY,
+                cast(SystemConfig.value, Integer) == ResponseCache.data_version
+            )
+        ).filter(ResponseCache.key == cache_key()).scalar()
+        if body is None:
+            return view(*args, **kwargs)
+
+        return current_app.response_class(
+            zlib.decompress(body), mimetype='application/json', headers={'X-Cache': 'HIT'}
+        )
+    return wrapper
+
+
+def warm_paths():
+    """需要预热的请求路径"""
+    tracked_ids = [index_id for index_id, in db.session.query(Index.id).filter(
+        tracked_index_condition()
+    ).order_by(Index.id).all()]
+
+    paths = ['/api/dashboard', '/api/indices', '/api/indices?is_favorite=true', '/api/stock-bond-ratio']
+    paths += [f'/api/stock-bond-ratio?days={days}' for days in WARM_DAYS]
+    for index_id in tracked_ids:
+        paths.append(f'/api/indices/{index_id}')
+        paths += [f'/api/indices/{index_id}?days={days}' for days in WARM_DAYS]
+    return paths
+
+
+def warm_response_cache(app, paths=None):
+    """生成预热响应并替换 response_cache 表中的全部内容
+
+    Args:
+        app: Flask应用实例（需已注册读接口）
+        paths: 请求路径列表，默认见 warm_paths()
+
+    Returns:
+        int: 写入的响应数，失败或预热期间数据有更新时返回 None
+    """
+    try:
+        version = get_data_version()
+        paths = paths if paths is not None else warm_paths()
+        client = app.test_client()
+
+        entries = {}
+        for path in paths:
+            response = client.get(path, environ_overrides={WARM_ENVIRON_KEY: True})
+            if response.status_code != 200:
+                logger.warning(f"预热 {path} 失败: HTTP {response.status_code}")
+                continue
+            parts = urlsplit(path)
+            entries[_make_key(parts.path, parse_qsl(parts.query))] = zlib.compress(response.get_data())
+
+        # 预热期间有新的数据写入时，生成的响应可能混合新旧数据，放弃本次结果
+        if get_data_version() != version:
+            logger.warning("预热期间数据已更新，放弃本次预热结果")
+            return None
+
+        now = datetime.now()
+        db.session.query(ResponseCache).delete(synchronize_session=False)
+        db.session.bulk_insert_mappings(ResponseCache, [
+            {'key': key, 'data_version': version, 'body': body, 'created_at': now}
+            for key, body in entries.items()
+        ])
+        db.session.commit()
+
+        size = sum(len(body) for body in entries.values())
+        logger.info(f"已预热 {len(entries)} 个接口响应（数据版本 {version}，压缩后 {size / 1024 / 1024:.1f}MB）")
+        return len(entries)
+
+    except Exception as e:
+        logger.error(f"预热接口响应失败: {str(e)}")
+        db.session.rollback()
+        return None
@@ -1,75 +1,219 @@
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
 from datetime import datetime
+import hashlib
+from trading_calendar import get_trading_calendar
+from pipeline import Pipeline, Stage
 import logging
+import os
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 每日数据更新任务的触发时间（收盘后）
+DAILY_JOB_HOUR = 15
+DAILY_JOB_MINUTE = 30
 
-def init_scheduler(app, calculator, fetcher):
+
+def build_daily_pipeline(app, calculator, fetcher, screener=None):
+    """构建每日更新任务管道
+    
+    阶段依赖关系：
+        index_history（自选指数 + 中证800行情） ─> history_gaps ─┬─> stock_bond_ratio ─┬─> snapshot
+        bond_yield ──────────────────────────────────────────────┘                     │
+        constituents ─┬─> index_metrics ───────────────────────────────────────────────┼─> screener
+        financials ───┘        ↑ 同时依赖 history_gaps                                 └─> response_cache
+    
+    抓取类阶段以“交易日 + 自选与组合指数列表”作为指纹，同一交易日成功后不重复抓取；
+    history_gaps 在当日行情抓取结束后（不论成功与否）扫描缺口（抓取失败遗留的缺失交易日）并按区间补抓。
+    计算类阶段以输入数据的最新日期和行数作为指纹，输入未变化时跳过。
+    
+    Args:
+        app: Flask应用实例
+        calculator: Calculator实例
+        fetcher: DataFetcher实例
+        screener: ValuationScreener实例，传入时在计算完成后预计算全目录估值筛选并写入 screener_results 表
+        
+    Returns:
+        Pipeline: 任务管道
+    """
+    from models import (db, Index, IndexHistory, IndexConstituent, BondYield, StockTTMRoe, PortfolioIndex,
+                        tracked_index_condition)
+    from data_version import get_data_version, get_ingest_version
+    from response_cache import warm_response_cache
+    from history_gaps import repair_history_gaps
+    from sqlalchemy import func
+    
+    def today_str():
+        return datetime.now().strftime('%Y%m%d')
+    
+    def tracked_codes():
+        # 自选指数与各组合中的指数
+        return sorted(code for code, in db.session.query(Index.code).filter(tracked_index_condition()).all())
+    
+    def target_date():
+        return get_trading_calendar().previous_trading_day(datetime.now().date())
+    
+    def fetch_index_history():
+        # 个别指数抓取失败不影响当日计算（缺失的交易日由 history_gaps 补抓），
+        # 只有中证800（交易日历与股债性价比的数据来源）失败时阶段失败
+        today = today_str()
+        failed = [code for code in tracked_codes() if not fetcher.fetch_index_history(code, today, today)]
+        if failed:
+            logger.warning(f"{len(failed)} 个指数行情抓取失败: {', '.join(failed)}")
+        success = fetcher.fetch_index_history('000906', today, today)
+        get_trading_calendar(refresh=True)
+        return bool(success)
+    
+    def fetch_constituents():
+        return all([fetcher.fetch_index_constituents(code) for code in tracked_codes()])
+    
+    def calculate_stock_bond_ratio():
+        return calculator.calculate_stock_bond_ratio() is not None
+    
+    def fetch_fingerprint():
+        return f"{today_str()}|{','.join(tracked_codes())}"
+    
+    def stock_bond_fingerprint():
+        history = db.session.query(
+            func.max(IndexHistory.date), func.count(IndexHistory.date)
+        ).join(Index, Index.id == IndexHistory.index_id).filter(Index.code == '000906').one()
+        bond = db.session.query(func.max(BondYield.date), func.count(BondYield.date)).one()
+        return f"{target_date()}|{history}|{bond}"
+    
+    def index_metrics_fingerprint():
+        tracked = db.session.query(
+            Index.id, Index.is_favorite, Index.manual_weight, func.max(IndexHistory.date), func.count(IndexHistory.date)
+        ).outerjoin(IndexHistory, IndexHistory.index_id == Index.id).filter(
+            tracked_index_condition()
+        ).group_by(Index.id).order_by(Index.id).all()
+        constituents = db.session.query(func.max(IndexConstituent.date), func.count(IndexConstituent.id)).one()
+        roe = db.session.query(func.max(StockTTMRoe.report_date), func.count(StockTTMRoe.report_date)).one()
+        # 组合成员与人为权重变化后需要重新计算各组合的目标仓位
+        members = db.session.query(
+            PortfolioIndex.portfolio_id, PortfolioIndex.index_id, PortfolioIndex.manual_weight
+        ).order_by(PortfolioIndex.portfolio_id, PortfolioIndex.index_id).all()
+        portfolios = hashlib.sha1(repr(members).encode()).hexdigest()
+        return f"{target_date()}|{tracked}|{constituents}|{roe}|{portfolios}"
+    
+    stages = [
+        Stage('index_history', fetch_index_history,
+              fingerprint=fetch_fingerprint, description='更新自选与组合指数、中证800行情'),
+        Stage('constituents', fetch_constituents,
+              fingerprint=fetch_fingerprint, description='更新自选与组合指数成份股'),
+        Stage('bond_yield', fetcher.fetch_bond_yield,
+              fingerprint=today_str, description='更新国债收益率'),
+        Stage('financials', fetcher.fetch_latest_financials,
+              fingerprint=today_str, description='更新财务数据'),
+        Stage('history_gaps', lambda: repair_history_gaps(fetcher) is not None,
+              after=['index_history'],
+              fingerprint=fetch_fingerprint, description='扫描并补抓行情缺口'),
+        Stage('stock_bond_ratio', calculate_stock_bond_ratio,
+              depends_on=['index_history', 'history_gaps', 'bond_yield'],
+              fingerprint=stock_bond_fingerprint, description='计算股债性价比'),
+        Stage('index_metrics', calculator.run_index_calculation,
+              depends_on=['index_history', 'history_gaps', 'constituents', 'financials'],
+              fingerprint=index_metrics_fingerprint, description='计算指数指标与自选、各组合目标仓位'),
+    ]
+    
+    # 配置了 SNAPSHOT_DIR 时生成只读估值快照
+    if os.environ.get('SNAPSHOT_DIR'):
+        stages.append(Stage('snapshot', lambda: calculator.build_snapshot() is not None,
+                            depends_on=['stock_bond_ratio', 'index_metrics'],
+                            description='生成只读估值快照'))
+    
+    # 数据更新后预计算估值筛选结果并写入数据库，各 API 进程直接读取，不必各自全量计算
+    if screener is not None:
+        stages.append(Stage('screener', lambda: screener.refresh() is not None,
+                            depends_on=['stock_bond_ratio', 'index_metrics'],
+                            fingerprint=lambda: str(get_ingest_version()),
+                            description='预计算全目录估值筛选并保存'))
+    
+    # 预热仪表盘、指数列表与详情、股债性价比的响应，当天第一个请求直接命中
+    stages.append(Stage('response_cache', lambda: warm_response_cache(app) is not None,
+                        depends_on=['stock_bond_ratio', 'index_metrics'],
+                        fingerprint=lambda: str(get_data_version()), description='预热读接口响应'))
+    
+    return Pipeline(app, stages)
+
+
+def init_scheduler(app, calculator, fetcher, screener=None, pipeline=None, lease=None, catch_up=False,
+                   job_lock=None):
     """初始化定时任务
     
+    APScheduler 在此处才导入，只读进程不会加载。
+    
     Args:
         app: Flask应用实例
         calculator: Calculator实例
         fetcher: DataFetcher实例
+        screener: ValuationScreener实例（可选）
+        pipeline: 已构建的每日任务管道（可选，默认新建）
+        lease: LeaseLock实例（可选），传入时每次执行前续约，未持有租约则跳过
+        catch_up: 启动时已过当日触发时间则立即补跑一次（管道按指纹跳过已完成的阶段）
+        job_lock: threading.Lock（可选），任务执行期间持有，调用方可据此等待任务结束；
+            已被调用方占用（如工作进程正在退出）时任务直接跳过
     """
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+    from lease import LeaseError
+    
     scheduler = BackgroundScheduler()
+    pipeline = pipeline or build_daily_pipeline(app, calculator, fetcher, screener)
     
     def daily_update_job():
         """每日数据更新任务"""
+        if job_lock is None:
+            return run_daily_update()
+        if not job_lock.acquire(blocking=False):
+            logger.warning("工作进程正在退出，跳过每日数据更新任务")
+            return
+        try:
+            run_daily_update()
+        finally:
+            job_lock.release()
+    
+    def run_daily_update():
         with app.app_context():
+            # 租约已被其他进程接管时不执行，避免两个调度器同时更新；
+            # 数据库暂时无法续约时，按本地记录的到期时间判断租约是否仍归自己
+            if lease is not None:
+                try:
+                    held = lease.renew()
+                except LeaseError:
+                    held = lease.still_valid()
+                if not held:
+                    logger.warning("未持有调度租约，跳过每日数据更新任务")
+                    return
             try:
-                logger.info("开始执行每日数据更新任务...")
-                
-                # 1. 更新自选指数数据
-                from models import Index
-                favorite_indices = Index.query.filter_by(is_favorite=True).all()
-                
-                for index in favorite_indices:
-                    logger.info(f"更新指数 {index.name} ({index.code})")
-                    
-                    # 获取最近3天数据（防止遗漏）
-                    end_date = datetime.now().strftime('%Y%m%d')
-                    start_date = datetime.now().strftime('%Y%m%d')
-                    
-                    fetcher.fetch_index_history(index.code, start_date, end_date)
-                    fetcher.fetch_index_constituents(index.code)
-                
-                # 2. 更新中证800数据（用于股债性价比）
-                logger.info("更新中证800数据...")
-                end_date = datetime.now().strftime('%Y%m%d')
-                start_date = datetime.now().strftime('%Y%m%d')
-                fetcher.fetch_index_history('000906', start_date, end_date)
-                
-                # 3. 更新国债收益率
-                logger.info("更新国债收益率...")
-                fetcher.fetch_bond_yield()
-                
-                # 4. 更新财务数据（每季度更新一次，这里简化为每次都尝试）
-                logger.info("更新财务数据...")
-                fetcher.fetch_latest_financials()
-                
-                # 5. 执行计算
-                logger.info("执行每日计算...")
-                calculator.run_daily_calculation()
-                
-                logger.info("每日数据更新任务完成")
-                
+                # 非交易日（周末、节假日）不抓取行情、不重复计算
+                calendar = get_trading_calendar(refresh=True)
+                today = datetime.now().date()
+                if not calendar.is_trading_day(today):
+                    logger.info(f"{today} 非交易日，跳过每日数据更新任务")
+                    return
             except Exception as e:
                 logger.error(f"每日数据更新任务失败: {str(e)}")
+                return
+        
+        logger.info("开始执行每日数据更新任务...")
+        pipeline.run()
+        logger.info("每日数据更新任务完成")
     
     # 添加定时任务：每个交易日15:30执行
-    # 这里简化为每天15:30执行（实际应该判断是否为交易日）
+    # 周末不触发，节假日在任务内按交易日历跳过
     scheduler.add_job(
         func=daily_update_job,
-        trigger=CronTrigger(hour=15, minute=30),
+        trigger=CronTrigger(day_of_week='mon-fri', hour=DAILY_JOB_HOUR, minute=DAILY_JOB_MINUTE),
         id='daily_update',
         name='每日数据更新',
         replace_existing=True
     )
     
+    # 接管调度时已过当日触发时间（如原持有者在 15:30 前后退出），立即补跑一次
+    now = datetime.now()
+    if catch_up and now.weekday() < 5 and (now.hour, now.minute) >= (DAILY_JOB_HOUR, DAILY_JOB_MINUTE):
+        scheduler.add_job(func=daily_update_job, id='daily_update_catch_up', name='每日数据更新（补跑）')
+        logger.info("已过当日触发时间，立即补跑每日数据更新任务")
+    
     # 启动调度器
     scheduler.start()
     logger.info("定时任务调度器已启动")
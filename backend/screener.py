@@ -0,0 +1,313 @@
+"""全目录估值筛选
+
+对所有有历史行情的指数一次性批量计算当前 PE/PB 分位数、加权ROE、分位区间和初始分数：
+近10年行情按 (指数, 日期) 排序后以列数组载入，按指数分段做向量化的分组排名，
+不再逐个指数查询。结果按原始数据入库版本号（ingest_version）缓存，直到下一次抓取或导入后才重新计算；
+自选、人为权重、组合调整不影响分位数和加权ROE，每次查询时合并最新值，不会触发重新计算。
+筛选、排序和分页都在缓存的 DataFrame 上完成。
+
+每日任务（worker.py）计算完成后调用 refresh() 把结果写入 screener_results 表，
+各 API 进程缓存未命中时先读取与当前入库版本号一致的结果（每个指数一行），
+只有尚未预计算（如手动抓取后、每日任务运行前）时才在进程内全量计算。
+近10年窗口以计算当天为终点，入库版本号不变时不随日期滚动。
+"""
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from models import db, Index, IndexHistory, ScreenerResult
+from staging import frame_records
+from data_version import get_ingest_version
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 可排序字段
+SORT_FIELDS = (
+    'code', 'name', 'latest_date', 'pe_ttm', 'pb', 'pe_percentile', 'pb_percentile',
+    'weighted_roe', 'roe_weight', 'initial_score', 'composite_weight', 'composite_score'
+)
+
+# 载入行情的列数组类型
+HISTORY_DTYPE = [('index_id', np.int32), ('pe_ttm', np.float64), ('pb', np.float64)]
+
+# 预计算结果表中保存的列（不含随时可能变化的名称、自选状态、人为权重）
+STORED_COLUMNS = ('index_id', 'latest_date', 'pe_ttm', 'pb', 'pe_percentile', 'pb_percentile', 'weighted_roe')
+
+# 空值读出时的占位值（SQLite 把 NaN 存为 NULL，无法直接读出 NaN），载入后转为 NaN
+MISSING_VALUE = float('-inf')
+
+
+def _unindexed_date():
+    """+date：SQLite 不会对带一元运算符的列使用索引
+
+    近10年范围覆盖绝大部分行情，按日期索引筛选后还要用临时 B 树按指数重新排序或分组，
+    远慢于按 (指数, 日期) 唯一索引顺序扫描。
+    """
+    return UnaryExpression(IndexHistory.date, operator=operators.custom_op('+'), type_=IndexHistory.date.type)
+
+
+def group_bounds(group_ids):
+    """已排序分组ID数组中每组的起止位置（左闭右开）"""
+    starts = np.flatnonzero(np.r_[True, group_ids[1:] != group_ids[:-1]])
+    ends = np.r_[starts[1:], len(group_ids)]
+    return starts, ends
+
+
+def group_percentile(group_ids, values):
+    """分组计算最新值在组内历史中的分位数
+
+    口径与 Calculator.calculate_percentile 一致：每组最后一行为当前值，
+    当前值缺失或≤0时为空，否则为组内有效值（>0）中不大于当前值的占比。
+
+    Args:
+        group_ids: 分组ID数组（已按分组、日期排序）
+        values: 指标值数组（缺失为 NaN）
+
+    Returns:
+        tuple: (分组ID数组, 当前值数组, 分位数数组)
+    """
+    if len(group_ids) == 0:
+        return group_ids, values, values.copy()
+
+    starts, ends = group_bounds(group_ids)
+    current = values[ends - 1]
+
+    valid = values > 0
+    not_above = valid & (values <= np.repeat(current, ends - starts))
+    valid_count = np.add.reduceat(valid.astype(np.int64), starts)
+    not_above_count = np.add.reduceat(not_above.astype(np.int64), starts)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percentile = not_above_count / valid_count * 100
+    percentile[~(current > 0) | (valid_count == 0)] = np.nan
+
+    return group_ids[starts], current, percentile
+
+
+class ValuationScreener:
+    """全目录估值筛选器"""
+
+    def __init__(self, calculator, lookback_days=3650):
+        self.calculator = calculator
+        self.lookback_days = lookback_days
+        self._lock = threading.Lock()
+        self._cache_key = None
+        self._frame = None
+
+    def get_frame(self):
+        """获取筛选结果
+
+        分位数和加权ROE在原始数据入库版本号未变化时直接使用进程内缓存，
+        缓存未命中时优先读取预计算结果，没有时才全量计算；
+        指数名称、自选状态、人为权重每次读取最新值后再计算分数。
+        """
+        cache_key = get_ingest_version()
+
+        with self._lock:
+            if self._frame is None or self._cache_key != cache_key:
+                frame = self._load_stored(cache_key)
+                self._frame = frame if frame is not None else self.compute()
+                self._cache_key = cache_key
+            frame = self._frame
+
+        indices = pd.DataFrame(
+            db.session.query(Index.id, Index.code, Index.name, Index.is_favorite, Index.manual_weight).all(),
+            columns=['index_id', 'code', 'name', 'is_favorite', 'manual_weight']
+        )
+        return self._score(frame.merge(indices, on='index_id', how='inner'))
+
+    def refresh(self):
+        """全量计算并写入 screener_results 表（供每日任务调用），同时更新进程内缓存
+
+        Returns:
+            int: 写入的指数数，失败返回 None
+        """
+        try:
+            # 计算前读取版本号：计算期间有新数据入库时，结果按旧版本号保存，不会被误用
+            version = get_ingest_version()
+            frame = self.compute()
+
+            rows = frame_records(frame[list(STORED_COLUMNS)])
+            now = datetime.now()
+            for row in rows:
+                row['ingest_version'] = version
+                row['computed_at'] = now
+
+            db.session.query(ScreenerResult).delete(synchronize_session=False)
+            db.session.bulk_insert_mappings(ScreenerResult, rows)
+            db.session.commit()
+
+            with self._lock:
+                self._frame = frame
+                self._cache_key = version
+
+            logger.info(f"估值筛选结果已保存，共 {len(rows)} 个指数（入库版本 {version}）")
+            return len(rows)
+
+        except Exception as e:
+            logger.error(f"保存估值筛选结果失败: {str(e)}")
+            db.session.rollback()
+            return None
+
+    def _load_stored(self, version):
+        """读取指定入库版本号的预计算结果，没有时返回 None"""
+        rows = db.session.query(*[getattr(ScreenerResult, column) for column in STORED_COLUMNS]).filter(
+            ScreenerResult.ingest_version == version
+        ).all()
+        if not rows:
+            return None
+
+        frame = pd.DataFrame(rows, columns=list(STORED_COLUMNS))
+        for column in STORED_COLUMNS[2:]:
+            frame[column] = frame[column].astype(float)
+        logger.info(f"已载入预计算的估值筛选结果，共 {len(frame)} 个指数（入库版本 {version}）")
+        return frame
+
+    def compute(self):
+        """批量计算所有指数的估值分位数和分数
+
+        Returns:
+            DataFrame: 每个指数一行
+        """
+        start = datetime.now()
+        end_date = start.date()
+        start_date = end_date - timedelta(days=self.lookback_days)
+
+        history = self._load_history(start_date, end_date)
+
+        index_ids, pe_ttm, pe_percentile = group_percentile(history['index_id'], history['pe_ttm'])
+        _, pb, pb_percentile = group_percentile(history['index_id'], history['pb'])
+
+        frame = pd.DataFrame({
+            'index_id': index_ids.astype(int),
+            'pe_ttm': pe_ttm,
+            'pb': pb,
+            'pe_percentile': pe_percentile,
+            'pb_percentile': pb_percentile
+        })
+
+        # 最新行情日期（按 (指数, 日期) 唯一索引扫描分组，不经过日期索引）
+        latest_dates = dict(
+            db.session.query(IndexHistory.index_id, func.max(IndexHistory.date)).filter(
+                _unindexed_date() >= start_date,
+                _unindexed_date() <= end_date
+            ).group_by(IndexHistory.index_id).all()
+        )
+        frame['latest_date'] = frame['index_id'].map(lambda i: latest_dates[i].strftime('%Y-%m-%d'))
+
+        # 加权ROE
+        weighted_roe = self.calculator.calculate_all_weighted_roe()
+        frame['weighted_roe'] = frame['index_id'].map(weighted_roe).astype(float)
+
+        logger.info(f"估值筛选计算完成，共 {len(frame)} 个指数，"
+                    f"{len(history['index_id'])} 条行情，耗时 {(datetime.now() - start).total_seconds():.2f} 秒")
+        return frame
+
+    def _load_history(self, start_date, end_date):
+        """按 (指数, 日期) 顺序载入行情为列数组（不载入日期列，避免逐行解析日期）
+
+        日期条件不走日期索引，按 (指数, 日期) 唯一索引（紧凑模式下为主键）顺序扫描，无需排序。
+        结果直接从 DBAPI 游标写入 numpy 结构化数组，不构造 Row 对象和分批 DataFrame。
+        """
+        stmt = select(
+            IndexHistory.index_id,
+            func.coalesce(IndexHistory.pe_ttm, MISSING_VALUE),
+            func.coalesce(IndexHistory.pb, MISSING_VALUE)
+        ).where(
+            _unindexed_date() >= start_date,
+            _unindexed_date() <= end_date
+        ).order_by(IndexHistory.index_id, IndexHistory.date)
+
+        result = db.session.connection().execute(stmt)
+        try:
+            history = np.fromiter(result.cursor, dtype=HISTORY_DTYPE)
+        finally:
+            result.close()
+
+        columns = {name: history[name] for name, _ in HISTORY_DTYPE}
+        for name in ('pe_ttm', 'pb'):
+            columns[name][columns[name] == MISSING_VALUE] = np.nan
+        return columns
+
+    def _score(self, frame):
+        """向量化计算分位区间、初始分数、ROE权重和综合分数（口径同 Calculator）"""
+        ranges = self.calculator.PERCENTILE_RANGES
+        upper_bounds = np.array([max_p for _, max_p, _ in ranges[:-1]], dtype=float)
+        labels = np.array([f"{min_p}%-{max_p}%" for min_p, max_p, _ in ranges], dtype=object)
+        scores = np.array([score for _, _, score in ranges], dtype=float)
+
+        # PE分位数为主，缺失时使用PB分位数
+        main_percentile = frame['pe_percentile'].fillna(frame['pb_percentile']).to_numpy(dtype=float)
+        has_percentile = ~np.isnan(main_percentile)
+        bucket = np.searchsorted(upper_bounds, np.nan_to_num(main_percentile), side='right')
+
+        frame['percentile_range'] = np.where(has_percentile, labels[bucket], None)
+        frame['initial_score'] = np.where(has_percentile, scores[bucket], 0.0)
+
+        roe = frame['weighted_roe'].to_numpy(dtype=float)
+        roe_weight = np.where(
+            roe > 0,
+            np.maximum(0, 1.0 + (roe - self.calculator.ROE_ANCHOR) * self.calculator.ROE_SLOPE),
+            1.0
+        )
+        manual_weight = frame['manual_weight'].fillna(1.0).replace(0, 1.0).to_numpy(dtype=float)
+
+        frame['roe_weight'] = roe_weight
+        frame['composite_weight'] = roe_weight * manual_weight
+        frame['composite_score'] = frame['initial_score'] * frame['composite_weight']
+        return frame
+
+    def query(self, sort='composite_score', order='desc', page=1, page_size=50, search='',
+              is_favorite=None, max_pe_percentile=None, max_pb_percentile=None,
+              min_roe=None, percentile_range=None):
+        """筛选、排序、分页
+
+        Args:
+            sort: 排序字段（SORT_FIELDS 之一）
+            order: 'asc' 或 'desc'
+            page: 页码（从1开始）
+            page_size: 每页条数
+            search: 按代码或名称搜索
+            is_favorite: 只看自选/非自选
+            max_pe_percentile: PE分位数上限
+            max_pb_percentile: PB分位数上限
+            min_roe: 加权ROE下限
+            percentile_range: 分位区间，如 "0%-10%"
+
+        Returns:
+            tuple: (符合条件的总数, 当前页记录列表)
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"不支持的排序字段: {sort}")
+
+        frame = self.get_frame()
+        mask = np.ones(len(frame), dtype=bool)
+
+        if search:
+            mask &= (frame['code'].str.contains(search, regex=False) |
+                     frame['name'].str.contains(search, regex=False)).to_numpy()
+        if is_favorite is not None:
+            mask &= (frame['is_favorite'] == is_favorite).to_numpy()
+        if max_pe_percentile is not None:
+            mask &= (frame['pe_percentile'] <= max_pe_percentile).to_numpy()
+        if max_pb_percentile is not None:
+            mask &= (frame['pb_percentile'] <= max_pb_percentile).to_numpy()
+        if min_roe is not None:
+            mask &= (frame['weighted_roe'] >= min_roe).to_numpy()
+        if percentile_range:
+            mask &= (frame['percentile_range'] == percentile_range).to_numpy()
+
+        result = frame[mask].sort_values(
+            [sort, 'code'], ascending=[order == 'asc', True], na_position='last'
+        )
+
+        offset = (max(page, 1) - 1) * page_size
+        page_frame = result.iloc[offset:offset + page_size]
+        page_frame = page_frame.astype(object).where(page_frame.notna(), None)
+
+        return len(result), page_frame.to_dict('records')
@@ -0,0 +1,80 @@
+"""共享服务对象
+
+计算器、筛选器、抓取器、初始化器和每日任务管道在首次使用时才导入对应模块并创建，
+缓存在 app.extensions 中。只读进程只会用到计算器和筛选器，
+不会导入 akshare、APScheduler；pandas 也要到第一次需要它的请求时才加载。
+"""
+import threading
+from flask import current_app
+
+EXTENSION_KEY = 'invest'
+
+
+class Services:
+    """按需创建的共享服务对象"""
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.RLock()
+        self._instances = {}
+
+    def _get(self, name, factory):
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = self._instances[name] = factory()
+        return instance
+
+    @property
+    def calculator(self):
+        def create():
+            from calculator import Calculator
+            return Calculator()
+        return self._get('calculator', create)
+
+    @property
+    def screener(self):
+        def create():
+            from screener import ValuationScreener
+            return ValuationScreener(self.calculator)
+        return self._get('screener', create)
+
+    @property
+    def fetcher(self):
+        def create():
+            from data_fetcher import DataFetcher
+            return DataFetcher()
+        return self._get('fetcher', create)
+
+    @property
+    def initializer(self):
+        def create():
+            from initializer import DataInitializer
+            return DataInitializer(self.fetcher, self.calculator)
+        return self._get('initializer', create)
+
+    @property
+    def pipeline(self):
+        def create():
+            from scheduler import build_daily_pipeline
+            return build_daily_pipeline(self.app, self.calculator, self.fetcher, self.screener)
+        return self._get('pipeline', create)
+
+    def start_scheduler(self, lease=None, catch_up=False, job_lock=None):
+        """启动每日定时任务（与接口共用同一个任务管道）
+
+        Args:
+            lease: LeaseLock实例（可选），每次执行前续约
+            catch_up: 已过当日触发时间时是否立即补跑
+            job_lock: threading.Lock（可选），任务执行期间持有
+        """
+        from scheduler import init_scheduler
+        return init_scheduler(self.app, self.calculator, self.fetcher, self.screener,
+                              pipeline=self.pipeline, lease=lease, catch_up=catch_up, job_lock=job_lock)
+
+
+def get_services():
+    """当前应用的共享服务对象"""
+    return current_app.extensions[EXTENSION_KEY]
@@ -0,0 +1,312 @@
+"""只读估值快照（内存映射）
+
+把数据库中的时间序列整理成连续的二进制数组（.npy），供研究进程和并行计算进程
+以内存映射方式只读打开：多个进程打开同一份快照时共享操作系统页缓存，
+不再各自从 SQLite 读取并持有一份十年序列的副本。
+
+快照目录结构：
+    <根目录>/CURRENT                 当前版本目录名（原子替换）
+    <根目录>/<版本>/meta.json         指数代码、股票代码、报告期等元数据
+    <根目录>/<版本>/dates.npy         全部交易日（date.toordinal()，升序）
+    <根目录>/<版本>/index_ids.npy     指数ID（升序）
+    <根目录>/<版本>/pe_ttm.npy        [指数数, 交易日数] float64，缺失为 NaN（每个指数一行，行内连续）
+    <根目录>/<版本>/pb.npy            同上
+    <根目录>/<版本>/close.npy         同上
+    <根目录>/<版本>/cons_indptr.npy   最新成份股（CSR 格式）行指针 [指数数 + 1]
+    <根目录>/<版本>/cons_stock.npy    成份股在股票列表中的位置
+    <根目录>/<版本>/cons_weight.npy   成份股权重（%）
+    <根目录>/<版本>/report_dates.npy  报告期（ordinal，升序）
+    <根目录>/<版本>/net_profit.npy    [股票数, 报告期数] 累计净利润
+    <根目录>/<版本>/equity.npy        [股票数, 报告期数] 净资产
+    <根目录>/<版本>/ttm_roe.npy       [股票数, 报告期数] 滚动ROE（%）
+"""
+import json
+import logging
+import os
+import shutil
+import numpy as np
+from datetime import date, datetime
+from sqlalchemy import select, func
+from models import db, Index, IndexHistory, IndexConstituent, StockFinancial, StockTTMRoe
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_DIR = os.environ.get(
+    'SNAPSHOT_DIR', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'snapshot')
+)
+
+VALUATION_FIELDS = ('pe_ttm', 'pb', 'close')
+FETCH_CHUNK_SIZE = 100000
+KEEP_VERSIONS = 2
+
+
+def _ordinals(dates):
+    return np.array([d.toordinal() for d in dates], dtype=np.int32)
+
+
+class ValuationSnapshot:
+    """只读估值快照"""
+
+    def __init__(self, directory, arrays, meta):
+        self.directory = directory
+        self.meta = meta
+        self.dates = arrays['dates']
+        self.index_ids = arrays['index_ids']
+        self.valuations = {field: arrays[field] for field in VALUATION_FIELDS}
+        self.cons_indptr = arrays['cons_indptr']
+        self.cons_stock = arrays['cons_stock']
+        self.cons_weight = arrays['cons_weight']
+        self.report_dates = arrays['report_dates']
+        self.net_profit = arrays['net_profit']
+        self.equity = arrays['equity']
+        self.ttm_roe = arrays['ttm_roe']
+        self.index_codes = meta['index_codes']
+        self.stock_codes = meta['stock_codes']
+        self._stock_pos = {code: i for i, code in enumerate(self.stock_codes)}
+
+    # ------------------------------------------------------------------ 生成
+
+    @classmethod
+    def build(cls, root=None):
+        """从数据库生成新版本快照
+
+        数组直接写入磁盘上的 .npy（open_memmap），按块流式读取数据库，
+        生成过程的内存占用与数据量无关。写完后原子替换 CURRENT 指针。
+
+        Args:
+            root: 快照根目录，默认 SNAPSHOT_DIR 或 backend/snapshot
+
+        Returns:
+            str: 新版本目录
+        """
+        root = root or DEFAULT_SNAPSHOT_DIR
+        os.makedirs(root, exist_ok=True)
+        version = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        directory = os.path.join(root, version)
+        os.makedirs(directory)
+
+        try:
+            meta = {'created_at': datetime.now().isoformat()}
+            cls._build_valuations(directory, meta)
+            cls._build_stocks(directory, meta)
+
+            with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+
+            pointer_tmp = os.path.join(root, f'CURRENT.{os.getpid()}')
+            with open(pointer_tmp, 'w') as f:
+                f.write(version)
+            os.replace(pointer_tmp, os.path.join(root, 'CURRENT'))
+
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+        cls._prune(root, version)
+        logger.info(f"估值快照生成成功: {directory}")
+        return directory
+
+    @staticmethod
+    def _build_valuations(directory, meta):
+        dates = _ordinals(d for d, in db.session.query(IndexHistory.date).distinct().order_by(IndexHistory.date))
+        index_ids = np.array(
+            [i for i, in db.session.query(IndexHistory.index_id).distinct().order_by(IndexHistory.index_id)],
+            dtype=np.int64
+        )
+        codes = dict(db.session.query(Index.id, Index.code).all())
+        meta['index_codes'] = [codes.get(int(i)) for i in index_ids]
+
+        np.save(os.path.join(directory, 'dates.npy'), dates)
+        np.save(os.path.join(directory, 'index_ids.npy'), index_ids)
+
+        shape = (len(index_ids), len(dates))
+        matrices = {}
+        for field in VALUATION_FIELDS:
+            matrices[field] = np.lib.format.open_memmap(
+                os.path.join(directory, f'{field}.npy'), mode='w+', dtype=np.float64, shape=shape
+            )
+            matrices[field][:] = np.nan
+
+        columns = [IndexHistory.index_id, IndexHistory.date] + [getattr(IndexHistory, f) for f in VALUATION_FIELDS]
+        with db.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(select(*columns))
+            while True:
+                rows = result.fetchmany(FETCH_CHUNK_SIZE)
+                if not rows:
+                    break
+                rows_idx = np.searchsorted(index_ids, np.array([r[0] for r in rows], dtype=np.int64))
+                cols_idx = np.searchsorted(dates, _ordinals(r[1] for r in rows))
+                for offset, field in enumerate(VALUATION_FIELDS, start=2):
+                    values = np.array([r[offset] for r in rows], dtype=np.float64)
+                    matrices[field][rows_idx, cols_idx] = values
+
+        for matrix in matrices.values():
+            matrix.flush()
+        meta['valuation_shape'] = list(shape)
+
+    @staticmethod
+    def _build_stocks(directory, meta):
+        """生成最新成份股（CSR）与股票 × 报告期财务矩阵"""
+        index_ids = np.load(os.path.join(directory, 'index_ids.npy'))
+        id_pos = {int(i): pos for pos, i in enumerate(index_ids)}
+
+        # 每个指数的最新成份股（没有历史数据的指数不纳入）
+        latest = db.session.query(
+            IndexConstituent.index_id,
+            func.max(IndexConstituent.date).label('date')
+        ).group_by(IndexConstituent.index_id).subquery()
+        cons_rows = [
+            r for r in db.session.query(
+                IndexConstituent.index_id, IndexConstituent.stock_code, IndexConstituent.weight
+            ).join(
+                latest,
+                (latest.c.index_id == IndexConstituent.index_id) & (latest.c.date == IndexConstituent.date)
+            ).all()
+            if r[0] in id_pos
+        ]
+        cons_rows.sort(key=lambda r: id_pos[r[0]])
+
+        fin_rows = db.session.query(
+            StockFinancial.stock_code, StockFinancial.report_date,
+            StockFinancial.net_profit, StockFinancial.equity
+        ).all()
+        roe_rows = db.session.query(
+            StockTTMRoe.stock_code, StockTTMRoe.report_date, StockTTMRoe.roe
+        ).all()
+
+        # 股票列表覆盖成份股与有财务数据的股票
+        stock_codes = sorted({r[1] for r in cons_rows} | {r[0] for r in fin_rows})
+        stock_pos = {code: i for i, code in enumerate(stock_codes)}
+        meta['stock_codes'] = stock_codes
+
+        counts = np.bincount([id_pos[r[0]] for r in cons_rows], minlength=len(index_ids))
+        indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        np.save(os.path.join(directory, 'cons_indptr.npy'), indptr)
+        np.save(os.path.join(directory, 'cons_stock.npy'),
+                np.array([stock_pos[r[1]] for r in cons_rows], dtype=np.int32))
+        np.save(os.path.join(directory, 'cons_weight.npy'),
+                np.array([r[2] if r[2] is not None else 0.0 for r in cons_rows], dtype=np.float64))
+
+        report_dates = np.unique(_ordinals(r[1] for r in fin_rows))
+        np.save(os.path.join(directory, 'report_dates.npy'), report_dates)
+
+        shape = (len(stock_codes), len(report_dates))
+        for field, source, offset in (('net_profit', fin_rows, 2), ('equity', fin_rows, 3), ('ttm_roe', roe_rows, 2)):
+            matrix = np.full(shape, np.nan)
+            if source:
+                rows_idx = np.array([stock_pos[r[0]] for r in source])
+                cols_idx = np.searchsorted(report_dates, _ordinals(r[1] for r in source))
+                values = np.array([r[offset] for r in source], dtype=np.float64)
+                matrix[rows_idx, cols_idx] = values
+            np.save(os.path.join(directory, f'{field}.npy'), matrix)
+
+    @staticmethod
+    def _prune(root, current):
+        """删除旧版本（保留最近 KEEP_VERSIONS 个）；仍被映射的文件在 Windows 上可能删除失败，忽略即可"""
+        versions = sorted(
+            name for name in os.listdir(root)
+            if os.path.isdir(os.path.join(root, name)) and name != current
+        )
+        for name in versions[:max(0, len(versions) - (KEEP_VERSIONS - 1))]:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    # ------------------------------------------------------------------ 读取
+
+    @classmethod
+    def open(cls, root=None):
+        """以只读内存映射方式打开当前版本快照
+
+        Returns:
+            ValuationSnapshot 或 None（尚未生成快照）
+        """
+        root = root or DEFAULT_SNAPSHOT_DIR
+        pointer = os.path.join(root, 'CURRENT')
+        if not os.path.exists(pointer):
+            return None
+
+        with open(pointer) as f:
+            directory = os.path.join(root, f.read().strip())
+
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+
+        arrays = {}
+        for name in os.listdir(directory):
+            if name.endswith('.npy'):
+                arrays[name[:-4]] = np.load(os.path.join(directory, name), mmap_mode='r')
+
+        return cls(directory, arrays, meta)
+
+    def _index_pos(self, index_id):
+        pos = np.searchsorted(self.index_ids, index_id)
+        if pos >= len(self.index_ids) or self.index_ids[pos] != index_id:
+            return None
+        return int(pos)
+
+    def series(self, index_id, field='pe_ttm', start_date=None, end_date=None):
+        """获取指数估值序列（零拷贝视图）
+
+        Args:
+            index_id: 指数ID
+            field: 'pe_ttm' / 'pb' / 'close'
+            start_date, end_date: 日期范围（含），默认全部
+
+        Returns:
+            tuple: (日期ordinal数组, 数值数组)，缺失为 NaN；指数不存在时返回 None
+        """
+        pos = self._index_pos(index_id)
+        if pos is None:
+            return None
+
+        lo = 0 if start_date is None else int(np.searchsorted(self.dates, start_date.toordinal(), side='left'))
+        hi = len(self.dates) if end_date is None else int(np.searchsorted(self.dates, end_date.toordinal(), side='right'))
+        return self.dates[lo:hi], self.valuations[field][pos, lo:hi]
+
+    def constituents(self, index_id):
+        """获取指数最新成份股
+
+        Returns:
+            tuple: (股票代码列表, 权重数组)；指数不存在时返回 None
+        """
+        pos = self._index_pos(index_id)
+        if pos is None:
+            return None
+        lo, hi = self.cons_indptr[pos], self.cons_indptr[pos + 1]
+        return [self.stock_codes[i] for i in self.cons_stock[lo:hi]], self.cons_weight[lo:hi]
+
+    def financials(self, stock_code):
+        """获取股票各报告期财务数据
+
+        Returns:
+            dict: report_dates / net_profit / equity / ttm_roe 数组；股票不存在时返回 None
+        """
+        pos = self._stock_pos.get(stock_code)
+        if pos is None:
+            return None
+        return {
+            'report_dates': self.report_dates,
+            'net_profit': self.net_profit[pos],
+            'equity': self.equity[pos],
+            'ttm_roe': self.ttm_roe[pos]
+        }
+
+    @staticmethod
+    def to_dates(ordinals):
+        """ordinal 数组转换为 date 列表"""
+        return [date.fromordinal(int(o)) for o in ordinals]
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='生成只读估值快照')
+    parser.add_argument('root', nargs='?', default=None, help='快照根目录，默认 SNAPSHOT_DIR 或 backend/snapshot')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        print(ValuationSnapshot.build(args.root))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""暂存表入库：先整批载入临时表，再用一条集合式语句合并到目标表
+
+抓取到的数据先在 pandas 中清洗，再整批写入 TEMP 暂存表（临时表位于独立的 temp 库，写入不占用主库的写锁），
+随后每张目标表只执行一条 INSERT ... SELECT ... ON CONFLICT DO UPDATE，按自然键插入新行、更新已有行。
+主库写锁只在合并语句到提交之间持有，不再覆盖逐行查询、构造对象的整个循环，读请求和其他写入等待的时间随之缩短。
+
+暂存表列类型沿用目标表，日期等类型的转换（如紧凑存储的 OrdinalDate）在载入时完成，
+合并语句只在同类型的列之间复制，两种存储模式下语句相同。
+"""
+import logging
+from sqlalchemy import Column, MetaData, Table, and_, delete, exists, select, text, true
+from sqlalchemy.dialects.sqlite import insert
+from models import db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def frame_records(frame):
+    """DataFrame 转为字典列表：numpy 标量转为 Python 类型，NaN/NaT/NA 转为 None"""
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def _staging_table(model, columns):
+    target = model.__table__
+    return Table(
+        f'staging_{target.name}', MetaData(),
+        *[Column(column, target.c[column].type) for column in columns],
+        prefixes=['TEMPORARY']
+    )
+
+
+def merge_frame(model, frame, key_columns, update_columns=None, prune=None):
+    """把一批数据经暂存表合并到目标表（不提交，由调用方提交）
+
+    Args:
+        model: 目标模型类，key_columns 上须有主键或唯一约束
+        frame: 已清洗的 DataFrame，列名为目标表列名，自然键不可重复
+        key_columns: 自然键列名列表（ON CONFLICT 目标）
+        update_columns: 冲突时更新的列，默认 frame 中除自然键外的全部列
+        prune: 可选的过滤条件列表，目标表中满足条件且自然键不在本批数据中的行会被删除
+            （用于按快照整体替换，如某指数某日的成份股）
+
+    Returns:
+        int: 合并的行数
+    """
+    columns = list(frame.columns)
+    if update_columns is None:
+        update_columns = [column for column in columns if column not in key_columns]
+    if frame.empty:
+        return 0
+
+    connection = db.session.connection()
+    staging = _staging_table(model, columns)
+    target = model.__table__
+
+    # 暂存表只属于当前连接，连接复用时可能残留上一次的表
+    connection.execute(text(f'DROP TABLE IF EXISTS temp.{staging.name}'))
+    staging.create(connection)
+    connection.execute(staging.insert(), frame_records(frame))
+
+    if prune:
+        connection.execute(delete(target).where(
+            and_(*prune),
+            ~exists().where(and_(*[staging.c[key] == target.c[key] for key in key_columns]))
+        ))
+
+    # SQLite 要求 INSERT ... SELECT 带 WHERE 子句，否则 ON CONFLICT 会被解析为联结条件
+    statement = insert(target).from_select(
+        columns, select(*[staging.c[column] for column in columns]).where(true())
+    )
+    if update_columns:
+        statement = statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={column: statement.excluded[column] for column in update_columns}
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=key_columns)
+    connection.execute(statement)
+    staging.drop(connection)
+
+    return len(frame)
@@ -0,0 +1,138 @@
+"""股票滚动ROE（TTM）派生数据
+
+由 StockFinancial 的累计财务数据计算每只股票每个报告期的：
+近四季度单季净利润之和、近四季度净资产均值以及滚动ROE，
+结果写入 StockTTMRoe 表，供指数加权ROE计算直接关联使用。
+"""
+import pandas as pd
+import numpy as np
+from sqlalchemy import func, select, union_all
+from models import db, StockFinancial, StockTTMRoe
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 计算一个报告期的滚动ROE需要的此前报告期数（4个单季度净利润差分需要再往前1期）
+TTM_PRIOR_PERIODS = 4
+
+
+def _load_financials(since=None):
+    """载入计算滚动ROE所需的财务数据
+
+    since 为空时载入全部；否则只载入该报告期及之后的数据，外加每只股票此前最近的
+    TTM_PRIOR_PERIODS 期（按行数而不是按日期取，与全量计算时 shift 的口径一致）。
+    """
+    columns = [StockFinancial.stock_code, StockFinancial.report_date, StockFinancial.net_profit, StockFinancial.equity]
+    if since is None:
+        stmt = select(*columns)
+    else:
+        prior = select(
+            *columns,
+            func.row_number().over(
+                partition_by=StockFinancial.stock_code, order_by=StockFinancial.report_date.desc()
+            ).label('position')
+        ).where(StockFinancial.report_date < since).subquery()
+        stmt = union_all(
+            select(prior.c.stock_code, prior.c.report_date, prior.c.net_profit, prior.c.equity).where(
+                prior.c.position <= TTM_PRIOR_PERIODS
+            ),
+            select(*columns).where(StockFinancial.report_date >= since)
+        )
+    return pd.DataFrame(
+        db.session.execute(stmt).all(),
+        columns=['stock_code', 'report_date', 'net_profit', 'equity']
+    )
+
+
+def compute_ttm_roe(df):
+    """向量化计算滚动ROE
+    
+    对每只股票按报告期升序，某报告期需要包含自身在内的5期数据：
+    单季度净利润 = 本期累计 - 上期累计（一季报直接取累计值），
+    取最近4个单季度之和作为TTM净利润，最近4期净资产均值作为平均净资产。
+    
+    Args:
+        df: 包含 stock_code, report_date, net_profit, equity 列的DataFrame
+        
+    Returns:
+        DataFrame: stock_code, report_date, ttm_net_profit, avg_equity, roe
+    """
+    df = df.sort_values(['stock_code', 'report_date']).reset_index(drop=True)
+    grouped = df.groupby('stock_code', sort=False)
+    
+    # 单季度净利润（累计净利润相减）
+    is_q1 = pd.to_datetime(df['report_date']).dt.month == 3
+    previous_profit = grouped['net_profit'].shift(1)
+    df['single'] = df['net_profit'] - previous_profit.where(~is_q1, 0.0)
+    
+    # 近四个单季度之和，任一缺失则为空
+    single_grouped = df.groupby('stock_code', sort=False)['single']
+    ttm = df['single'].copy()
+    for lag in range(1, 4):
+        ttm = ttm + single_grouped.shift(lag)
+    
+    # 近四期净资产均值（忽略缺失值）
+    avg_equity = (
+        grouped['equity']
+        .rolling(4, min_periods=1)
+        .mean()
+        .reset_index(level=0, drop=True)
+    )
+    
+    # 至少需要5期数据才能得到4个单季度净利润
+    enough_history = grouped.cumcount() >= 4
+    ttm = ttm.where(enough_history)
+    avg_equity = avg_equity.where(enough_history)
+    
+    roe = (ttm / avg_equity * 100).where(avg_equity > 0)
+    
+    result = pd.DataFrame({
+        'stock_code': df['stock_code'],
+        'report_date': df['report_date'],
+        'ttm_net_profit': ttm,
+        'avg_equity': avg_equity,
+        'roe': roe
+    })
+    return result.replace([np.inf, -np.inf], np.nan)
+
+
+def refresh_stock_ttm_roe(since=None):
+    """增量更新滚动ROE表
+    
+    Args:
+        since: 报告期（date），只重算该报告期及之后的数据；
+               为空或派生表尚无数据时全量重建
+            
+    Returns:
+        int: 写入的行数
+    """
+    try:
+        if since is not None and not db.session.query(StockTTMRoe.stock_code).first():
+            since = None
+        
+        financials = _load_financials(since)
+        
+        if financials.empty:
+            return 0
+        
+        result = compute_ttm_roe(financials)
+        
+        delete_query = StockTTMRoe.query
+        if since is not None:
+            result = result[result['report_date'] >= since]
+            delete_query = delete_query.filter(StockTTMRoe.report_date >= since)
+        delete_query.delete(synchronize_session=False)
+        
+        records = result.astype(object).where(result.notna(), None).to_dict('records')
+        if records:
+            db.session.bulk_insert_mappings(StockTTMRoe, records)
+        db.session.commit()
+        
+        logger.info(f"滚动ROE更新成功，共 {len(records)} 条")
+        return len(records)
+        
+    except Exception as e:
+        logger.error(f"更新滚动ROE失败: {str(e)}")
+        db.session.rollback()
+        return 0
@@ -0,0 +1,176 @@
+"""策略参数扫描
+
+对分位区间/分数表（PERCENTILE_RANGES）、ROE权重参数（锚点、斜率）等组合做网格扫描：
+回测输入（每日分位数、加权ROE、收盘价等）只用 prepare_backtest_data 计算一次，
+通过进程池的 initializer 分发到每个工作进程，各组合只做向量化回放，
+结果按指定指标排名后写入 CSV。
+
+网格文件（JSON）格式，除 percentile_ranges 外每项均为候选值列表，缺省项使用默认值:
+    {
+        "percentile_ranges": {
+            "default": [[0, 10, 40], [10, 20, 35], [20, 35, 30], [35, 50, 25],
+                        [50, 65, 20], [65, 80, 15], [80, 90, 10], [90, 100, 5]],
+            "coarse": [[0, 20, 40], [20, 50, 25], [50, 80, 10], [80, 100, 0]]
+        },
+        "roe_anchor": [8, 10, 12],
+        "roe_slope": [0.05, 0.1, 0.2],
+        "rebalance": ["daily", "signal"],
+        "use_stock_bond": [false],
+        "cost_bps": [5]
+    }
+
+用法:
+    python sweep.py grid.json --start 2016-01-01 --output sweep.csv [--codes 000300 000905] [--processes 4]
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from calculator import Calculator
+from backtest import prepare_backtest_data, run_backtest
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 网格参数及默认值（percentile_ranges 以名称区分，默认为当前配置）
+SWEEP_PARAMETERS = {
+    'percentile_ranges': {'default': Calculator.PERCENTILE_RANGES},
+    'roe_anchor': [Calculator.ROE_ANCHOR],
+    'roe_slope': [Calculator.ROE_SLOPE],
+    'rebalance': ['daily'],
+    'use_stock_bond': [False],
+    'cost_bps': [0.0],
+}
+
+# 可用于排名的指标及方向（True 为越大越好）
+RANK_FIELDS = {
+    'annual_return': True,
+    'total_return': True,
+    'calmar': True,
+    'max_drawdown': True,
+    'annual_volatility': False,
+    'annual_turnover': False,
+}
+
+# 工作进程共享的回测输入（由进程池 initializer 设置）
+_shared_data = None
+
+
+def build_grid(spec):
+    """展开参数网格
+
+    Args:
+        spec: 网格配置（格式见模块说明）
+
+    Returns:
+        list: 参数组合列表，percentile_ranges 为 (名称, 区间表)
+    """
+    unknown = set(spec) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f"不支持的扫描参数: {', '.join(sorted(unknown))}")
+
+    ranges = spec.get('percentile_ranges', SWEEP_PARAMETERS['percentile_ranges'])
+    if isinstance(ranges, list):
+        ranges = {f'ranges_{i}': table for i, table in enumerate(ranges)}
+    ranges = [(name, [tuple(r) for r in table]) for name, table in ranges.items()]
+
+    names = [name for name in SWEEP_PARAMETERS if name != 'percentile_ranges']
+    values = [spec.get(name, SWEEP_PARAMETERS[name]) for name in names]
+
+    return [
+        dict(zip(['percentile_ranges'] + names, combination))
+        for combination in itertools.product(ranges, *values)
+    ]
+
+
+def _init_worker(data):
+    """进程池初始化：每个工作进程只接收一次回测输入"""
+    global _shared_data
+    _shared_data = data
+
+
+def _evaluate(config):
+    """在共享输入上回放一个参数组合"""
+    name, ranges = config['percentile_ranges']
+    params = {key: value for key, value in config.items() if key != 'percentile_ranges'}
+
+    summary = run_backtest(_shared_data, percentile_ranges=ranges, **params)['summary']
+    drawdown = abs(summary['max_drawdown'])
+    summary['calmar'] = summary['annual_return'] / drawdown if drawdown and summary['annual_return'] is not None else None
+
+    return {'percentile_ranges': name, **params, **summary}
+
+
+def run_sweep(data, configs, processes=None, rank_by='annual_return'):
+    """在进程池上扫描参数组合
+
+    Args:
+        data: prepare_backtest_data 的返回值（所有组合共享）
+        configs: build_grid 返回的参数组合列表
+        processes: 进程数，默认 CPU 核数；1 时在当前进程内执行
+        rank_by: 排名指标（RANK_FIELDS 之一）
+
+    Returns:
+        DataFrame: 每个组合一行，按排名排序，rank 从1开始
+    """
+    if rank_by not in RANK_FIELDS:
+        raise ValueError(f"不支持的排名指标: {rank_by}")
+
+    processes = processes or os.cpu_count() or 1
+    start = datetime.now()
+
+    if processes == 1 or len(configs) == 1:
+        _init_worker(data)
+        results = [_evaluate(config) for config in configs]
+    else:
+        chunksize = max(1, len(configs) // (processes * 4))
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(data,)) as executor:
+            results = list(executor.map(_evaluate, configs, chunksize=chunksize))
+
+    frame = pd.DataFrame(results).sort_values(
+        rank_by, ascending=not RANK_FIELDS[rank_by], na_position='last'
+    ).reset_index(drop=True)
+    frame.insert(0, 'rank', frame.index + 1)
+
+    logger.info(f"参数扫描完成，共 {len(configs)} 个组合，{processes} 个进程，"
+                f"耗时 {(datetime.now() - start).total_seconds():.2f} 秒")
+    return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description='策略参数扫描')
+    parser.add_argument('grid', help='网格配置 JSON 文件')
+    parser.add_argument('--codes', nargs='+', help='指数代码，默认全部自选指数')
+    parser.add_argument('--start', required=True, help='开始日期 YYYY-MM-DD')
+    parser.add_argument('--end', default=None, help='结束日期 YYYY-MM-DD，默认今天')
+    parser.add_argument('--output', default='sweep.csv', help='结果 CSV 文件')
+    parser.add_argument('--processes', type=int, default=None, help='进程数，默认 CPU 核数')
+    parser.add_argument('--rank-by', choices=list(RANK_FIELDS), default='annual_return', help='排名指标')
+    args = parser.parse_args()
+
+    with open(args.grid, encoding='utf-8') as f:
+        configs = build_grid(json.load(f))
+
+    start_date = datetime.strptime(args.start, '%Y-%m-%d').date()
+    end_date = datetime.strptime(args.end, '%Y-%m-%d').date() if args.end else datetime.now().date()
+
+    from app import app
+    from models import Index
+    with app.app_context():
+        query = Index.query.filter(Index.code.in_(args.codes)) if args.codes else Index.query.filter_by(is_favorite=True)
+        index_ids = [index.id for index in query.order_by(Index.code).all()]
+        data = prepare_backtest_data(index_ids, start_date, end_date)
+
+    frame = run_sweep(data, configs, processes=args.processes, rank_by=args.rank_by)
+    frame.to_csv(args.output, index=False)
+
+    print(frame.head(10).to_string(index=False))
+    print(f'共 {len(frame)} 个组合，结果已写入 {args.output}')
+
+
+if __name__ == '__main__':
+    main()
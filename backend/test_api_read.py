@@ -0,0 +1,64 @@
+"""
+测试指数列表接口：最新行情与最新指标按指数取最新一行，查询次数与指数数量无关
+"""
+from datetime import date
+from sqlalchemy import event
+from models import db, Index, IndexHistory, CalculatedMetrics
+
+
+def _add_index(code, closes, is_favorite=False):
+    index = Index(code=code, name=code, is_favorite=is_favorite)
+    db.session.add(index)
+    db.session.flush()
+    for day, close in enumerate(closes, start=2):
+        db.session.add(IndexHistory(index_id=index.id, date=date(2024, 1, day), close=close, pe_ttm=close / 100))
+        db.session.add(CalculatedMetrics(index_id=index.id, date=date(2024, 1, day), composite_score=close))
+    db.session.commit()
+    return index.id
+
+
+def _count_queries(client, path):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response.get_json(), len(statements)
+
+
+def test_indices_use_latest_rows(client):
+    _add_index('000300', [3000, 3100, 3050], is_favorite=True)
+    _add_index('000905', [5000, 5200])
+    db.session.add(Index(code='000016', name='上证50'))
+    db.session.commit()
+
+    body, _ = _count_queries(client, '/api/indices')
+    rows = {row['code']: row for row in body['data']}
+    assert body['total'] == 3
+    assert [row['code'] for row in body['data']] == ['000016', '000300', '000905']
+    assert rows['000300']['latest_date'] == '2024-01-04' and rows['000300']['close'] == 3050
+    assert rows['000300']['metrics']['composite_score'] == 3050
+    assert rows['000905']['pe_ttm'] == 52
+    assert 'latest_date' not in rows['000016'] and 'metrics' not in rows['000016']
+
+    favorites, _ = _count_queries(client, '/api/indices?is_favorite=true')
+    assert [row['code'] for row in favorites['data']] == ['000300']
+    assert favorites['data'][0]['close'] == 3050
+
+
+def test_indices_query_count_independent_of_catalog_size(client):
+    for i in range(3):
+        _add_index(f'00000{i}', [1000 + i])
+    _, small = _count_queries(client, '/api/indices?search=0000')
+
+    for i in range(3, 9):
+        _add_index(f'00000{i}', [1000 + i])
+    body, large = _count_queries(client, '/api/indices?search=0000')
+    assert body['total'] == 9
+    assert large == small
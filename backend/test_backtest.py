@@ -0,0 +1,110 @@
+"""
+测试策略回测：滚动分位数与分位数引擎口径一致，确定性数据上的回放结果，以及 /api/backtest 的参数限制
+"""
+from datetime import date, timedelta
+import numpy as np
+import pytest
+from backtest import MAX_BACKTEST_DAYS, MAX_BACKTEST_INDICES, rolling_percentile, run_backtest
+from models import db, Index, IndexHistory
+from percentile_engine import window_percentiles
+
+
+def test_rolling_percentile_matches_engine():
+    rng = np.random.default_rng(3)
+    dates = np.cumsum(rng.integers(1, 4, size=600)).astype(np.int64) + date(2015, 1, 1).toordinal()
+    values = np.round(10 + rng.normal(size=600).cumsum(), 1)
+    values[rng.random(600) < 0.05] = np.nan
+
+    result = rolling_percentile(dates, values, lookback_days=365, eval_from=100)
+    assert np.isnan(result[:100]).all()
+    for i in range(100, len(dates)):
+        expected, _ = window_percentiles(dates, values, date.fromordinal(int(dates[i])),
+                                         windows=(('lookback', 365),))['lookback']
+        if expected is None:
+            assert np.isnan(result[i])
+        else:
+            assert result[i] == pytest.approx(expected)
+
+
+def _data(pe_percentile, close):
+    days = len(close)
+    return {
+        'dates': np.arange(days) + date(2024, 1, 1).toordinal(),
+        'codes': ['A', 'B'],
+        'close': np.array(close, dtype=float),
+        'pe_percentile': np.array(pe_percentile, dtype=float),
+        'pb_percentile': np.full((days, 2), np.nan),
+        'weighted_roe': np.full((days, 2), np.nan),
+        'manual_weight': np.ones(2),
+        'stock_allocation': np.full(days, np.nan),
+        'bond_yield': np.full(days, np.nan),
+        'benchmark': np.full(days, np.nan),
+    }
+
+
+def test_daily_rebalance_holds_score_weights():
+    # A 处于最低分位区间（40分）每天上涨1%，B 处于最高分位区间（5分）不变
+    close = [[100 * 1.01 ** t, 100] for t in range(5)]
+    result = run_backtest(_data([[5, 95]] * 5, close))
+
+    np.testing.assert_allclose(result['weights'][-1], [40 / 45, 5 / 45])
+    np.testing.assert_allclose(result['nav'], (1 + 0.01 * 40 / 45) ** np.arange(5))
+    assert result['summary']['rebalance_count'] == 5
+    assert result['summary']['add_signals'] == 0 and result['summary']['reduce_signals'] == 0
+
+
+def test_signal_rebalance_only_on_range_breakout():
+    # 第3天 A 的分位数升至 50%（突破原区间上限 10%，进入 50%-65% 区间）产生减仓信号
+    percentiles = [[5, 95], [6, 95], [50, 95], [50, 95]]
+    close = [[100, 100], [110, 100], [110, 100], [121, 100]]
+    result = run_backtest(_data(percentiles, close), rebalance='signal', cost_bps=10)
+
+    assert result['signals']['reduce'][:, 0].tolist() == [False, False, True, False]
+    assert result['summary']['rebalance_count'] == 2
+    assert result['turnover'][0] == 0 and result['turnover'][1] == 0 and result['turnover'][2] > 0
+
+    # 第2天 A 随价格漂移，没有调仓
+    drifted = 40 / 45 * 1.1
+    np.testing.assert_allclose(result['weights'][1], [drifted, 5 / 45] / np.sum([drifted, 5 / 45]))
+    np.testing.assert_allclose(result['weights'][2], [20 / 25, 5 / 25])
+
+    with pytest.raises(ValueError):
+        run_backtest(_data(percentiles, close), rebalance='weekly')
+
+
+@pytest.fixture
+def favorites(app):
+    ids = []
+    for code, drift in (('000300', 0.001), ('000905', -0.001)):
+        index = Index(code=code, name=code, is_favorite=True)
+        db.session.add(index)
+        db.session.flush()
+        ids.append(index.id)
+        for i in range(120):
+            day = date(2023, 1, 2) + timedelta(days=i)
+            db.session.add(IndexHistory(index_id=index.id, date=day, close=100 * (1 + drift) ** i,
+                                        pe_ttm=10 + (i % 17) * 0.5))
+    db.session.commit()
+    return ids
+
+
+def test_backtest_api(client, favorites):
+    response = client.post('/api/backtest', json={'start_date': '2023-03-01', 'end_date': '2023-04-30'})
+    body = response.get_json()
+    assert response.status_code == 200, body
+    assert len(body['data']['nav']) == 61
+    assert body['data']['nav'][0] == {'date': '2023-03-01', 'nav': 1.0}
+    assert sum(body['data']['weights'].values()) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('payload', [
+    {'start_date': '2023-03-01', 'end_date': '2023-02-01'},
+    {'start_date': '2000-01-01', 'end_date': (date(2000, 1, 1) + timedelta(days=MAX_BACKTEST_DAYS + 1)).isoformat()},
+    {'start_date': '2023-03-01', 'end_date': '2023-04-30', 'index_ids': list(range(1, MAX_BACKTEST_INDICES + 2))},
+    {'start_date': '2023-03-01', 'rebalance': 'weekly'},
+    {'end_date': '2023-04-30'},
+])
+def test_backtest_api_rejects_invalid_requests(client, favorites, payload):
+    response = client.post('/api/backtest', json=payload)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
@@ -0,0 +1,69 @@
+"""
+测试仪表盘推送：差异计算、同步事件流的重连间隔、最长连接时间与 Last-Event-ID 续传
+"""
+import threading
+import time
+from datetime import date
+from data_version import bump_data_version, get_data_version
+from dashboard import dashboard_delta, dashboard_events, RECONNECT_DELAY_MS
+from models import db, Index, CalculatedMetrics
+
+
+def _add_favorite(code, score):
+    index = Index(code=code, name=code, is_favorite=True)
+    db.session.add(index)
+    db.session.flush()
+    db.session.add(CalculatedMetrics(index_id=index.id, date=date(2024, 1, 2), composite_score=score))
+    db.session.commit()
+    return index
+
+
+def test_dashboard_delta_only_contains_changes():
+    item = {'index': {'id': 1}, 'metrics': {'composite_score': 1}}
+    changed = {'index': {'id': 2}, 'metrics': {'composite_score': 3}}
+    previous = {'indices': [item, {'index': {'id': 2}, 'metrics': {'composite_score': 2}}],
+                'stock_bond_ratio': None, 'update_time': 't0'}
+    current = {'indices': [changed], 'stock_bond_ratio': None, 'update_time': 't1'}
+
+    assert dashboard_delta(previous, previous) is None
+    delta = dashboard_delta(previous, current)
+    assert delta['indices'] == [changed] and delta['removed'] == [1] and delta['order'] == [2]
+    assert 'stock_bond_ratio' not in delta
+
+
+def test_stream_ends_after_max_lifetime(app):
+    _add_favorite('000001', 10)
+    started = time.monotonic()
+    messages = list(dashboard_events(poll_interval=0.05, heartbeat_interval=0.1, max_lifetime=0.3))
+
+    assert time.monotonic() - started < 1
+    assert messages[0] == f'retry: {RECONNECT_DELAY_MS}\n\n'
+    assert messages[1].startswith('event: snapshot\n')
+    assert ': keepalive\n\n' in messages[2:]
+
+
+def test_reconnect_with_current_version_skips_snapshot(app):
+    _add_favorite('000001', 10)
+    messages = list(dashboard_events(poll_interval=0.05, heartbeat_interval=1, max_lifetime=0.1,
+                                     last_event_id=str(get_data_version())))
+    assert messages == [f'retry: {RECONNECT_DELAY_MS}\n\n']
+
+
+def test_stream_pushes_delta_on_data_change(app):
+    index_id = _add_favorite('000001', 10).id
+    stream = dashboard_events(poll_interval=0.05, heartbeat_interval=10, max_lifetime=2)
+    assert next(stream).startswith('retry:')
+    assert next(stream).startswith('event: snapshot')
+
+    def change():
+        with app.app_context():
+            metrics = CalculatedMetrics.query.filter_by(index_id=index_id).one()
+            metrics.composite_score = 20
+            db.session.commit()
+            bump_data_version()
+
+    threading.Timer(0.1, change).start()
+    message = next(stream)
+    assert message.startswith('event: delta\n')
+    assert '"composite_score": 20' in message or '"composite_score":20' in message
+    stream.close()
@@ -0,0 +1,61 @@
+"""
+测试财务数据刷新计划：报告期与披露截止日，按行数与披露期窗口判定各报告期的状态
+"""
+from datetime import date
+from financial_planner import (COMPLETE, FILLING, FINALIZING, INCOMPLETE, MISSING, FinancialRefreshPlanner,
+                               disclosure_deadline, recent_periods)
+from models import db, StockFinancial
+
+
+def _add_financials(period, count):
+    db.session.bulk_insert_mappings(StockFinancial, [
+        {'stock_code': f'{i:06d}', 'report_date': period, 'roe': 10.0} for i in range(count)
+    ])
+    db.session.commit()
+
+
+def test_recent_periods_and_deadlines():
+    assert recent_periods(date(2024, 3, 31), count=3) == [date(2023, 12, 31), date(2023, 9, 30), date(2023, 6, 30)]
+    assert recent_periods(date(2024, 4, 1), count=2) == [date(2024, 3, 31), date(2023, 12, 31)]
+    assert disclosure_deadline(date(2023, 12, 31)) == date(2024, 4, 30)
+    assert disclosure_deadline(date(2024, 6, 30)) == date(2024, 8, 31)
+    assert disclosure_deadline(date(2024, 9, 30)) == date(2024, 10, 31)
+
+
+def test_plan_statuses(app):
+    # 一季报与年报仍在披露期内（截止日 4月30日 + 宽限期）
+    planner = FinancialRefreshPlanner(today=date(2024, 5, 3))
+    _add_financials(date(2023, 12, 31), 50)
+    _add_financials(date(2023, 9, 30), 100)
+    _add_financials(date(2023, 6, 30), 95)
+    _add_financials(date(2023, 3, 31), 80)
+    _add_financials(date(2022, 12, 31), 92)
+    planner.mark_finalized('20230331')
+    planner.mark_finalized('20221231')
+
+    plan = {item['period']: item for item in planner.plan()}
+    assert {period: item['status'] for period, item in plan.items()} == {
+        '20240331': MISSING,
+        '20231231': FILLING,
+        '20230930': COMPLETE,
+        '20230630': FINALIZING,
+        '20230331': INCOMPLETE,
+        '20221231': COMPLETE,
+    }
+    assert [period for period, item in plan.items() if item['fetch']] == ['20240331', '20231231', '20230630']
+    assert plan['20231231']['expected'] == 100 and plan['20231231']['deadline'] == '2024-04-30'
+
+    # 收尾抓取后不再抓取；披露期内的报告期不能标记收尾
+    planner.mark_finalized('20230630')
+    planner.mark_finalized('20231231')
+    _add_financials(date(2024, 3, 31), 99)
+    plan = {item['period']: item for item in planner.plan()}
+    assert plan['20230630']['status'] == COMPLETE
+    assert plan['20231231']['status'] == FILLING
+    assert plan['20240331']['status'] == COMPLETE
+
+
+def test_nothing_fetched_outside_disclosure_season(app):
+    for period in recent_periods(date(2024, 6, 20)):
+        _add_financials(period, 100)
+    assert not any(item['fetch'] for item in FinancialRefreshPlanner(today=date(2024, 6, 20)).plan())
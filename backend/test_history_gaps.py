@@ -0,0 +1,94 @@
+"""
+测试行情缺口扫描与补抓：参考交易日取自交易日历，补抓多次仍为空的交易日不再重复补抓
+"""
+from datetime import datetime, timedelta
+import pytest
+from history_gaps import MAX_REPAIR_ATTEMPTS, plan_repairs, repair_history_gaps, scan_history_gaps
+from models import db, Index, IndexHistory, HistoryGapAttempt
+from trading_calendar import TradingCalendar, get_trading_calendar, load_holidays
+
+
+@pytest.fixture
+def days(app):
+    """近三个月的交易日（截至上一交易日），中证800每天都有行情"""
+    calendar = TradingCalendar([], load_holidays())
+    end = calendar.previous_trading_day(datetime.now().date())
+    days = calendar.trading_days(end - timedelta(days=90), end)
+    _add_index('000906', days)
+    get_trading_calendar(refresh=True)
+    return days
+
+
+def _add_index(code, dates, is_favorite=False):
+    index = Index(code=code, name=code, is_favorite=is_favorite)
+    db.session.add(index)
+    db.session.flush()
+    db.session.add_all([IndexHistory(index_id=index.id, date=d, close=1.0) for d in dates])
+    db.session.commit()
+    return index.id
+
+
+class EmptyFetcher:
+    """数据源在缺口区间内没有行情（接口返回空数据，抓取失败）"""
+
+    def __init__(self):
+        self.calls = []
+
+    def fetch_index_history(self, code, start_date=None, end_date=None):
+        self.calls.append((code, start_date, end_date))
+        return False
+
+
+def test_internal_and_trailing_gaps(days):
+    index_id = _add_index('000001', days[:10] + days[12:-2], is_favorite=True)
+
+    gaps = scan_history_gaps([index_id])
+    assert [(gap['start'], gap['end'], gap['missing_days']) for gap in gaps] == [
+        (days[10], days[11], 2), (days[-2], days[-1], 2)
+    ]
+    assert len(plan_repairs(gaps, merge_within=0)) == 2
+
+
+def test_dates_outside_trading_calendar_do_not_create_gaps(days):
+    saturday = next(d for d in days if d.weekday() == 4) + timedelta(days=1)
+    _add_index('000001', days, is_favorite=True)
+    # 按其他交易所日历发布的指数：有周六的行情
+    other_id = _add_index('H00001', sorted(days + [saturday]), is_favorite=True)
+
+    assert scan_history_gaps() == []
+    assert scan_history_gaps([other_id]) == []
+
+
+def test_each_index_checked_from_its_own_first_date(days):
+    index_id = _add_index('000001', days[30:], is_favorite=True)
+    assert scan_history_gaps([index_id]) == []
+
+
+def test_repair_gives_up_after_repeated_empty_fetches(days):
+    index_id = _add_index('000001', days[:10] + days[12:], is_favorite=True)
+    fetcher = EmptyFetcher()
+
+    for attempt in range(MAX_REPAIR_ATTEMPTS):
+        result = repair_history_gaps(fetcher)
+        assert result['gaps'] == 1 and len(result['remaining']) == 1
+    assert result['abandoned'] == 2
+    assert len(fetcher.calls) == MAX_REPAIR_ATTEMPTS
+
+    # 放弃后不再扫描出缺口，也不再发出抓取请求
+    result = repair_history_gaps(fetcher)
+    assert result['gaps'] == 0
+    assert len(fetcher.calls) == MAX_REPAIR_ATTEMPTS
+    assert scan_history_gaps([index_id]) == []
+
+
+def test_failed_fetch_is_not_recorded_when_upstream_may_be_down(days):
+    # 中证800缺少最近两个交易日：数据源可能不可用，失败不计入补抓次数
+    csi800 = Index.query.filter_by(code='000906').one()
+    IndexHistory.query.filter(IndexHistory.index_id == csi800.id, IndexHistory.date >= days[-2]).delete()
+    db.session.commit()
+    get_trading_calendar(refresh=True)
+    _add_index('000001', days[:-2], is_favorite=True)
+
+    result = repair_history_gaps(EmptyFetcher())
+    assert len(result['remaining']) == 2
+    assert HistoryGapAttempt.query.count() == 0
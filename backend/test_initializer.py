@@ -0,0 +1,99 @@
+"""
+测试首次初始化的断点续传：部分条目失败后再次调用只补齐未完成的条目
+"""
+import pytest
+from initializer import DataInitializer
+from models import db, Index, InitCheckpoint
+from services import EXTENSION_KEY
+
+
+class FakeFetcher:
+    """按指数代码模拟行情抓取失败，记录每次调用"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.history_calls = []
+
+    def fetch_all_indices(self):
+        if not Index.query.first():
+            db.session.add_all([
+                Index(code='000906', name='中证800'),
+                Index(code='000001', name='自选指数', is_favorite=True),
+                Index(code='000002', name='其他指数'),
+            ])
+            db.session.commit()
+        return True
+
+    def fetch_bond_yield(self, start_date=None):
+        return True
+
+    def fetch_index_history(self, code, start_date=None, end_date=None):
+        self.history_calls.append(code)
+        return code not in self.failing
+
+    def fetch_stock_financials(self, period):
+        return True
+
+
+class FakeCalculator:
+    def calculate_historical_stock_bond_ratio(self):
+        return True
+
+
+@pytest.fixture
+def fetcher(app):
+    fetcher = FakeFetcher(failing={'000001'})
+    app.extensions[EXTENSION_KEY]._instances['initializer'] = DataInitializer(fetcher, FakeCalculator())
+    return fetcher
+
+
+def test_second_call_resumes_failed_items(client, fetcher):
+    response = client.post('/api/data/init', json={})
+    assert response.status_code == 200
+    progress = response.get_json()['data']
+    assert progress['completed'] and progress['failed'] == []
+    assert progress['incomplete'] == ['index_history:000001']
+    assert fetcher.history_calls == ['000906', '000001']
+
+    # 已初始化但仍有未完成的条目，再次调用只重试失败的指数
+    fetcher.failing.clear()
+    response = client.post('/api/data/init', json={})
+    assert response.status_code == 200
+    assert response.get_json()['data']['incomplete'] == []
+    assert fetcher.history_calls == ['000906', '000001', '000001']
+
+    # 全部完成后不再接受初始化
+    response = client.post('/api/data/init', json={})
+    assert response.status_code == 400
+    assert fetcher.history_calls == ['000906', '000001', '000001']
+
+
+def test_full_catalog_is_remembered_when_resuming(client, fetcher):
+    fetcher.failing = set()
+    assert client.post('/api/data/init', json={}).status_code == 200
+    assert '000002' not in fetcher.history_calls
+
+    # 已初始化后请求全目录：抓取尚未抓取的指数
+    fetcher.failing = {'000002'}
+    response = client.post('/api/data/init', json={'full_catalog': True})
+    assert response.get_json()['data']['incomplete'] == ['index_history:000002']
+
+    # 续传时不带 full_catalog 也按全目录执行
+    fetcher.failing.clear()
+    assert client.post('/api/data/init', json={}).status_code == 200
+    assert fetcher.history_calls.count('000002') == 2
+    assert InitCheckpoint.query.filter_by(step='index_history', status='done').count() == 3
+    assert client.post('/api/data/init', json={}).status_code == 400
+
+
+def test_required_failure_is_reported_and_not_marked_initialized(client, fetcher):
+    fetcher.failing = {'000906'}
+    response = client.post('/api/data/init', json={})
+    assert response.status_code == 500
+    assert response.get_json()['data']['failed'] == ['index_history:000906']
+    assert not fetcher.history_calls.count('000002')
+
+    fetcher.failing.clear()
+    response = client.post('/api/data/init', json={})
+    assert response.status_code == 200
+    assert response.get_json()['data']['completed']
@@ -0,0 +1,127 @@
+"""
+测试调度租约：互斥、过期接管、数据库出错与“已被他人持有”的区分，以及工作进程据此启停调度器
+"""
+import threading
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy.exc import OperationalError
+from lease import LeaseLock, LeaseError
+from models import db, SchedulerLease
+from scheduler import init_scheduler
+from worker import SchedulerWorker
+
+
+def _database_locked(*args, **kwargs):
+    raise OperationalError('UPDATE scheduler_leases', {}, Exception('database is locked'))
+
+
+def test_lease_is_exclusive_until_released(app):
+    first = LeaseLock('job', ttl=60, holder='a')
+    second = LeaseLock('job', ttl=60, holder='b')
+
+    assert first.acquire() is True
+    assert second.acquire() is False
+    assert first.renew() is True
+    assert first.is_held() and first.still_valid()
+
+    assert first.release() is True
+    assert not first.still_valid()
+    assert second.acquire() is True
+    assert first.acquire() is False
+
+
+def test_expired_lease_can_be_taken_over(app):
+    first = LeaseLock('job', ttl=60, holder='a')
+    assert first.acquire()
+    SchedulerLease.query.filter_by(name='job').one().expires_at = datetime.now() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert LeaseLock('job', ttl=60, holder='b').acquire() is True
+    assert first.acquire() is False
+
+
+def test_database_error_raises_instead_of_reporting_lost_lease(app, monkeypatch):
+    lease = LeaseLock('job', ttl=60, holder='a')
+    assert lease.acquire()
+
+    monkeypatch.setattr(db.session, 'execute', _database_locked)
+    with pytest.raises(LeaseError):
+        lease.renew()
+    # 本地记录的到期时间未过，租约仍归自己
+    assert lease.still_valid()
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.shutdown_calls = []
+
+    def shutdown(self, wait=True):
+        self.shutdown_calls.append(wait)
+
+
+def test_worker_keeps_scheduler_on_database_error(app, monkeypatch):
+    worker = SchedulerWorker(app, ttl=60)
+    assert worker.lease.acquire()
+    scheduler = worker.scheduler = FakeScheduler()
+
+    monkeypatch.setattr(db.session, 'execute', _database_locked)
+    assert worker.step() is True
+    assert worker.scheduler is scheduler and scheduler.shutdown_calls == []
+
+
+def test_worker_stops_without_waiting_when_lease_taken(app):
+    worker = SchedulerWorker(app, ttl=60)
+    scheduler = worker.scheduler = FakeScheduler()
+    assert LeaseLock(worker.lease.name, ttl=60, holder='other').acquire()
+
+    assert worker.step() is False
+    assert worker.scheduler is None
+    assert scheduler.shutdown_calls == [False]
+
+
+def test_drain_renews_lease_while_job_runs(app, monkeypatch):
+    worker = SchedulerWorker(app, ttl=3)
+    worker.interval = 0.05
+    renewals = []
+    monkeypatch.setattr(worker, 'renew', lambda: renewals.append(1) or True)
+
+    worker._job_lock.acquire()
+    timer = threading.Timer(0.3, worker._job_lock.release)
+    timer.start()
+    worker.drain()
+    timer.join()
+
+    assert len(renewals) >= 2
+    # 退出后任务锁保持占用，尚未开始的任务会跳过
+    assert not worker._job_lock.acquire(blocking=False)
+
+
+class FakePipeline:
+    def __init__(self):
+        self.runs = 0
+
+    def run(self):
+        self.runs += 1
+
+
+class UnreachableLease:
+    def renew(self):
+        raise LeaseError('database is locked')
+
+    def still_valid(self):
+        return False
+
+
+@pytest.mark.parametrize('lease, lock_held', [(None, True), (UnreachableLease(), False)])
+def test_daily_job_skips_without_lock_or_valid_lease(app, lease, lock_held):
+    pipeline = FakePipeline()
+    job_lock = threading.Lock()
+    scheduler = init_scheduler(app, None, None, pipeline=pipeline, lease=lease, job_lock=job_lock)
+    try:
+        if lock_held:
+            job_lock.acquire()
+        scheduler.get_job('daily_update').func()
+    finally:
+        scheduler.shutdown(wait=False)
+
+    assert pipeline.runs == 0
@@ -0,0 +1,109 @@
+"""
+测试多窗口分位数引擎：与按定义逐窗口计算的结果一致；常驻查询在追加、重抓最新一天与补录历史行后与重新载入一致
+"""
+from datetime import date, timedelta
+import numpy as np
+import pytest
+from models import db, Index, IndexHistory
+from percentile_engine import PERCENTILE_WINDOWS, PercentileLookup, index_percentiles, window_percentiles
+
+
+def _expected(dates, values, as_of, days):
+    """按定义计算：窗口 [as_of - 天数, as_of] 内最后一条为当前值，有效值中不大于当前值的占比"""
+    as_of = as_of.toordinal()
+    start = dates[0] if days is None else as_of - days
+    mask = (dates >= start) & (dates <= as_of)
+    window = values[mask]
+    if not len(window) or not window[-1] > 0:
+        return None, int(np.sum(window > 0))
+    valid = window[window > 0]
+    return float(np.sum(valid <= window[-1]) / len(valid) * 100), len(valid)
+
+
+def _series(rng, count, start=date(2010, 1, 1)):
+    dates = np.array(sorted(rng.choice(np.arange(count * 2), size=count, replace=False)), dtype=np.int64)
+    dates = dates + start.toordinal()
+    values = np.round(10 + rng.normal(size=count).cumsum(), 1)
+    values[rng.random(count) < 0.05] = np.nan
+    values[rng.random(count) < 0.02] = -1.0
+    return dates, values
+
+
+def test_window_percentiles_match_definition():
+    rng = np.random.default_rng(1)
+    dates, values = _series(rng, 3000)
+    as_of_dates = [date.fromordinal(int(d)) for d in rng.choice(dates, 40)]
+    as_of_dates += [date.fromordinal(int(dates[0]) - 1), date.fromordinal(int(dates[-1]) + 400)]
+
+    for as_of in as_of_dates:
+        result = window_percentiles(dates, values, as_of)
+        for name, days in PERCENTILE_WINDOWS:
+            expected = _expected(dates, values, as_of, days)
+            assert result[name][1] == expected[1], (as_of, name)
+            if expected[0] is None:
+                assert result[name][0] is None, (as_of, name)
+            else:
+                assert result[name][0] == pytest.approx(expected[0]), (as_of, name)
+
+
+def test_index_percentiles_reads_history(app):
+    index = Index(code='000300', name='沪深300')
+    db.session.add(index)
+    db.session.flush()
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(5)]
+    for day, pe, pb in zip(days, [10, 12, 11, 9, 11], [1.0, None, 1.2, 1.1, 0.9]):
+        db.session.add(IndexHistory(index_id=index.id, date=day, pe_ttm=pe, pb=pb))
+    db.session.commit()
+
+    result = index_percentiles(index.id, as_of=days[-1])
+    assert result['pe']['all'] == (80.0, 5)
+    assert result['pb']['all'] == (25.0, 4)
+
+
+def _add_rows(index_id, rows):
+    for day, pe, pb in rows:
+        db.session.add(IndexHistory(index_id=index_id, date=day, pe_ttm=pe, pb=pb))
+    db.session.commit()
+
+
+def _reference(index_ids, lookback_days, queries):
+    """重新载入的查询结果"""
+    return PercentileLookup(lookback_days).lookup([(index_id, queries) for index_id in index_ids], version='fresh')
+
+
+def test_lookup_refresh_matches_reload(app):
+    rng = np.random.default_rng(2)
+    today = date.today()
+    lookback_days = 200
+    first = today - timedelta(days=260)
+
+    ids = []
+    for code in ('000300', '000905', '000016'):
+        index = Index(code=code, name=code)
+        db.session.add(index)
+        db.session.flush()
+        ids.append(index.id)
+    days = [first + timedelta(days=i) for i in range(250) if i % 7 != 3]
+    for index_id in ids[:2]:
+        _add_rows(index_id, [(d, float(rng.integers(5, 30)), float(rng.integers(1, 5))) for d in days])
+
+    queries = {'pe': 15.0, 'pb': 2.5}
+    lookup = PercentileLookup(lookback_days)
+    assert lookup.lookup([(i, queries) for i in ids], version=1) == _reference(ids, lookback_days, queries)
+    assert lookup.lookup([(ids[2], queries)], version=1) == [None]
+
+    # 新增一天、重新抓取最新一天、补录窗口中间缺失的一天、无行情的指数开始有数据
+    latest = IndexHistory.query.filter_by(index_id=ids[0], date=days[-1]).one()
+    latest.pe_ttm = 29.0
+    _add_rows(ids[0], [(days[-1] + timedelta(days=1), 7.0, 1.0)])
+    _add_rows(ids[1], [(first + timedelta(days=offset), 6.0, 4.5) for offset in (150, 164)])
+    _add_rows(ids[2], [(today - timedelta(days=2), 12.0, 1.5), (today - timedelta(days=1), 18.0, None)])
+
+    refreshed = lookup.lookup([(i, queries) for i in ids], version=2)
+    assert refreshed == _reference(ids, lookback_days, queries)
+    assert refreshed[2]['pe'] == (50.0, 2) and refreshed[2]['pb'] == (100.0, 1)
+
+    # 版本号不变时沿用缓存
+    _add_rows(ids[0], [(days[-1] + timedelta(days=2), 1.0, 1.0)])
+    assert lookup.lookup([(ids[0], queries)], version=2) == refreshed[:1]
+    assert lookup.lookup([(ids[0], queries)], version=3) == _reference(ids[:1], lookback_days, queries)
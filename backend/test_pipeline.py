@@ -0,0 +1,76 @@
+"""
+测试阶段化任务管道：依赖检查、失败阻断下游、仅排序约束、指纹跳过、单独重跑与并发执行
+"""
+import threading
+import pytest
+from models import PipelineStage
+from pipeline import BLOCKED, FAILED, SKIPPED, SUCCESS, Pipeline, Stage
+
+
+def test_rejects_unknown_and_cyclic_dependencies(app):
+    with pytest.raises(ValueError, match='不存在'):
+        Pipeline(app, [Stage('a', lambda: True, depends_on=['missing'])])
+    with pytest.raises(ValueError, match='循环依赖'):
+        Pipeline(app, [
+            Stage('a', lambda: True),
+            Stage('b', lambda: True, depends_on=['a', 'd']),
+            Stage('c', lambda: True, depends_on=['b']),
+            Stage('d', lambda: True, after=['c']),
+        ])
+
+
+def test_failure_blocks_dependents_but_not_ordered_stages(app):
+    calls = []
+
+    def stage(name, result=True):
+        def run():
+            calls.append(name)
+            if result == 'raise':
+                raise RuntimeError('boom')
+            return result
+        return run
+
+    pipeline = Pipeline(app, [
+        Stage('fetch', stage('fetch', False)),
+        Stage('calculate', stage('calculate'), depends_on=['fetch']),
+        Stage('warm', stage('warm'), depends_on=['calculate']),
+        Stage('gaps', stage('gaps', 'raise'), after=['fetch']),
+        Stage('cleanup', stage('cleanup'), after=['warm', 'gaps']),
+    ])
+    results = pipeline.run()
+
+    assert results == {'fetch': FAILED, 'calculate': BLOCKED, 'warm': BLOCKED, 'gaps': FAILED, 'cleanup': SUCCESS}
+    assert sorted(calls) == ['cleanup', 'fetch', 'gaps']
+    assert PipelineStage.query.filter_by(name='gaps').one().error == 'boom'
+    assert {item['name']: item['status'] for item in pipeline.status()}['warm'] == BLOCKED
+
+    # 单独重跑：不在列表中的依赖视为已满足
+    calls.clear()
+    assert pipeline.run(only=['calculate', 'warm']) == {'calculate': SUCCESS, 'warm': SUCCESS}
+    assert calls == ['calculate', 'warm']
+    with pytest.raises(ValueError, match='未知阶段'):
+        pipeline.run(only=['missing'])
+
+
+def test_unchanged_fingerprint_skips_stage(app):
+    calls = []
+    fingerprint = {'value': 'v1'}
+    pipeline = Pipeline(app, [
+        Stage('calculate', lambda: calls.append('calculate'), fingerprint=lambda: fingerprint['value']),
+    ])
+
+    assert pipeline.run() == {'calculate': SUCCESS}
+    assert pipeline.run() == {'calculate': SKIPPED}
+    assert pipeline.run(force=True) == {'calculate': SUCCESS}
+    fingerprint['value'] = 'v2'
+    assert pipeline.run() == {'calculate': SUCCESS}
+    assert len(calls) == 3
+
+
+def test_independent_stages_run_concurrently(app):
+    barrier = threading.Barrier(2, timeout=5)
+    pipeline = Pipeline(app, [
+        Stage('bonds', lambda: barrier.wait() is not None),
+        Stage('financials', lambda: barrier.wait() is not None),
+    ], max_workers=2)
+    assert pipeline.run() == {'bonds': SUCCESS, 'financials': SUCCESS}
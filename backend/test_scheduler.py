@@ -0,0 +1,42 @@
+"""
+测试每日任务管道的阶段指纹：组合成员与人为权重变化后 index_metrics 阶段不会被跳过
+"""
+from models import db, Index, Portfolio, PortfolioIndex
+from scheduler import build_daily_pipeline
+
+
+class FakeFetcher:
+    def fetch_bond_yield(self):
+        return True
+
+    def fetch_latest_financials(self):
+        return True
+
+
+class FakeCalculator:
+    def run_index_calculation(self):
+        return True
+
+
+def _fingerprint(app):
+    pipeline = build_daily_pipeline(app, FakeCalculator(), FakeFetcher())
+    return pipeline.stages['index_metrics'].fingerprint()
+
+
+def test_index_metrics_fingerprint_covers_portfolios(app):
+    index = Index(code='000300', name='沪深300')
+    portfolio = Portfolio(name='组合')
+    db.session.add_all([index, portfolio])
+    db.session.commit()
+    empty = _fingerprint(app)
+
+    member = PortfolioIndex(portfolio_id=portfolio.id, index_id=index.id, manual_weight=1.0)
+    db.session.add(member)
+    db.session.commit()
+    joined = _fingerprint(app)
+    assert joined != empty
+    assert _fingerprint(app) == joined
+
+    member.manual_weight = 2.0
+    db.session.commit()
+    assert _fingerprint(app) != joined
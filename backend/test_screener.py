@@ -0,0 +1,71 @@
+"""
+测试全目录估值筛选的预计算结果：每日任务写入后，其他进程直接读取，不再全量计算
+"""
+from datetime import datetime, timedelta
+import pytest
+from calculator import Calculator
+from data_version import bump_data_version
+from models import db, Index, IndexHistory, ScreenerResult
+from screener import ValuationScreener
+
+
+@pytest.fixture
+def indices(app):
+    today = datetime.now().date()
+    for i, code in enumerate(['000001', '000002']):
+        index = Index(code=code, name=f'指数{i}', is_favorite=(i == 0), manual_weight=1.0)
+        db.session.add(index)
+        db.session.flush()
+        for offset in range(30):
+            db.session.add(IndexHistory(
+                index_id=index.id, date=today - timedelta(days=30 - offset),
+                close=1000 + offset, pe_ttm=10 + (offset * (i + 1)) % 7, pb=1 + offset / 100
+            ))
+    db.session.commit()
+
+
+def _no_compute():
+    raise AssertionError('不应全量计算')
+
+
+def test_refresh_persists_frame_for_other_processes(indices):
+    assert ValuationScreener(Calculator()).refresh() == 2
+    assert ScreenerResult.query.count() == 2
+
+    # 模拟另一个 API 进程：内存缓存为空，应读取预计算结果
+    other = ValuationScreener(Calculator())
+    other.compute = _no_compute
+    expected = ValuationScreener(Calculator()).compute().sort_values('index_id').reset_index(drop=True)
+
+    frame = other.get_frame().sort_values('index_id').reset_index(drop=True)
+    for column in ('latest_date', 'pe_ttm', 'pb', 'pe_percentile', 'pb_percentile'):
+        assert frame[column].tolist() == expected[column].tolist()
+    assert frame['code'].tolist() == ['000001', '000002']
+
+    total, records = other.query(is_favorite=True)
+    assert total == 1 and records[0]['code'] == '000001'
+
+
+def test_stored_frame_ignored_after_ingest(indices):
+    ValuationScreener(Calculator()).refresh()
+    bump_data_version(ingest=True)
+
+    calls = []
+    other = ValuationScreener(Calculator())
+    compute = other.compute
+    other.compute = lambda: calls.append(1) or compute()
+
+    assert len(other.get_frame()) == 2
+    assert calls == [1]
+
+
+def test_favorite_change_does_not_invalidate_stored_frame(indices):
+    ValuationScreener(Calculator()).refresh()
+    Index.query.filter_by(code='000002').one().is_favorite = True
+    db.session.commit()
+    bump_data_version()
+
+    other = ValuationScreener(Calculator())
+    other.compute = _no_compute
+    total, _ = other.query(is_favorite=True)
+    assert total == 2
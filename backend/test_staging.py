@@ -0,0 +1,91 @@
+"""
+测试暂存表合并：按自然键插入新行、更新已有行，未提供的列保留原值，prune 删除快照中已不存在的行
+"""
+from datetime import date
+import numpy as np
+import pandas as pd
+import pytest
+from models import db, Index, IndexHistory, IndexConstituent
+from staging import merge_frame
+
+
+@pytest.fixture
+def index_id(app):
+    index = Index(code='000300', name='沪深300')
+    db.session.add(index)
+    db.session.commit()
+    return index.id
+
+
+def _history(index_id):
+    rows = IndexHistory.query.filter_by(index_id=index_id).order_by(IndexHistory.date).all()
+    return [(row.date, row.close, row.pe_ttm, row.pb, row.sample_count) for row in rows]
+
+
+def test_insert_then_update_on_natural_key(index_id):
+    days = [date(2024, 1, 2), date(2024, 1, 3)]
+    frame = pd.DataFrame({'index_id': index_id, 'date': days, 'close': [3000.0, 3010.0],
+                          'pe_ttm': [11.0, np.nan], 'sample_count': pd.array([300, 300], dtype='Int64')})
+    assert merge_frame(IndexHistory, frame, ['index_id', 'date']) == 2
+    db.session.commit()
+    assert _history(index_id) == [(days[0], 3000.0, 11.0, None, 300), (days[1], 3010.0, None, None, 300)]
+
+    # 市净率由另一接口写入，之后重抓行情时不在 frame 中，应保留
+    IndexHistory.query.filter_by(index_id=index_id, date=days[1]).one().pb = 1.4
+    db.session.commit()
+
+    frame = pd.DataFrame({'index_id': index_id, 'date': [days[1], date(2024, 1, 4)], 'close': [3020.0, 3030.0],
+                          'pe_ttm': [12.0, 12.5], 'sample_count': pd.array([300, pd.NA], dtype='Int64')})
+    assert merge_frame(IndexHistory, frame, ['index_id', 'date']) == 2
+    db.session.commit()
+    assert _history(index_id) == [
+        (days[0], 3000.0, 11.0, None, 300),
+        (days[1], 3020.0, 12.0, 1.4, 300),
+        (date(2024, 1, 4), 3030.0, 12.5, None, None),
+    ]
+
+
+def test_update_columns_limits_overwritten_columns(index_id):
+    day = date(2024, 1, 2)
+    merge_frame(IndexHistory, pd.DataFrame({'index_id': [index_id], 'date': [day], 'close': [3000.0], 'pe_ttm': [11.0]}),
+                ['index_id', 'date'])
+    merge_frame(IndexHistory, pd.DataFrame({'index_id': [index_id], 'date': [day], 'close': [1.0], 'pe_ttm': [13.0]}),
+                ['index_id', 'date'], update_columns=['pe_ttm'])
+    db.session.commit()
+    assert _history(index_id) == [(day, 3000.0, 13.0, None, None)]
+
+    # 不更新任何列：已有行保持不变
+    merge_frame(IndexHistory, pd.DataFrame({'index_id': [index_id], 'date': [day], 'close': [2.0]}),
+                ['index_id', 'date'], update_columns=[])
+    db.session.commit()
+    assert _history(index_id)[0][1] == 3000.0
+
+
+def test_prune_replaces_snapshot_within_filter(index_id):
+    day, other_day = date(2024, 1, 2), date(2023, 12, 29)
+
+    def constituents(codes, weights, on=day):
+        return pd.DataFrame({'index_id': index_id, 'date': on, 'stock_code': codes, 'weight': weights})
+
+    def prune(on=day):
+        return [IndexConstituent.index_id == index_id, IndexConstituent.date == on]
+
+    merge_frame(IndexConstituent, constituents(['600000', '600519'], [1.0, 5.0], other_day), ['index_id', 'date', 'stock_code'],
+                prune=prune(other_day))
+    merge_frame(IndexConstituent, constituents(['600000', '600036'], [1.0, 2.0]), ['index_id', 'date', 'stock_code'],
+                prune=prune())
+    merge_frame(IndexConstituent, constituents(['600036', '601318'], [2.5, 3.0]), ['index_id', 'date', 'stock_code'],
+                prune=prune())
+    db.session.commit()
+
+    rows = IndexConstituent.query.order_by(IndexConstituent.date, IndexConstituent.stock_code).all()
+    assert [(row.date, row.stock_code, row.weight) for row in rows] == [
+        (other_day, '600000', 1.0), (other_day, '600519', 5.0),
+        (day, '600036', 2.5), (day, '601318', 3.0),
+    ]
+
+
+def test_empty_frame_is_noop(index_id):
+    frame = pd.DataFrame(columns=['index_id', 'date', 'close'])
+    assert merge_frame(IndexHistory, frame, ['index_id', 'date']) == 0
+    assert IndexHistory.query.count() == 0
@@ -0,0 +1,62 @@
+"""
+测试股债性价比的区间计算：分位数与逐日按定义计算的结果一致，增量重算与整段计算一致
+"""
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from calculator import Calculator
+from models import db, Index, IndexHistory, BondYield, StockBondRatio
+
+
+@pytest.fixture
+def history(app):
+    rng = np.random.default_rng(0)
+    csi800 = Index(code='000906', name='中证800')
+    db.session.add(csi800)
+    db.session.flush()
+
+    days = [date(2020, 1, 1) + timedelta(days=i) for i in range(900)]
+    days = [d for d in days if d.weekday() < 5]
+    pe = np.round(12 + rng.normal(size=len(days)).cumsum() * 0.1, 2)
+    for day, value in zip(days, pe):
+        db.session.add(IndexHistory(index_id=csi800.id, date=day, pe_ttm=float(value)))
+    # 国债收益率只有部分日期（as-of 对齐取之前最近一条）
+    for day in days[::3]:
+        db.session.add(BondYield(date=day, yield_10y=float(np.round(2.5 + rng.normal() * 0.2, 3))))
+    db.session.commit()
+    return days
+
+
+def _expected_percentiles(frame, lookback_days):
+    dates = frame['date'].tolist()
+    ratios = frame['ratio'].to_numpy()
+    expected = []
+    for day, ratio in zip(dates, ratios):
+        window = ratios[[(day - timedelta(days=lookback_days)) <= d <= day for d in dates]]
+        expected.append(np.sum(window <= ratio) / len(window) * 100 if len(window) > 1 else 50.0)
+    return np.array(expected)
+
+
+def test_percentiles_match_definition(history):
+    calculator = Calculator()
+    frame = calculator.calculate_stock_bond_ratio_range(history[0], history[-1])
+
+    assert len(frame) == len(history)
+    assert frame['percentile_10y'].iloc[0] == 50.0
+    np.testing.assert_allclose(frame['percentile_10y'].to_numpy(), _expected_percentiles(frame, 3650))
+    assert StockBondRatio.query.count() == len(history)
+
+    # 较短窗口：窗口起点随日期滚动
+    short = calculator._rolling_ratio_percentile(frame.assign(date=pd.to_datetime(frame['date'])), lookback_days=100)
+    np.testing.assert_allclose(short, _expected_percentiles(frame, 100))
+
+
+def test_incremental_recompute_matches_full_range(history):
+    calculator = Calculator()
+    full = calculator.calculate_stock_bond_ratio_range(history[0], history[-1], save=False)
+
+    calculator.calculate_stock_bond_ratio_range(history[0], history[-30])
+    tail = calculator.calculate_stock_bond_ratio_range(history[-29], history[-1])
+
+    np.testing.assert_allclose(tail['percentile_10y'].to_numpy(), full['percentile_10y'].to_numpy()[-29:])
@@ -0,0 +1,133 @@
+"""交易日历
+
+交易日以本地已入库的中证800（000906）历史行情日期为准，不依赖外部接口；
+超出已入库日期范围的日期（如今天、未来）按“工作日且不在休市日表中”判断，
+休市日表为随代码发布的 holidays.csv（仅列出工作日休市日，需每年按交易所公告更新）。
+"""
+import bisect
+import csv
+import logging
+import os
+from datetime import date, datetime, timedelta
+from models import db, Index, IndexHistory
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CALENDAR_INDEX_CODE = '000906'
+HOLIDAY_FILE = os.environ.get(
+    'HOLIDAY_FILE', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'holidays.csv')
+)
+
+
+def load_holidays(path=HOLIDAY_FILE):
+    """读取休市日表，文件不存在时返回空集合"""
+    if not path or not os.path.exists(path):
+        return set()
+
+    holidays = set()
+    with open(path, encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            try:
+                holidays.add(datetime.strptime(row['date'].strip(), '%Y-%m-%d').date())
+            except (KeyError, ValueError):
+                continue
+    return holidays
+
+
+class TradingCalendar:
+    """交易日历"""
+    
+    def __init__(self, trading_days, holidays=None):
+        """
+        Args:
+            trading_days: 已知交易日（date 可迭代对象）
+            holidays: 休市日集合（用于已知交易日范围之外的日期）
+        """
+        self.days = sorted(set(trading_days))
+        self._day_set = set(self.days)
+        self.holidays = holidays or set()
+        self.first_known = self.days[0] if self.days else None
+        self.last_known = self.days[-1] if self.days else None
+    
+    @classmethod
+    def load(cls):
+        """从数据库中的中证800历史行情和休市日表构建交易日历"""
+        days = db.session.query(IndexHistory.date).join(
+            Index, Index.id == IndexHistory.index_id
+        ).filter(
+            Index.code == CALENDAR_INDEX_CODE
+        ).all()
+        return cls([d for d, in days], load_holidays())
+    
+    def _is_known(self, day):
+        return self.first_known is not None and self.first_known <= day <= self.last_known
+    
+    def is_trading_day(self, day=None):
+        """是否为交易日
+        
+        Args:
+            day: 日期，默认为今天
+        """
+        day = day or date.today()
+        if self._is_known(day):
+            return day in self._day_set
+        return day.weekday() < 5 and day not in self.holidays
+    
+    def last_trading_day(self, day=None):
+        """不晚于指定日期的最近一个交易日（含当天）"""
+        day = day or date.today()
+        
+        # 已知范围之后：按工作日和休市日表逐日回退
+        if self.last_known is not None:
+            while day > self.last_known:
+                if self.is_trading_day(day):
+                    return day
+                day -= timedelta(days=1)
+        
+        if self._is_known(day):
+            pos = bisect.bisect_right(self.days, day)
+            return self.days[pos - 1]
+        
+        # 早于已知范围（或尚无行情数据）
+        while not self.is_trading_day(day):
+            day -= timedelta(days=1)
+        return day
+    
+    def previous_trading_day(self, day=None):
+        """指定日期之前的最近一个交易日（不含当天）"""
+        day = day or date.today()
+        return self.last_trading_day(day - timedelta(days=1))
+    
+    def trading_days(self, start_date, end_date):
+        """日期范围内（含首尾）的全部交易日"""
+        result = []
+        day = start_date
+        while day <= end_date:
+            if self._is_known(day):
+                # 已知范围内直接切片
+                hi_day = min(end_date, self.last_known)
+                lo = bisect.bisect_left(self.days, day)
+                hi = bisect.bisect_right(self.days, hi_day)
+                result.extend(self.days[lo:hi])
+                day = hi_day + timedelta(days=1)
+                continue
+            if self.is_trading_day(day):
+                result.append(day)
+            day += timedelta(days=1)
+        return result
+
+
+_calendar = None
+
+
+def get_trading_calendar(refresh=False):
+    """获取进程内缓存的交易日历
+    
+    Args:
+        refresh: 是否从数据库重新加载（中证800行情更新后调用）
+    """
+    global _calendar
+    if _calendar is None or refresh:
+        _calendar = TradingCalendar.load()
+    return _calendar
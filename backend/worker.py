@@ -0,0 +1,131 @@
+"""定时任务工作进程
+
+每日数据更新（抓取 + 计算管道）只在这个进程里运行，Web 进程（app.py、read_app.py、
+gunicorn 的各个 worker）只处理请求，不再启动调度器。
+
+启动后先获取数据库租约（scheduler_leases 表），拿到租约的进程启动调度器并定期续约；
+其他副本（同一主机重复启动或其他主机）保持待命，持有者退出（释放租约）或租约过期后接管。
+接管时若已过当日触发时间，立即补跑一次，管道会跳过当日已成功的阶段。
+
+续约时数据库出错（如管道大量写入时 SQLite 报 database is locked）不视为失去租约，保持当前状态下次重试；
+只有确认租约已由其他进程持有时才停止调度器。停止调度器和退出时都不阻塞等待正在执行的任务，
+续约循环照常运行直到任务结束，租约不会在任务执行期间过期被其他副本接管。
+
+用法:
+    python worker.py [--ttl 60]
+"""
+import argparse
+import logging
+import signal
+import threading
+from app_factory import create_app
+from lease import LeaseLock, LeaseError
+from models import db, analyze_database
+from services import EXTENSION_KEY
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'daily_scheduler'
+DEFAULT_TTL = 60
+
+
+class SchedulerWorker:
+    """持有调度租约时运行定时任务，否则待命"""
+
+    def __init__(self, app, ttl=DEFAULT_TTL):
+        """
+        Args:
+            app: Flask应用实例
+            ttl: 租约有效期（秒），每 ttl/3 秒续约一次
+        """
+        self.app = app
+        self.services = app.extensions[EXTENSION_KEY]
+        self.lease = LeaseLock(LEASE_NAME, ttl=ttl)
+        self.interval = max(ttl / 3, 1)
+        self.scheduler = None
+        self._stopping = threading.Event()
+        self._job_lock = threading.Lock()  # 每日任务执行期间持有
+
+    def renew(self):
+        """获取或续约租约
+
+        Returns:
+            bool: 是否持有租约；数据库出错无法确认时返回 None
+        """
+        with self.app.app_context():
+            try:
+                return self.lease.acquire()
+            except LeaseError:
+                return None
+
+    def step(self):
+        """获取或续约租约，按结果启动或停止调度器
+
+        Returns:
+            bool: 当前是否持有租约（数据库出错时按本地记录的到期时间判断）
+        """
+        held = self.renew()
+        if held is None:
+            logger.warning("续约调度租约时数据库出错，保持当前状态，稍后重试")
+            return self.lease.still_valid()
+
+        if held and self.scheduler is None:
+            logger.info(f"已获取调度租约（{self.lease.holder}），启动定时任务")
+            self.scheduler = self.services.start_scheduler(lease=self.lease, catch_up=True, job_lock=self._job_lock)
+        elif not held and self.scheduler is not None:
+            logger.warning("调度租约已被其他进程接管，停止定时任务")
+            self._shutdown_scheduler()
+        return held
+
+    def run(self):
+        """常驻运行，直到 stop() 被调用"""
+        with self.app.app_context():
+            db.create_all()
+            analyze_database()
+
+        logger.info(f"工作进程已启动（{self.lease.holder}），租约有效期 {self.lease.ttl} 秒")
+        while not self._stopping.is_set():
+            self.step()
+            self._stopping.wait(self.interval)
+
+        self._shutdown_scheduler()
+        self.drain()
+        with self.app.app_context():
+            self.lease.release()
+        logger.info("工作进程已退出")
+
+    def stop(self, *args):
+        """请求退出（可作为信号处理函数）"""
+        self._stopping.set()
+
+    def drain(self):
+        """等待正在执行的任务结束，期间继续续约，避免租约在任务执行中过期被其他副本接管
+
+        返回后任务锁保持占用，调度器停止前已提交但尚未开始的任务会直接跳过。
+        """
+        while not self._job_lock.acquire(timeout=self.interval):
+            logger.info("等待正在执行的每日任务结束...")
+            if self.renew() is False:
+                logger.warning("调度租约已被其他进程接管")
+
+    def _shutdown_scheduler(self):
+        if self.scheduler is not None:
+            # 不等待正在执行的任务（等待期间续约循环会停住），任务结束由 drain() 等待
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='定时任务工作进程')
+    parser.add_argument('--ttl', type=int, default=DEFAULT_TTL, help='租约有效期（秒）')
+    args = parser.parse_args()
+
+    worker = SchedulerWorker(create_app(), ttl=args.ttl)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()
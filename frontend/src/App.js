@@ -23,13 +23,38 @@ function App() {
 
   useEffect(() => {
     if (systemStatus?.is_initialized) {
-      loadDashboardData();
-      // 每30秒刷新一次数据
-      const interval = setInterval(loadDashboardData, 30000);
-      return () => clearInterval(interval);
+      if (!window.EventSource) {
+        // 不支持 SSE 的浏览器每30秒刷新一次数据
+        loadDashboardData();
+        const interval = setInterval(loadDashboardData, 30000);
+        return () => clearInterval(interval);
+      }
+
+      // 服务端推送：连接时收到完整数据，之后只收到变化的部分（断线后浏览器自动重连）
+      const source = new EventSource(`${API_BASE_URL}/stream/dashboard`);
+      source.addEventListener('snapshot', (event) => {
+        setDashboardData(JSON.parse(event.data));
+      });
+      source.addEventListener('delta', (event) => {
+        const delta = JSON.parse(event.data);
+        setDashboardData((prev) => (prev ? applyDashboardDelta(prev, delta) : prev));
+      });
+      return () => source.close();
     }
   }, [systemStatus]);
 
+  const applyDashboardDelta = (prev, delta) => {
+    const byId = new Map(prev.indices.map((item) => [item.index.id, item]));
+    delta.removed.forEach((id) => byId.delete(id));
+    delta.indices.forEach((item) => byId.set(item.index.id, item));
+    return {
+      ...prev,
+      stock_bond_ratio: 'stock_bond_ratio' in delta ? delta.stock_bond_ratio : prev.stock_bond_ratio,
+      indices: delta.order.map((id) => byId.get(id)).filter(Boolean),
+      update_time: delta.update_time
+    };
+  };
+
   const checkSystemStatus = async () => {
     try {
       const response = await axios.get(`${API_BASE_URL}/system/status`);
@@ -82,6 +82,7 @@ echo [SUCCESS] Environment ready
 echo ========================================
 echo.
 echo [INFO] Starting backend service (port 5000)...
+echo [INFO] Starting scheduler worker...
 echo [INFO] Starting frontend service (port 3000)...
 echo.
 echo Please visit: http://localhost:3000
@@ -93,6 +94,9 @@ echo.
 REM Start backend (background)
 start "Backend Service" cmd /k "venv\Scripts\activate.bat && python backend\app.py"
 
+REM Start scheduler worker (daily data update)
+start "Scheduler Worker" cmd /k "venv\Scripts\activate.bat && python backend\worker.py"
+
 REM Wait 2 seconds for backend to start
 timeout /t 2 /nobreak >nul
 